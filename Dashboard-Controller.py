@@ -1,37 +1,45 @@
-import os
-import matplotlib.pyplot as plt
+import json
+import numpy as np
+import pandas as pd
 import streamlit as st
-from utils.class_args import args_client, args_server
-import threading
+from utils.class_args import args_client, args_server, args_proxy
 import time
-import udp_server
+import argparse
 import udp_client
+import experiment
+import sweep
+import coordinator
+from utils import trace
+from utils.downsample import downsample
+from utils import figure_export
+from utils import metrics
+from utils.impairment import DISTRIBUTIONS
+from utils.control import parse_agents
+
+# Live chart name -> {line label: results_log series}
+CHART_SERIES = {
+    "Throughput": {"Throughput (Mbps)": "Throughput"},
+    "Jitter": {"Jitter Client (ms)": "Jitter Client", "Jitter Server (ms)": "Jitter Server"},
+    "OWD": {"OWD Client (ms)": "OWD Client", "OWD Server (ms)": "OWD Server"},
+    "Tail Latency": {"Tail Latency Client (ms)": "Tail Latency Client",
+                     "Tail Latency Server (ms)": "Tail Latency Server"},
+    "Loss": {"Loss Client2Server (%)": "Loss % Client", "Loss Server2Client (%)": "Loss % Server"},
+    # Replies lost next to those the client's own socket dropped: the rest is network loss
+    "Drops": {"Lost Server2Client (packets)": "Lost Server2Client",
+              "Kernel Drops at Client (packets)": "Kernel Drops Client"},
+    "Reorder": {"Reordered Client2Server (packets)": "Reorder Client",
+                "Reordered Server2Client (packets)": "Reorder Server"},
+    "Stack Delay": {"Receive, userspace - kernel (ms)": "Stack Delay RX",
+                    "Send, kernel - userspace (ms)": "Stack Delay TX"},
+}
 
 
 class DashboardController:
     def __init__(self):
         st.set_page_config(page_title="UDP Dashboard Controller", layout="wide")
-        self.results_log = {
-            "Throughput": [],
-            "Jitter Client": [],
-            "Jitter Server": [],
-            "Tail Latency Client": [],
-            "Tail Latency Server": [],
-            "OWD Client": [],
-            "OWD Server": [],
-            "Time": []
-        }
-
-        self.results_log = {
-            "Throughput": [],
-            "Jitter Client": [],
-            "Jitter Server": [],
-            "Tail Latency Client": [],
-            "Tail Latency Server": [],
-            "OWD Client": [],
-            "OWD Server": [],
-            "Time": []
-        }
+        # Latest snapshot of the experiment's results_log, {series: NumPy array}
+        self.results_log = self.empty_results()
+        self.ring = None  # Shared metrics ring of the experiment being followed
 
         self.server_ip = None
         self.server_port = None
@@ -40,10 +48,32 @@ class DashboardController:
         self.packet_size_client = None
         self.experiment_duration = None
         self.experiment_interval_client = None
+        self.window_client = None
+        self.bitrate_client = None
+        self.engine = None
+        self.streams_client = None
+        self.reply_mode = None
+        self.trace_path = None
+        self.metrics_address = None
+        self.timestamps = None
+        self.socket_buffer = None
+        self.chart_refresh = None
+        self.chart_points = None
+        self.figure_format = None
+        self.figure_dpi = None
         self.run_experiment = False
+        self.stop_experiment = False
+        self.replay_trace = False
+        self.sweep_options = None
+        self.run_sweep = False
+        self.use_proxy = False
+        self.proxy_options = None
+        self.distributed_options = None
+        self.run_distributed = False
 
         self.init_page()
         self.chart_placeholders = self.create_chart_placeholders()
+        self.reset_charts()
 
     def init_page(self):
         st.title("🌐 UDP Dashboard Controller")
@@ -61,8 +91,62 @@ class DashboardController:
             self.packet_size_client = st.slider("Client Packet Size (Bytes)", 1024, 65507, 1024)
             self.experiment_duration = st.slider("Experiment Duration (s)", 5, 120, 10)
             self.experiment_interval_client = st.slider("Client Update Interval (s)", 1, 10, 1)
+            self.window_client = st.slider("Client Window (packets in flight)", 1, 1024, 1)
+            self.bitrate_client = st.number_input("Target Bitrate (Mbit/s, 0 = unpaced)", 0.0, 100000.0, 0.0)
+            self.engine = st.selectbox("Engine", ["asyncio", "threads"])
+            self.streams_client = st.slider("Parallel Client Streams", 1, 16, 1)
+            self.reply_mode = st.selectbox("Server Reply Mode", ["full", "ack", "echo", "download"])
+            self.trace_path = st.text_input("Packet Trace File (empty = no trace)", "")
+            self.socket_buffer = st.text_input("Socket Buffers (e.g. 4M, empty = kernel default)", "")
+            self.timestamps = st.selectbox("Packet Timestamps (kernel: Linux, one syscall per datagram)",
+                                           ["user", "kernel"])
+            self.metrics_address = st.text_input("Metrics Endpoint [host:]port (empty = no phase timers)", "")
+            self.chart_refresh = st.slider("Chart Refresh (s)", 0.25, 2.0, 1.0, step=0.25)
+            self.chart_points = st.slider("Chart Point Budget (per series)", 200, 5000, 1000, step=100)
+            self.figure_format = st.selectbox("Figure Format", list(figure_export.FORMATS))
+            self.figure_dpi = st.select_slider("Figure DPI (preview 72, print 300)", [72, 150, 300], 300)
+
+            st.markdown("#### Impairment Proxy")
+            self.use_proxy = st.checkbox("Run Through Impairment Proxy (udp_proxy.py)")
+            self.proxy_options = {
+                "p": st.text_input("Proxy Port (the client connects here)", "8081"),
+                "delay": st.number_input("Delay per Direction (ms)", 0.0, 10000.0, 0.0),
+                "jitter": st.number_input("Delay Jitter (ms)", 0.0, 10000.0, 0.0),
+                "dist": st.selectbox("Delay Distribution", list(DISTRIBUTIONS), 1),
+                "loss": st.number_input("Random Loss (%)", 0.0, 100.0, 0.0),
+                "burst": st.text_input("Burst Loss P,R[,LOSS_BAD[,LOSS_GOOD]] (%, empty = none)", ""),
+                "reorder": st.number_input("Reorder (%)", 0.0, 100.0, 0.0),
+                "duplicate": st.number_input("Duplicate (%)", 0.0, 100.0, 0.0),
+                "rate": st.text_input("Bandwidth Cap (e.g. 100M, empty = none)", ""),
+                "queue": st.number_input("Queue Behind the Cap (packets)", 1, 100000, 1000),
+            }
 
             self.run_experiment = st.button("Run Experiment 🔷")
+            self.stop_experiment = st.button("Stop Experiment ⏹")
+            self.replay_trace = st.button("Replay Trace File 🔁")
+
+            st.markdown("#### Parameter Sweep")
+            self.sweep_options = {
+                "l": st.text_input("Sweep Packet Sizes (Bytes, mtu = around each fragmentation boundary)",
+                                   "64,512,1400,8192,65507"),
+                "b": st.text_input("Sweep Bitrates (unpaced = no pacing)", "unpaced,100M,500M"),
+                "w": st.text_input("Sweep Windows (packets in flight)", "1,8"),
+                "t": st.text_input("Sweep Durations (s)", "5"),
+                "P": st.text_input("Sweep Parallel Streams", "1"),
+                "warmup": st.number_input("Warm-up per Point (s)", 0.0, 60.0, 1.0),
+                "cooldown": st.number_input("Cool-down between Points (s)", 0.0, 60.0, 1.0),
+                "out": st.text_input("Sweep Results File (resumed if it exists)", "sweeps/sweep.json"),
+            }
+            self.run_sweep = st.button("Run Sweep 🔶")
+
+            st.markdown("#### Distributed Experiment")
+            self.distributed_options = {
+                "agents": st.text_input("Client Agents host[:port], comma separated (agent.py on each node)",
+                                        "127.0.0.1"),
+                "server": st.text_input("Server Agent (empty = the server at Server IP/Port is running)", ""),
+                "lead": st.number_input("Synchronized Start Lead (s)", 0.5, 60.0, coordinator.START_LEAD),
+            }
+            self.run_distributed = st.button("Run Distributed Experiment 🛰")
 
         with col2:
             st.header("Live Metrics 📈")
@@ -74,168 +158,327 @@ class DashboardController:
             jitter_chart = st.empty()
             owd_chart = st.empty()
             tail_latency_chart = st.empty()
+            loss_chart = st.empty()
+            drops_chart = st.empty()
+            reorder_chart = st.empty()
+            stack_delay_chart = st.empty()
+            phase_chart = st.empty()
         return {
             "Throughput": throughput_chart,
             "Jitter": jitter_chart,
             "OWD": owd_chart,
             "Tail Latency": tail_latency_chart,
+            "Loss": loss_chart,
+            "Drops": drops_chart,
+            "Reorder": reorder_chart,
+            "Stack Delay": stack_delay_chart,
+            "Phases": phase_chart,
         }
 
     def start_experiment(self):
-        """ Start experiments by running the website, client and server programs simultaneously using threads.
-            Effective for tasks that require multitasking such as the Server that listens for requests...
-            and the client that communicates with the server.
-            Additionally with the use of a looped web-based program such as streamlit.
+        """ Start experiments by launching the server and client programs in their own process
+            (see experiment.py), away from the streamlit script and its rendering...
+            and follow their metrics through shared memory until the run ends.
         """
+        self.configure_args()
+        try:
+            experiment.launch(args_server, args_client, self.engine, args_proxy if self.use_proxy else None)
+        except RuntimeError as err:
+            with self.col2:
+                st.error(str(err))
+            return
+        self.follow_experiment(experiment.wait_until_running())
+
+    def follow_experiment(self, state):
+        """Chart a running experiment, launched from here or before the page was (re)opened."""
         self.reset_log_results()
-
-        # Start server and client as threads
-        server_thread = threading.Thread(target=self.start_server, daemon=True)
-        client_thread = threading.Thread(target=self.start_client, daemon=True)
-        server_thread.start()
-        time.sleep(1)  # Time for the server to initiate
-        client_thread.start()
-
-        for _ in range(self.experiment_duration):
+        self.ring = experiment.attach(state)
+        if self.ring is None:
+            with self.col2:
+                st.error(f"Experiment {state['status'] if state else 'missing'}, see {experiment.LOG_FILE}")
+            return
+        self.streams_client = state.get("streams", 1)
+        self.timestamps = state.get("timestamps", "user")
+        with self.col2:
+            status_text = st.empty()
+
+        try:
+            while True:
+                state = experiment.status()
+                self.update_charts()
+                if state is None or state["status"] != "running":
+                    break
+                status_text.info(f"Experiment running (pid {state['pid']}): " \
+                                 f"{time.time() - state['started']:.0f} of {state['duration']} s")
+                self.show_phases(state)
+                time.sleep(self.chart_refresh)
             self.update_charts()
-            time.sleep(1)
-
+            self.show_phases(state)
+            self.results_log = self.ring.latest()
+        finally:
+            self.ring.close()
+            self.ring = None
+        status_text.info(f"Experiment {state['status'] if state else 'ended'}")
+        experiment.stop() # Release the finished experiment's metrics
+
+        self.show_send_rate()
         self.save_charts()
 
-        self.reset_log_results()
+    def show_phases(self, state):
+        """Share of the packet loop time spent in each phase, scraped from the
+        experiment's metrics endpoint when it was started with one."""
+        if state is None or not state.get("metrics"):
+            return
+        breakdown = metrics.phase_breakdown(metrics.scrape(state["metrics"]))
+        if not breakdown:
+            return
+        frame = pd.DataFrame(breakdown).fillna(0.0)
+        self.chart_placeholders["Phases"].bar_chart(100 * frame / frame.sum(), use_container_width=True)
+
+    def show_send_rate(self):
+        """Report the achieved send rate next to the requested one for paced runs."""
+        if not self.bitrate_client or not len(self.results_log["Send Rate"]):
+            return
+        achieved = self.results_log["Send Rate"][-1]
+        with self.col2:
+            st.metric("Achieved Send Rate (Mbit/s)", f"{achieved:.3f}",
+                      delta=f"{achieved - self.bitrate_client:.3f} vs requested {self.bitrate_client:.3f}")
 
     def save_charts(self):
-        os.makedirs("figures", exist_ok=True)
-        time_axis = self.results_log["Time"]
-
-        # Nested Function to store the plots individually...
-        def plot_and_save_chart(data, labels, filename, xlabel, ylabel, title):
-            plt.figure(figsize=(10, 6))
-            for series, label, color in zip(data, labels, ["lightblue", "lightcoral"]):
-                plt.plot(time_axis, series, label=label, color=color)
-            plt.xlabel(xlabel)
-            plt.ylabel(ylabel)
-            plt.legend()
-            plt.title(title)
-            plt.grid(alpha=0.5)
-            plt.tight_layout()
-            plt.savefig(f"figures/{filename}.jpg", format="jpg", dpi=300)
-            plt.close()
-
-        # Throughput chart
-        if self.results_log["Throughput"]:
-            plot_and_save_chart(
-                [self.results_log["Throughput"]],
-                ["Throughput (Mbps)"],
-                "throughput_chart",
-                "Time (s)",
-                "Throughput (Mbps)",
-                "Throughput Over Time"
-            )
-
-        # Jitter chart
-        if self.results_log["Jitter Client"] and self.results_log["Jitter Server"]:
-            plot_and_save_chart(
-                [self.results_log["Jitter Client"], self.results_log["Jitter Server"]],
-                ["Jitter Client (ms)", "Jitter Server (ms)"],
-                "jitter_chart",
-                "Time (s)",
-                "Jitter (ms)",
-                "Jitter Over Time"
-            )
-
-        # OWD chart
-        if self.results_log["OWD Client"] and self.results_log["OWD Server"]:
-            plot_and_save_chart(
-                [self.results_log["OWD Client"], self.results_log["OWD Server"]],
-                ["OWD Client (ms)", "OWD Server (ms)"],
-                "owd_chart",
-                "Time (s)",
-                "OWD (ms)",
-                "One-Way Delay Over Time"
-            )
-
-        # Tail Latency chart
-        if self.results_log["Tail Latency Client"] and self.results_log["Tail Latency Server"]:
-            plot_and_save_chart(
-                [self.results_log["Tail Latency Client"], self.results_log["Tail Latency Server"]],
-                ["Tail Latency Client (ms)", "Tail Latency Server (ms)"],
-                "tail_latency_chart",
-                "Time (s)",
-                "Tail Latency (ms)",
-                "Tail Latency Over Time"
-            )
+        """Export the run's figures into their own directory from a background worker pool."""
+        directory, futures = figure_export.export_run(self.results_log, self.figure_format, self.figure_dpi)
+        if futures:
+            with self.col2:
+                st.caption(f"Exporting {len(futures)} figures to {directory}/ in the background")
+
+    def chart_series(self):
+        series = dict(CHART_SERIES)
+        if self.timestamps != "kernel":
+            del series["Stack Delay"] # Only measured with kernel timestamps
+        if (self.streams_client or 1) > 1:
+            # One line per stream next to the total throughput in parallel runs
+            series["Throughput"] = dict(series["Throughput"], **{
+                f"Stream {stream} (Mbps)": f"Throughput Stream {stream}"
+                for stream in range(1, self.streams_client + 1)})
+        return series
+
+    def chart_frame(self, rows, series, budget=None):
+        """DataFrame of `series` indexed by time, LTTB-downsampled to `budget` points per line."""
+        time_axis = rows["Time"]
+        # Series not logged yet stay blank so every frame of a chart has the same columns
+        columns = {label: rows[key] if key in rows else np.full(len(time_axis), np.nan)
+                   for label, key in series.items()}
+        if budget is not None:
+            time_axis, columns = downsample(time_axis, columns, budget)
+        return pd.DataFrame(columns, index=pd.Index(time_axis, name="Time (s)"))
+
+    def reset_charts(self):
+        self.charts = {}  # Chart name -> line_chart element receiving add_rows
+        self.chart_sizes = {}  # Chart name -> points currently displayed
+        self.chart_limits = {}  # Chart name -> size at which it is redrawn downsampled
+        self.rows_charted = 0  # results_log rows already pushed to the charts
 
     def update_charts(self):
-        """Update charts with the latest data"""
-        results = udp_client.results_log
-
-        if results["Time"]:
-            time_axis = results["Time"]
-
-            # Update persistent log
-            for key in self.results_log.keys():
-                self.results_log[key] = results[key]
-
-            # Update throughput chart
-            if len(results["Throughput"]) == len(time_axis):
-                self.chart_placeholders["Throughput"].line_chart(
-                    {"Throughput (Mbps)": self.results_log["Throughput"]}, use_container_width=True
-                )
-
-            # Update jitter chart
-            if len(results["Jitter Client"]) == len(time_axis) and len(results["Jitter Server"]) == len(time_axis):
-                self.chart_placeholders["Jitter"].line_chart({
-                    "Jitter Client (ms)": self.results_log["Jitter Client"],
-                    "Jitter Server (ms)": self.results_log["Jitter Server"]
-                }, use_container_width=True)
-
-            # Update OWD chart
-            if len(results["OWD Client"]) == len(time_axis) and len(results["OWD Server"]) == len(time_axis):
-                self.chart_placeholders["OWD"].line_chart({
-                    "OWD Client (ms)": self.results_log["OWD Client"],
-                    "OWD Server (ms)": self.results_log["OWD Server"]
-                }, use_container_width=True)
-
-            # Update tail latency chart
-            if len(results["Tail Latency Client"]) == len(time_axis) and len(results["Tail Latency Server"]) == len(time_axis):
-                self.chart_placeholders["Tail Latency"].line_chart({
-                    "Tail Latency Client (ms)": self.results_log["Tail Latency Client"],
-                    "Tail Latency Server (ms)": self.results_log["Tail Latency Server"]
-                }, use_container_width=True)
+        """Push the rows logged since the last update to the charts.
+
+        Only new rows go over the websocket (add_rows). A chart is redrawn from
+        the whole history, LTTB-downsampled to the point budget, when it is
+        first drawn and again once `budget` more points were added, so the
+        points displayed and the payload per refresh stay bounded on long runs.
+        """
+        ring = self.ring
+        if ring is None or ring.count == self.rows_charted:
+            return
+        if self.rows_charted and ring.count - self.rows_charted >= ring.capacity - 1:
+            self.reset_charts() # Fell a whole ring behind, start over from what is retained
+        budget = self.chart_points or 1000
+        new_rows, rows_charted = ring.since(self.rows_charted)
+        history = None
+
+        for name, series in self.chart_series().items():
+            element = self.charts.get(name)
+            added = len(new_rows["Time"])
+            if element is None or self.chart_sizes[name] + added > self.chart_limits[name]:
+                if history is None:
+                    # Whole history up to the same row as new_rows, dropping rows logged since
+                    history, history_end = ring.since(0)
+                    if history_end > rows_charted:
+                        history = {key: values[:rows_charted - history_end] for key, values in history.items()}
+                frame = self.chart_frame(history, series, budget)
+                self.charts[name] = self.chart_placeholders[name].line_chart(frame, use_container_width=True)
+                self.chart_sizes[name] = len(frame)
+                self.chart_limits[name] = len(frame) + budget
+            else:
+                element.add_rows(self.chart_frame(new_rows, series))
+                self.chart_sizes[name] += added
+        self.rows_charted = rows_charted
+
+    def empty_results(self):
+        return {key: np.zeros(0) for key in udp_client.RESULT_SERIES}
 
     def reset_log_results(self):
-        """Reset Log Results both for Dashboad and UDP-Client Logs."""
-        self.results_log = {
-            "Throughput": [],
-            "Jitter Client": [],
-            "Jitter Server": [],
-            "Tail Latency Client": [],
-            "Tail Latency Server": [],
-            "OWD Client": [],
-            "OWD Server": [],
-            "Time": []
-        }
-        udp_client.results_log = self.results_log  # Reset client log results
+        """Reset the Dashboard's Log Results and live charts."""
+        self.results_log = self.empty_results()
+        self.reset_charts()
+
+    def start_sweep(self):
+        """Run the sweep grid in its own process (see sweep.py) and follow its progress."""
+        options = dict(self.sweep_options, a=self.server_ip, p=self.server_port,
+                       i=self.experiment_interval_client)
+        process = sweep.launch(options)
+        requested = sweep.parse_grid(argparse.Namespace(**options))
+        with self.col2:
+            progress = st.progress(0.0, text="Sweep starting...")
+        while True:
+            running = process.poll() is None
+            results = sweep.load_results(options["out"])
+            # "mtu" packet sizes are only known once the sweep has discovered the path MTU
+            points = sweep.grid_points(sweep.resolve_grid(requested, results))
+            done = len({sweep.point_id(point) for point in points} & set(results["points"]))
+            progress.progress(min(done / len(points), 1.0),
+                              text=f"Sweep{'' if running else ' finished'}: {done} of {len(points)} points")
+            if not running:
+                break
+            time.sleep(1)
 
-    def start_server(self):
+    def start_distributed(self):
+        """Run the client settings on every agent at once against one server (see
+        coordinator.py), charting the clients' summed throughput as it comes in."""
+        self.configure_args()
+        args_client.a, args_client.p = self.server_ip, self.server_port # Remote clients go straight to the server
+        options = self.distributed_options
+        try:
+            agents = parse_agents(options["agents"])
+            server_agents = parse_agents(options["server"])[:1]
+            distributed = coordinator.Coordinator(agents + server_agents)
+        except (ValueError, RuntimeError) as err:
+            with self.col2:
+                st.error(str(err))
+            return
+        with self.col2:
+            status_text = st.empty()
+
+        def show_progress(distributed):
+            status_text.info(f"Distributed experiment: {len(distributed.active())} of {len(agents)} clients running")
+            rows = distributed.intervals()
+            if rows:
+                frame = pd.DataFrame(rows).set_index("Time")
+                columns = [column for column in frame if column.startswith("Throughput")]
+                self.chart_placeholders["Throughput"].line_chart(frame[columns], use_container_width=True)
+
+        try:
+            distributed.synchronize()
+            server = (server_agents[0], coordinator.role_argv(args_server, coordinator.SERVER_OPTIONS)) \
+                if server_agents else None
+            distributed.start([(agent, coordinator.role_argv(args_client, coordinator.CLIENT_OPTIONS))
+                               for agent in agents], server, options["lead"])
+            distributed.wait(show_progress)
+        except RuntimeError as err:
+            with self.col2:
+                st.error(str(err))
+        finally:
+            view = distributed.aggregate()
+            distributed.close()
+        show_progress(distributed)
+        status_text.info(f"Distributed experiment {view['experiment']}: "
+                         f"{view['totals']['Completed']} of {view['totals']['Clients']} clients completed")
+        with self.col2:
+            with st.expander("Distributed Results 🛰", expanded=True):
+                st.metric("Total Throughput (MBps)", f"{view['totals']['Throughput']:.3f}")
+                if view["totals"]["Start Spread (ms)"] is not None:
+                    st.caption(f"Clients started within {view['totals']['Start Spread (ms)']:.3f} ms of each other")
+                st.dataframe(pd.DataFrame(view["nodes"]).set_index("Node"), use_container_width=True)
+                st.download_button("Download JSON", json.dumps(view, indent=1),
+                                   file_name=f"distributed-{view['experiment']}.json")
+
+    def show_sweep(self):
+        """Heatmaps of the sweep results file over any two swept parameters."""
+        results = sweep.load_results(self.sweep_options["out"])
+        if not sweep.grid_entries(results):
+            return
+        frame = pd.DataFrame(sweep.results_matrix(results)).fillna({"b": "unpaced"})
+        params = [param for param in sweep.SWEEP_PARAMS if frame[param].nunique() > 1] or list(sweep.SWEEP_PARAMS)
+        with self.col2:
+            with st.expander("Sweep Results 🗺", expanded=True):
+                metric = st.selectbox("Metric", list(sweep.SWEEP_METRICS) +
+                                      [metric for metric in sweep.SIZE_METRICS if metric in frame])
+                columns = st.selectbox("Columns", params)
+                rows = st.selectbox("Rows", [param for param in sweep.SWEEP_PARAMS if param != columns])
+                heatmap = frame.pivot_table(index=rows, columns=columns, values=metric, aggfunc="mean")
+                st.dataframe(heatmap.style.background_gradient(cmap="viridis").format("{:.3f}"),
+                             use_container_width=True)
+                st.download_button("Download CSV", frame.to_csv(index=False), file_name="sweep.csv")
+                st.download_button("Download JSON", json.dumps(results, indent=1), file_name="sweep.json")
+
+    def replay(self):
+        """Chart a recorded packet trace instead of running an experiment."""
+        try:
+            records = trace.read_trace(self.trace_path)
+        except (OSError, ValueError) as err:
+            with self.col2:
+                st.error(f"Cannot replay trace: {err}")
+            return
+        series = trace.summarize_trace(records, self.experiment_interval_client)
+        with self.col2:
+            st.metric("Packets in Trace", f"{len(records)}")
+        if not len(series["Time"]):
+            return
+
+        self.chart_placeholders["Throughput"].line_chart({
+            "Throughput (MBps)": series["Throughput"]
+        }, use_container_width=True)
+        self.chart_placeholders["OWD"].line_chart({
+            "OWD Client (ms)": series["OWD Client"],
+            "OWD Server (ms)": series["OWD Server"],
+            "RTT (ms)": series["RTT"]
+        }, use_container_width=True)
+        self.chart_placeholders["Loss"].line_chart({
+            "Expired Packets (%)": series["Loss %"]
+        }, use_container_width=True)
+
+    def configure_args(self):
         args_server.a = self.server_ip
         args_server.p = self.server_port
-        udp_server.server_main(args_server)
-
-    def start_client(self):
         args_client.a = self.client_ip
         args_client.p = self.client_port
         args_client.i = self.experiment_interval_client
         args_client.l = self.packet_size_client
         args_client.t = self.experiment_duration
-        udp_client.client_main(args_client)
+        args_client.w = self.window_client
+        args_client.b = f"{self.bitrate_client}M" if self.bitrate_client else None
+        args_client.P = self.streams_client
+        args_client.m = self.reply_mode
+        args_client.trace = self.trace_path or None
+        args_client.metrics = args_server.metrics = self.metrics_address or None
+        args_client.timestamps = args_server.timestamps = self.timestamps
+        for args in (args_client, args_server):
+            args.rcvbuf = args.sndbuf = self.socket_buffer or None
+        if self.use_proxy:
+            # The client goes through the proxy, which relays to the server
+            for key, value in self.proxy_options.items():
+                setattr(args_proxy, key, (value or None) if key in ("burst", "rate") else value)
+            args_proxy.a, args_proxy.sa, args_proxy.sp = self.client_ip, self.server_ip, self.server_port
+            args_client.p = args_proxy.p
 
 
 def main():
     dashboard = DashboardController()
     if dashboard.run_experiment: # If Begin Experiment Clicked...
         dashboard.start_experiment()
+    elif dashboard.stop_experiment:
+        experiment.stop()
+    elif dashboard.replay_trace and dashboard.trace_path:
+        dashboard.replay()
+    elif dashboard.run_sweep:
+        dashboard.start_sweep()
+    elif dashboard.run_distributed:
+        dashboard.start_distributed()
+    else:
+        # Pick up an experiment that is still running, e.g. after reopening the page
+        state = experiment.status()
+        if state is not None and state["status"] == "running":
+            dashboard.follow_experiment(state)
+    dashboard.show_sweep()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import socketserver
+
+import time # Timer package
+
+from utils.control import DEFAULT_PORT, send_message, read_message
+from utils.error_handling import kill_with_error
+
+GREEN = "\033[0;32m"
+WHITE = "\033[0;37m"
+
+# Node agent of distributed experiments (see coordinator.py). It listens for
+# a coordinator on TCP and runs what it is told as `python headless.py ROLE
+# ARGS --start-at T` subprocesses: the role imports and parses its options
+# right away, then waits for the synchronized start time. Each run's NDJSON
+# lines are kept in memory until the coordinator collects them. The agent
+# executes nothing but the headless roles, yet it has no authentication:
+# bind it to a trusted control network.
+
+ROLES = ("server", "client", "sweep")
+HEADLESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py")
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents")
+STOP_TIMEOUT = 10.0  # Seconds a stopped run has to write its summary before it is killed
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--a', type=str, default="127.0.0.1",
+        help="IP address the agent listens on for the coordinator")
+    parser.add_argument('--p', type=int, default=DEFAULT_PORT,
+        help="Port the agent listens on for the coordinator")
+    parser.add_argument('--name', type=str, default=platform.node(),
+        help="Name of this node in the aggregated results")
+    return parser.parse_args(argv)
+
+
+class Run:
+    """One headless.py subprocess and the NDJSON lines it has written."""
+
+    def __init__(self, run_id, role, role_args, start_at=None):
+        self.id = run_id
+        self.role = role
+        self.lines = []  # Interval and point lines, in order
+        self.summary = None
+        self.lock = threading.Lock()
+        command = [sys.executable, HEADLESS, role] + [str(arg) for arg in role_args]
+        if start_at is not None:
+            command += ["--start-at", repr(float(start_at))]
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.log_path = os.path.join(LOG_DIR, f"{run_id}.log")
+        with open(self.log_path, "w") as log_file:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log_file,
+                                            cwd=os.path.dirname(HEADLESS), start_new_session=True)
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # Not NDJSON, e.g. a crash before the role started
+            with self.lock:
+                if record.get("type") == "summary":
+                    self.summary = record
+                else:
+                    self.lines.append(record)
+        self.process.wait()
+
+    def running(self):
+        # Finished once the summary, or the end of the output, has been read
+        return self.reader.is_alive()
+
+    def results(self, since=0):
+        with self.lock:
+            return {"id": self.id, "role": self.role, "running": self.running(),
+                    "lines": self.lines[since:], "next": len(self.lines),
+                    "summary": self.summary, "returncode": self.process.poll()}
+
+    def stop(self):
+        """SIGTERM, on which the run writes its summary (see headless.py)."""
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+    def kill(self, timeout=STOP_TIMEOUT):
+        self.stop()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Agent:
+    def __init__(self, name):
+        self.name = name
+        self.runs = {}  # Run id -> Run
+        self.lock = threading.Lock()
+
+    def handle(self, message):
+        cmd = message.get("cmd")
+        if cmd == "hello":
+            return {"name": self.name, "host": socket.gethostname(), "time": time.time(),
+                    "python": platform.python_version(), "runs": list(self.runs)}
+        if cmd == "run":
+            return self.start_run(message)
+        if cmd == "results":
+            return self.find_run(message["id"]).results(message.get("since", 0))
+        if cmd == "stop":
+            for run_id in message.get("ids") or list(self.runs):
+                self.find_run(run_id).stop()
+            return {}
+        raise ValueError(f"Unknown command '{cmd}'")
+
+    def start_run(self, message):
+        role = message.get("role")
+        if role not in ROLES:
+            raise ValueError(f"Unknown role '{role}'")
+        with self.lock:
+            if message["id"] in self.runs:
+                raise ValueError(f"Run {message['id']} exists already")
+            run = self.runs[message["id"]] = Run(message["id"], role, message.get("args", []),
+                                                 message.get("start_at"))
+        print(f"Run {run.id}: {role} {' '.join(map(str, message.get('args', [])))} (pid {run.process.pid})")
+        return {"pid": run.process.pid}
+
+    def find_run(self, run_id):
+        run = self.runs.get(run_id)
+        if run is None:
+            raise ValueError(f"Unknown run {run_id}")
+        return run
+
+    def close(self):
+        for run in self.runs.values():
+            run.kill()
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """One coordinator connection: requests are answered in order until it closes."""
+
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except ValueError:
+                send_message(self.wfile, {"ok": False, "error": "Invalid JSON"})
+                continue
+            except OSError:
+                return
+            if message is None:
+                return
+            try:
+                response = {"ok": True, **self.server.agent.handle(message)}
+            except (KeyError, ValueError, OSError) as err:
+                response = {"ok": False, "error": str(err)}
+            try:
+                send_message(self.wfile, response)
+            except OSError:
+                return
+
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, agent):
+        self.agent = agent
+        super().__init__(address, ControlHandler)
+
+
+def agent_main(args):
+    agent = Agent(args.name)
+    try:
+        server = ControlServer((args.a, args.p), agent)
+    except OSError as err:
+        kill_with_error("Failed to bind agent address", err.errno)
+    print(f"Agent {GREEN}{args.name}{WHITE} listening on {args.a}:{args.p}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        agent.close()
+
+
+if __name__ == "__main__":
+    agent_main(get_args())
@@ -0,0 +1,128 @@
+"""Compare packets/s on loopback with and without batched syscalls.
+
+    python benchmarks/batch_loopback.py --sizes 64 1400 65507 --t 3 --batch 64
+
+A sender process blasts datagrams at a receiver process for --t seconds per
+run; the table reports what each side managed per second. "plain" is one
+send/recv per datagram (the default client/server path), "mmsg" uses
+sendmmsg/recvmmsg and "gso" sends UDP GSO super-packets received with GRO.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import batch_io
+from utils.packet import PacketBuffer, MAX_PACKET_SIZE
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1400, 65507],
+        help="Packet sizes in bytes")
+    parser.add_argument('--t', type=float, default=2,
+        help="Duration of each run in seconds")
+    parser.add_argument('--batch', type=int, default=64,
+        help="Datagrams per syscall for the batched modes")
+    return parser.parse_args()
+
+
+def receiver(mode, port, size, batch, duration, ready, result):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind(("127.0.0.1", port))
+    sock.settimeout(0.2)
+    if mode == "mmsg":
+        batch_receiver = batch_io.BatchReceiver(sock, size, batch)
+    elif mode == "gso":
+        batch_io.enable_gro(sock)
+    buffer = bytearray(MAX_PACKET_SIZE)
+    ready.set()
+
+    packets = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            if mode == "mmsg":
+                packets += batch_receiver.recv()
+            elif mode == "gso":
+                lengths, _ = batch_io.recv_gro(sock, buffer)
+                packets += len(lengths)
+            else:
+                sock.recv_into(buffer)
+                packets += 1
+        except TimeoutError:
+            pass
+    result.value = packets / duration
+
+
+def sender(mode, port, size, batch, duration, result):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(("127.0.0.1", port))
+    packets = 0
+    if mode == "mmsg":
+        batch_sender = batch_io.BatchSender(sock, size, batch)
+        for i in range(batch):
+            batch_sender.pack(i, i, 0)
+    elif mode == "gso":
+        segments = min(batch, batch_io.UDP_MAX_SEGMENTS, 65000 // size)
+        buffer = memoryview(bytearray(b"X" * size * segments))
+    else:
+        buffer = PacketBuffer(size).pack(0, 0)
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            if mode == "mmsg":
+                packets += batch_sender.send(batch)
+            elif mode == "gso":
+                batch_io.send_gso(sock, buffer, size)
+                packets += segments
+            else:
+                sock.send(buffer)
+                packets += 1
+        except ConnectionRefusedError:
+            pass # ICMP from a receiver that already finished
+    result.value = packets / duration
+
+
+def run(mode, port, size, batch, duration):
+    ready, received, sent = mp.Event(), mp.Value('d', 0), mp.Value('d', 0)
+    rx = mp.Process(target=receiver, args=(mode, port, size, batch, duration + 0.5, ready, received))
+    rx.start()
+    ready.wait()
+    tx = mp.Process(target=sender, args=(mode, port, size, batch, duration, sent))
+    tx.start()
+    tx.join()
+    rx.join()
+    return sent.value, received.value
+
+
+def main(args):
+    if not batch_io.available():
+        print("sendmmsg/recvmmsg not available on this platform, only 'plain' can run")
+    modes = ["plain", "mmsg", "gso"] if batch_io.available() else ["plain"]
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if "gso" in modes and not batch_io.gso_supported(probe):
+        modes.remove("gso")
+    probe.close()
+
+    print(f"{'size':>6} {'mode':>6} {'sent pkt/s':>12} {'recv pkt/s':>12} {'recv MB/s':>10} {'speedup':>8}")
+    port = 9400
+    for size in args.sizes:
+        baseline = None
+        for mode in modes:
+            if mode == "gso" and size * 2 > 65000:
+                continue # A GSO super-packet must fit in 64 KB
+            port += 1
+            sent, received = run(mode, port, size, args.batch, args.t)
+            baseline = baseline or received
+            print(f"{size:>6} {mode:>6} {sent:>12.0f} {received:>12.0f} " \
+                  f"{received * size / 1024 ** 2:>10.1f} {received / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(get_args())
@@ -0,0 +1,248 @@
+"""Loopback and micro-benchmarks of the client and server hot paths.
+
+    python benchmarks/suite.py --json results.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+
+"loopback" cases run a real server process and client flow on 127.0.0.1 for
+--t seconds per reply mode and window and report packets/s, bytes/s, the
+CPU time each side spent per packet and the net memory blocks the client
+kept per packet. "micro" cases time the per-packet building blocks (header
+pack/parse, jitter, latency histogram, sequence tracking, results log) and
+the bytes they allocate per call. "startup" cases time a fresh interpreter
+importing each entry point, as the headless runner and every sweep point
+pay it. With --baseline every metric is printed next to its stored value
+and changes beyond --tolerance in the wrong direction are flagged; --check
+turns flagged regressions into exit code 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import udp_client
+import udp_server
+from utils.packet import PacketBuffer, parse_header, MAX_PACKET_SIZE
+from utils.stream_stats import JitterEstimator, LatencyHistogram
+from utils.seq_tracker import SequenceTracker
+from utils.results_ring import ResultsRing
+
+# Metrics where a larger value is better, every other metric is a cost
+HIGHER_IS_BETTER = {"packets_per_s", "bytes_per_s"}
+# Changes smaller than this are noise however large in percent (net blocks hover around 0)
+ABSOLUTE_FLOOR = {"client_blocks_per_packet": 0.01}
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', type=str, default="all", choices=["all", "loopback", "micro", "startup"],
+        help="Which benchmarks to run")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[MAX_PACKET_SIZE],
+        help="Packet sizes in bytes for the loopback cases")
+    parser.add_argument('--modes', type=str, nargs='+', default=["full", "ack", "echo", "download"],
+        help="Server reply modes for the loopback cases")
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 8],
+        help="Client windows for the loopback cases")
+    parser.add_argument('--t', type=float, default=2,
+        help="Duration of each loopback case in seconds")
+    parser.add_argument('--json', type=str,
+        help="Write the results to this JSON file")
+    parser.add_argument('--baseline', type=str,
+        help="Compare against the results stored in this JSON file")
+    parser.add_argument('--save-baseline', type=str, dest='save_baseline',
+        help="Store the results as the new baseline in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=10.0,
+        help="Percent change in the wrong direction reported as a regression")
+    parser.add_argument('--check', action="store_true",
+        help="Exit with code 1 when a regression is found")
+    return parser.parse_args()
+
+
+def children_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def server_process(port):
+    sys.stdout = open(os.devnull, "w")
+    args = argparse.Namespace(a="127.0.0.1", p=str(port), i=3600, s=True, batch=1, workers=1,
+                              engine="blocking", idle=3600.0)
+    udp_server.serve(udp_server.create_server_socket(args.a, args.p), args)
+
+def run_loopback(port, size, mode, window, duration):
+    """One client flow against a fresh server process, returns its metrics."""
+    server = mp.get_context("fork").Process(target=server_process, args=(port,), daemon=True)
+    server_cpu = children_cpu_time()
+    server.start()
+    time.sleep(0.3) # Time for the server to bind
+
+    args = argparse.Namespace(a="127.0.0.1", p=str(port), i=3600, c=True, l=size, t=duration, w=window,
+                              b="1G" if mode == "download" else None, r=None, batch=1,
+                              engine="blocking", P=1, m=mode, trace=None)
+    udp_client.verbose = False
+    blocks = sys.getallocatedblocks()
+    client_cpu = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        udp_client.client_main(args)
+    client_cpu = time.process_time() - client_cpu
+    blocks = sys.getallocatedblocks() - blocks
+
+    server.terminate()
+    server.join()
+    server_cpu = children_cpu_time() - server_cpu
+    packets = max(udp_client.tracker_s2c.received, 1)
+    return {"packets_per_s": packets / duration,
+            "bytes_per_s": udp_client.total_bytes / duration,
+            "client_cpu_us_per_packet": client_cpu / packets * 1e6,
+            "server_cpu_us_per_packet": server_cpu / packets * 1e6,
+            "client_blocks_per_packet": blocks / packets}
+
+def loopback_suite(args):
+    results = {}
+    port = 9500
+    for size in args.sizes:
+        for mode in args.modes:
+            for window in args.windows:
+                if mode == "download" and window != args.windows[0]:
+                    continue # The server paces downloads, the window does not apply
+                port += 1
+                name = f"loopback/{mode}/size={size}/w={window}"
+                results[name] = run_loopback(port, size, mode, window, args.t)
+                print_result(name, results[name])
+    return results
+
+
+def measure(operation, number=100000):
+    """ns per call and bytes allocated per call (peak over one call) of operation()."""
+    operation() # Warm up caches and lazily created state
+    ns_per_op = min(timeit.repeat(operation, number=number, repeat=3)) / number * 1e9
+    tracemalloc.start()
+    allocated = []
+    for _ in range(100):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        operation()
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return {"ns_per_op": ns_per_op, "alloc_bytes_per_op": sorted(allocated)[len(allocated) // 2]}
+
+def micro_suite(args):
+    packet = PacketBuffer(MAX_PACKET_SIZE)
+    wire = bytes(packet.pack(1, 2, 3, 0, 4, 5, 6, 7))
+    jitter = JitterEstimator()
+    histogram = LatencyHistogram()
+    for value in range(0, 10 ** 8, 997):
+        histogram.record(value)
+    tracker = SequenceTracker()
+    sequence = iter(range(10 ** 9))
+    ring = ResultsRing(udp_client.RESULT_SERIES, capacity=4096)
+    sample = {key: 1.0 for key in udp_client.RESULT_SERIES}
+    now = time.time_ns
+
+    cases = {
+        "micro/packet_pack": lambda: packet.pack(1, now(), 0, 0),
+        "micro/packet_pack_ack": lambda: packet.pack(1, now(), 0, 1, size=0),
+        "micro/parse_header": lambda: parse_header(wire, len(wire)),
+        "micro/jitter_update": lambda: jitter.update(now() & 0xFFFFF),
+        "micro/histogram_record": lambda: histogram.record(now() & 0xFFFFFF),
+        "micro/histogram_p95": lambda: histogram.quantile(95),
+        "micro/seq_tracker_update": lambda: tracker.update(next(sequence)),
+        "micro/results_ring_append": lambda: ring.append(sample),
+    }
+    results = {}
+    for name, operation in cases.items():
+        results[name] = measure(operation, number=200 if "p95" in name else 100000)
+        print_result(name, results[name])
+    return results
+
+
+STARTUP_MODULES = ("udp_server", "udp_client", "sweep", "headless")
+
+def time_startup(code, runs=7):
+    """Fastest wall time (ms) of a fresh interpreter running `code`, cached bytecode."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+def startup_suite(args):
+    interpreter = time_startup("pass")
+    results = {"startup/python": {"wall_ms": interpreter}}
+    print_result("startup/python", results["startup/python"])
+    for module in STARTUP_MODULES:
+        name = f"startup/{module}"
+        wall = time_startup(f"import {module}")
+        results[name] = {"wall_ms": wall, "import_ms": wall - interpreter}
+        print_result(name, results[name])
+    return results
+
+
+def print_result(name, metrics, baseline=None, tolerance=10.0):
+    """Print one case, with the change against the baseline when there is one.
+    Returns the names of the regressed metrics."""
+    regressions = []
+    fields = []
+    for metric, value in metrics.items():
+        field = f"{metric}={value:.3f}" if abs(value) < 1000 else f"{metric}={value:.0f}"
+        stored = (baseline or {}).get(metric)
+        if stored:
+            change = 100 * (value - stored) / abs(stored)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if abs(value - stored) < ABSOLUTE_FLOOR.get(metric, 0):
+                worse = 0
+            field += f" ({change:+.1f}%{' REGRESSION' if worse > tolerance else ''})"
+            if worse > tolerance:
+                regressions.append(metric)
+        fields.append(field)
+    print(f"{name}: {' '.join(fields)}")
+    return regressions
+
+def compare(results, baseline, tolerance):
+    print(f"\nAgainst baseline ({baseline['meta'].get('python')} on {baseline['meta'].get('machine')}, " \
+          f"tolerance {tolerance:.0f}%):")
+    regressions = []
+    for name, metrics in results.items():
+        if name in baseline["results"]:
+            regressions += [f"{name} {metric}" for metric in
+                            print_result(name, metrics, baseline["results"][name], tolerance)]
+    return regressions
+
+def main(args):
+    results = {}
+    if args.suite in ("all", "micro"):
+        results.update(micro_suite(args))
+    if args.suite in ("all", "startup"):
+        results.update(startup_suite(args))
+    if args.suite in ("all", "loopback"):
+        results.update(loopback_suite(args))
+    report = {"meta": {"python": platform.python_version(), "machine": platform.machine(),
+                       "platform": platform.platform(), "time": time.time(), "duration": args.t},
+              "results": results}
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as report_file:
+                json.dump(report, report_file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        print(f"{len(regressions)} regression(s)" + (": " + ", ".join(regressions) if regressions else ""))
+        if regressions and args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(get_args())
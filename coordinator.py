@@ -0,0 +1,293 @@
+import os
+import json
+import time # Timer package
+import shlex
+import argparse
+import itertools
+
+from utils.control import AgentConnection, parse_agents, CONNECT_TIMEOUT
+from utils.error_handling import kill_with_error
+
+GREEN = "\033[0;32m"
+WHITE = "\033[0;37m"
+
+# Coordinator of distributed experiments: one server and clients on many
+# nodes, each node running agent.py. The coordinator estimates every agent's
+# clock offset, starts the server, then has every client start at the same
+# instant (START_LEAD ahead, converted to each agent's clock) so the load
+# adds up from the first interval. It polls the agents for their NDJSON lines
+# and aggregates them: one row per run, totals, and per-interval sums of the
+# clients' throughput and send rate next to each node's share.
+
+START_LEAD = 2.0  # Seconds between pushing the runs and the synchronized start
+SERVER_STARTUP = 1.0  # Time for the server to initiate before the clients start
+POLL_INTERVAL = 0.5  # Seconds between collections of the agents' results
+STOP_TIMEOUT = 15.0  # Seconds to wait for the summaries of stopped runs
+TOTAL_METRICS = ("Throughput", "Send Rate")  # Summed over the clients in every interval
+# udp_client/udp_server options passed on from an args object (utils.class_args)
+CLIENT_OPTIONS = ("a", "p", "i", "l", "t", "w", "b", "P", "m", "timestamps", "rcvbuf", "sndbuf", "mtu")
+SERVER_OPTIONS = ("a", "p", "workers", "timestamps", "rcvbuf", "sndbuf")
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(allow_abbrev=False,
+        description="Load one server from client agents on many nodes. Options not listed here are "
+                    "passed to every client, e.g. --t 10 --l 1400 -P 4")
+    parser.add_argument('--agents', type=str, required=True,
+        help="Client agents host[:port], comma separated, one client run each (repeat one for more)")
+    parser.add_argument('--server', type=str,
+        help="Agent that runs the server, none = the server at --a/--p is already running")
+    parser.add_argument('--server-args', type=str, default="", dest='server_args',
+        help="Extra server options, e.g. \"--workers 4\"")
+    parser.add_argument('--a', type=str, default="127.0.0.1",
+        help="Server address the clients send to, and the server binds")
+    parser.add_argument('--p', type=str, default="8080",
+        help="Server port")
+    parser.add_argument('--lead', type=float, default=START_LEAD,
+        help="Seconds between starting the runs and the synchronized client start")
+    parser.add_argument('--out', type=str,
+        help="Write the aggregated results to this JSON file")
+    return parser.parse_known_args(argv)
+
+def role_argv(args, names):
+    """Command line of the `names` options set on an args object."""
+    argv = []
+    for name in names:
+        value = getattr(args, name, None)
+        if value is None or value is False:
+            continue
+        argv.append(f"--{name}")
+        if value is not True:
+            argv.append(str(value))
+    return argv
+
+
+class Coordinator:
+    """One experiment across agents, and everything its runs report.
+
+    Raises RuntimeError (see utils.control.AgentConnection) when an agent
+    cannot be reached or refuses a run.
+    """
+
+    def __init__(self, agents, timeout=CONNECT_TIMEOUT):
+        self.connections = {}
+        try:
+            for spec in dict.fromkeys(agents):
+                self.connections[spec] = AgentConnection(spec, timeout)
+        except RuntimeError:
+            self.close()
+            raise
+        self.experiment_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.run_numbers = itertools.count(1)
+        self.runs = {}  # Run id -> {"agent", "role", "args", "lines", "next", "summary", "running"}
+        self.start_time = None  # Synchronized client start, coordinator clock
+
+    def synchronize(self):
+        """{agent: (clock offset, round trip)} in seconds, applied to every start time."""
+        return {spec: (connection.clock_offset(), connection.rtt)
+                for spec, connection in self.connections.items()}
+
+    def launch(self, agent, role, role_args, start_at=None):
+        connection = self.connections[agent]
+        run_id = f"{self.experiment_id}-{next(self.run_numbers)}"
+        connection.request("run", id=run_id, role=role, args=list(role_args),
+                           start_at=None if start_at is None else start_at + connection.offset)
+        self.runs[run_id] = {"agent": agent, "role": role, "args": list(role_args), "lines": [],
+                             "next": 0, "summary": None, "running": True}
+        return run_id
+
+    def start(self, clients, server=None, lead=START_LEAD):
+        """Start the server (agent, args) right away, then every (agent, args) of
+        `clients` at one instant `lead` seconds from now."""
+        if server is not None:
+            self.launch(server[0], "server", server[1])
+            time.sleep(SERVER_STARTUP)
+        self.start_time = time.time() + lead
+        for agent, role_args in clients:
+            self.launch(agent, "client", role_args, self.start_time)
+        return self.start_time
+
+    def poll(self):
+        """Collect the lines reported since the last poll."""
+        for run_id, run in self.runs.items():
+            if not run["running"]:
+                continue
+            response = self.connections[run["agent"]].request("results", id=run_id, since=run["next"])
+            run["lines"] += response["lines"]
+            run["next"] = response["next"]
+            run["summary"] = response["summary"]
+            run["running"] = response["running"]
+
+    def active(self, roles=("client", "sweep")):
+        return [run_id for run_id, run in self.runs.items() if run["running"] and run["role"] in roles]
+
+    def stop(self, roles=("server", "client", "sweep")):
+        """SIGTERM the runs of `roles` still running, they report a summary (see headless.py)."""
+        for agent, connection in self.connections.items():
+            ids = [run_id for run_id in self.active(roles) if self.runs[run_id]["agent"] == agent]
+            if ids:
+                connection.request("stop", ids=ids)
+
+    def wait(self, on_update=None, poll=POLL_INTERVAL):
+        """Collect results until every client has finished, then stop the server."""
+        try:
+            while True:
+                self.poll()
+                if on_update is not None:
+                    on_update(self)
+                if not self.active():
+                    break
+                time.sleep(poll)
+        finally:
+            self.stop() # The server, and the clients when interrupted
+            deadline = time.monotonic() + STOP_TIMEOUT
+            while self.active(("server", "client", "sweep")) and time.monotonic() < deadline:
+                time.sleep(poll)
+                self.poll()
+
+    def labels(self):
+        """Run id -> node label, the agent unless it runs several clients."""
+        clients = [run["agent"] for run in self.runs.values() if run["role"] == "client"]
+        numbers = {}
+        labels = {}
+        for run_id, run in self.runs.items():
+            label = run["agent"]
+            if run["role"] != "client":
+                label += f" ({run['role']})"
+            elif clients.count(run["agent"]) > 1:
+                numbers[run["agent"]] = numbers.get(run["agent"], 0) + 1
+                label += f" #{numbers[run['agent']]}"
+            labels[run_id] = label
+        return labels
+
+    def intervals(self):
+        """Per-interval sums of TOTAL_METRICS over the clients, with each node's share."""
+        labels = self.labels()
+        clients = [(labels[run_id], run["lines"]) for run_id, run in self.runs.items() if run["role"] == "client"]
+        rows = []
+        for index in range(max((len(lines) for _, lines in clients), default=0)):
+            samples = [(label, lines[index]) for label, lines in clients if index < len(lines)]
+            row = {"Interval": index + 1,
+                   "Time": sum(sample.get("Time", 0.0) for _, sample in samples) / len(samples),
+                   "Clients": len(samples)}
+            for metric in TOTAL_METRICS:
+                row[metric] = sum(sample.get(metric) or 0.0 for _, sample in samples)
+                row.update({f"{metric} {label}": sample.get(metric) for label, sample in samples})
+            rows.append(row)
+        return rows
+
+    def aggregate(self):
+        """One view of the experiment: agents, a row per run, totals and intervals."""
+        labels = self.labels()
+        nodes = [node_row(labels[run_id], run) for run_id, run in self.runs.items()]
+        clients = [node for node in nodes if node["Role"] == "client"]
+        summaries = [run["summary"] or {} for run in self.runs.values() if run["role"] == "client"]
+        sent = sum(summary.get("Packets Sent", 0) for summary in summaries)
+        lost_c2s = sum(summary.get("Lost Client2Server", 0) for summary in summaries)
+        replies = sum(summary.get("Replies", 0) for summary in summaries)
+        lost_s2c = sum(summary.get("Lost Server2Client", 0) for summary in summaries)
+        late = [node["Start Late (ms)"] for node in clients if node.get("Start Late (ms)") is not None]
+        totals = {"Clients": len(clients),
+                  "Completed": sum(node["Status"] == "completed" for node in clients),
+                  "Throughput": sum(node.get("Throughput") or 0.0 for node in clients),
+                  "Send Rate": sum(node.get("Send Rate") or 0.0 for node in clients),
+                  "Packets Sent": sent,
+                  "Replies": replies,
+                  "Loss % Client2Server": 100 * lost_c2s / sent if sent else 0.0,
+                  "Loss % Server2Client": 100 * lost_s2c / (replies + lost_s2c) if replies + lost_s2c else 0.0,
+                  "Worst p99 Client2Server (ms)": max((node.get("p99 Client2Server (ms)") or 0.0 for node in clients), default=0.0),
+                  "Worst p99 Server2Client (ms)": max((node.get("p99 Server2Client (ms)") or 0.0 for node in clients), default=0.0),
+                  "Start Spread (ms)": max(late) - min(late) if late else None}
+        return {"experiment": self.experiment_id, "start_time": self.start_time,
+                "agents": {spec: {"offset_ms": connection.offset * 1000,
+                                  "rtt_ms": None if connection.rtt is None else connection.rtt * 1000}
+                           for spec, connection in self.connections.items()},
+                "nodes": nodes, "totals": totals, "intervals": self.intervals(),
+                "runs": {run_id: dict(run, lines=len(run["lines"])) for run_id, run in self.runs.items()}}
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+
+
+def node_row(label, run):
+    """Summary row of one run: its status, mean interval throughput and headline metrics."""
+    summary = run["summary"] or {}
+    row = {"Node": label, "Role": run["role"], "Agent": run["agent"],
+           "Status": summary.get("status", "running" if run["running"] else "lost")}
+    if run["role"] == "server":
+        row.update(summary.get("Last Interval", {}))
+        return row
+    throughput = [line["Throughput"] for line in run["lines"] if line.get("Throughput") is not None]
+    latency_c2s = summary.get("Latency Client2Server", {})
+    latency_s2c = summary.get("Latency Server2Client", {})
+    row.update({"Throughput": sum(throughput) / len(throughput) if throughput else None,
+                "Send Rate": summary.get("Send Rate"),
+                "Streams": summary.get("Streams"),
+                "Packets Sent": summary.get("Packets Sent"),
+                "Replies": summary.get("Replies"),
+                "Loss % Client": summary.get("Loss % Client"),
+                "Loss % Server": summary.get("Loss % Server"),
+                "p99 Client2Server (ms)": latency_c2s.get("p99"),
+                "p99 Server2Client (ms)": latency_s2c.get("p99"),
+                "Start Late (ms)": summary.get("start_late_ms")})
+    return row
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
+
+def report_aggregate(view):
+    for node in view["nodes"]:
+        print(f"{GREEN}{node['Node']}{WHITE} - " +
+              " - ".join(f"{key}: {format_value(value)}" for key, value in node.items() if key not in ("Node", "Agent")))
+    print("Total - " + " - ".join(f"{key}: {GREEN}{format_value(value)}{WHITE}" for key, value in view["totals"].items()))
+
+
+def coordinator_main(args, client_args):
+    agents = parse_agents(args.agents)
+    server = None
+    if args.server:
+        server = (parse_agents(args.server)[0],
+                  ["--a", args.a, "--p", args.p] + shlex.split(args.server_args))
+    try:
+        coordinator = Coordinator(agents + ([server[0]] if server else []))
+    except RuntimeError as err:
+        kill_with_error(str(err))
+    reported = [0]
+
+    def report_intervals(coordinator):
+        # Intervals are printed once every running client has reported them
+        rows = coordinator.intervals()
+        complete = min((len(run["lines"]) for run in coordinator.runs.values()
+                        if run["role"] == "client" and run["running"]), default=len(rows))
+        for row in rows[reported[0]:complete]:
+            print(f"Interval {row['Interval']} - Clients: {row['Clients']} - " +
+                  " - ".join(f"{metric}: {GREEN}{row[metric]:.3f}{WHITE}" for metric in TOTAL_METRICS))
+        reported[0] = max(reported[0], complete)
+
+    try:
+        for spec, (offset, rtt) in coordinator.synchronize().items():
+            print(f"Agent {spec}: clock offset {offset * 1000:+.3f} ms (RTT {rtt * 1000:.3f} ms)")
+        start_time = coordinator.start([(agent, ["--a", args.a, "--p", args.p] + client_args) for agent in agents],
+                                       server, args.lead)
+        print(f"{len(agents)} client(s) start at {time.strftime('%H:%M:%S', time.localtime(start_time))}")
+        coordinator.wait(report_intervals)
+    except RuntimeError as err:
+        kill_with_error(str(err))
+    except KeyboardInterrupt:
+        pass # The runs were stopped and their summaries collected
+    finally:
+        view = coordinator.aggregate()
+        coordinator.close()
+    report_aggregate(view)
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(view, out_file, indent=1)
+        print(f"Aggregated results saved to {args.out}")
+    return view
+
+
+if __name__ == "__main__":
+    coordinator_main(*get_args())
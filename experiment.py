@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time # Timer package
+import signal
+import argparse
+import threading
+import subprocess
+import multiprocessing
+
+from utils.results_ring import ResultsRing, capacity_for
+
+# Experiments run in their own process, started by launch() and controlled
+# through a state file, so the UDP loops never share a GIL with the
+# dashboard. The interval samples go to a ResultsRing in shared memory that
+# any process can attach() to while the experiment runs, e.g. a dashboard
+# reopened in the middle of a run. With an impairment proxy the client talks
+# to udp_proxy.py, forked before the engines start, instead of the server.
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiments")
+STATE_FILE = os.path.join(STATE_DIR, "current.json")
+CONFIG_FILE = os.path.join(STATE_DIR, "config.json")
+LOG_FILE = os.path.join(STATE_DIR, "experiment.log")
+LINGER = 30.0  # Seconds a finished experiment keeps its metrics for readers unless stopped
+SERVER_STARTUP = 1.0  # Time for the server to initiate before the client starts
+STARTUP_TIMEOUT = 30.0  # An experiment still starting after this long has failed
+
+
+def args_to_dict(args):
+    """Plain attributes of an args object (argparse.Namespace or utils.class_args class)."""
+    return {key: getattr(args, key) for key in dir(args)
+            if not key.startswith("_") and not callable(getattr(args, key))}
+
+def read_state():
+    try:
+        with open(STATE_FILE) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+def write_state(**fields):
+    state = read_state() or {}
+    state.update(fields)
+    os.makedirs(STATE_DIR, exist_ok=True)
+    temp_file = STATE_FILE + ".tmp"
+    with open(temp_file, "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(temp_file, STATE_FILE) # Readers never see a half written state
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def status():
+    """State of the latest experiment ({"status": "starting" | "running" | "finished" |
+    "ended" | "stopped" | "crashed", "pid", "ring", ...}) or None if there never was one."""
+    state = read_state()
+    if state is None:
+        return None
+    if state["pid"] is None:
+        # Launched, the process has not reported in yet
+        if time.time() - state["started"] > STARTUP_TIMEOUT:
+            state["status"] = "crashed"
+    elif state["status"] in ("starting", "running", "finished") and not pid_alive(state["pid"]):
+        state["status"] = "crashed"
+    return state
+
+def is_active(state=None):
+    state = status() if state is None else state
+    return state is not None and state["status"] in ("starting", "running", "finished")
+
+def launch(args_server, args_client, engine="asyncio", args_proxy=None):
+    """Start an experiment in a new process, returns its pid. With `args_proxy`
+    the client's packets go through udp_proxy.py listening on args_client.a/p."""
+    if is_active():
+        raise RuntimeError("An experiment is already running")
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(CONFIG_FILE, "w") as config_file:
+        json.dump({"server": args_to_dict(args_server), "client": args_to_dict(args_client),
+                   "proxy": args_to_dict(args_proxy) if args_proxy is not None else None,
+                   "engine": engine}, config_file)
+    # Written before the process starts, which then fills in its pid and ring
+    write_state(status="starting", pid=None, ring=None, started=time.time(),
+                duration=args_client.t, streams=getattr(args_client, "P", 1), engine=engine,
+                metrics=getattr(args_client, "metrics", None),
+                timestamps=getattr(args_client, "timestamps", "user"))
+    with open(LOG_FILE, "w") as log_file:
+        # Its own session: the experiment outlives a dashboard restart
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), CONFIG_FILE],
+                                   stdout=log_file, stderr=subprocess.STDOUT,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   start_new_session=True)
+    return process.pid
+
+def wait_until_running(timeout=10.0):
+    """Wait for the launched experiment to publish its metrics ring, returns its state."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = status()
+        if state is None or state["status"] != "starting":
+            return state
+        time.sleep(0.05)
+    return status()
+
+def attach(state=None):
+    """ResultsRing of a running or finished experiment, None when it has none (any more)."""
+    state = status() if state is None else state
+    if state is None or not state.get("ring") or state["status"] not in ("running", "finished"):
+        return None
+    try:
+        return ResultsRing.attach(state["ring"])
+    except FileNotFoundError:
+        return None # Ended between reading the state and attaching
+
+def stop():
+    """Stop the running experiment, or release a finished one's metrics."""
+    state = status()
+    if is_active(state) and state["pid"] is not None:
+        os.kill(state["pid"], signal.SIGTERM)
+
+
+def run_engines(args_server, args_client, engine):
+    import udp_client
+    if engine == "asyncio":
+        import udp_async
+        udp_async.run(udp_async.run_experiment(args_server, args_client))
+        return
+    import udp_server
+    server_thread = threading.Thread(target=udp_server.server_main, args=(args_server,), daemon=True)
+    server_thread.start()
+    time.sleep(SERVER_STARTUP)
+    udp_client.client_main(args_client)
+
+def start_proxy(args_proxy):
+    """Run udp_proxy.py in a child process so relaying never waits on the engines' GIL."""
+    import udp_proxy
+    proxy = multiprocessing.get_context("fork").Process(target=udp_proxy.proxy_main, args=(args_proxy,),
+                                                        daemon=True)
+    proxy.start()
+    return proxy
+
+def main(config_path):
+    import udp_client
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    args_server = argparse.Namespace(**config["server"])
+    args_client = argparse.Namespace(**config["client"])
+    # Forked before any thread starts
+    proxy = start_proxy(argparse.Namespace(**config["proxy"])) if config.get("proxy") else None
+
+    ring = ResultsRing.create_shared(udp_client.result_series(getattr(args_client, "P", 1)),
+                                     capacity_for(args_client.t, args_client.i))
+    udp_client.results_log = ring
+    # stop() ends the run (or the linger) through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    write_state(status="running", pid=os.getpid(), ring=ring.name)
+    finished = False
+    try:
+        run_engines(args_server, args_client, config["engine"])
+        finished = True
+        write_state(status="finished", finished=time.time())
+        time.sleep(LINGER)
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+            proxy.join()
+        ring.close(unlink=True)
+        write_state(status="ended" if finished else "stopped")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import math
+import time # Timer package
+import signal
+import argparse
+import importlib
+import contextlib
+
+STARTED = time.perf_counter()
+ROLE_MODULES = {"server": "udp_server", "client": "udp_client", "sweep": "sweep"}
+
+# Headless runner for automation: the server, one client run or a sweep
+# without Streamlit. The role's own arguments follow its name (see
+# `python udp_server.py --help`, `udp_client.py`, `sweep.py`). Results stream
+# to stdout as NDJSON, one JSON object per line tagged with "type" (interval,
+# point, summary), while the role's human-readable output goes to stderr. The
+# run ends with a summary line, or a --summary file, also when interrupted by
+# SIGINT/SIGTERM. With --start-at the role waits, imported and ready, for a
+# start time shared with other nodes (see agent.py). Only the chosen role's
+# module is imported and NumPy only loads for sweeps, so a run starts in well
+# under 100 ms; "startup_ms" in the summary (runner start to role imported)
+# and the startup cases of benchmarks/suite.py keep track of it.
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(allow_abbrev=False,
+        description="Run the server, a client or a sweep without the dashboard, e.g. "
+                    "python headless.py client --a 127.0.0.1 --t 5 --l 1400 > run.ndjson")
+    parser.add_argument('role', choices=list(ROLE_MODULES),
+        help="What to run, the role's own arguments follow")
+    parser.add_argument('--summary', type=str, default="-",
+        help="Write the final JSON summary to this file instead of the last stdout line")
+    parser.add_argument('--quiet', action="store_true",
+        help="Discard the role's human-readable output instead of writing it to stderr")
+    parser.add_argument('--start-at', type=float, dest='start_at',
+        help="Start the role at this Unix time, once imported (synchronized starts, see agent.py)")
+
+    return parser.parse_known_args(argv)
+
+def json_safe(value):
+    """JSON has no NaN or Infinity: non-finite floats become null."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {str(key): json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+def write_line(stream, record):
+    stream.write(json.dumps(json_safe(record), separators=(",", ":")) + "\n")
+    stream.flush() # A reader sees every interval as it happens
+
+
+class NDJSONLog:
+    """Stands in for udp_client.results_log: each row is written as one NDJSON
+    line instead of being kept, only the newest row is remembered for last()."""
+
+    def __init__(self, stream, kind="interval"):
+        self.stream = stream
+        self.kind = kind
+        self.row = {}
+        self.rows = 0
+
+    def append(self, sample):
+        self.row = sample
+        self.rows += 1
+        write_line(self.stream, {"type": self.kind, **sample})
+
+    def add_column(self, name):
+        pass # Every line carries its own keys
+
+    def last(self, name, default=0.0):
+        return self.row.get(name, default)
+
+    def reset(self):
+        self.row, self.rows = {}, 0
+
+    def __len__(self):
+        return self.rows
+
+
+def run_server(server, role_args, out, summary):
+    args = server.get_args(role_args)
+
+    def report(sample):
+        summary["Last Interval"] = sample
+        write_line(out, {"type": "interval", **sample})
+
+    server.report_sink = report
+    try:
+        server.server_main(args)
+    except KeyboardInterrupt:
+        pass # The usual end of a server run
+
+def run_client(client, role_args, out, summary, quiet=False):
+    args = client.get_args(role_args)
+    client.verbose = not quiet
+    client.results_log = NDJSONLog(out)
+    summary["Streams"] = args.P
+    try:
+        summary["Send Rate"] = client.client_main(args)
+    finally:
+        # Parallel streams only report their aggregate intervals to this process
+        summary["Last Interval"] = client.results_log.row
+        if args.P == 1:
+            summary.update(client.summary())
+
+def run_sweep(sweep, role_args, out, summary):
+    args = sweep.get_args(role_args)
+    summary["Results"] = args.out
+
+    def point_done(point, entry):
+        write_line(out, {"type": "point", "id": point, **entry})
+
+    results = sweep.sweep_main(args, on_point=point_done)
+    summary.update({"Points": len(sweep.grid_entries(results)), "MTU": results.get("mtu"),
+                    "Best Sizes": {others: {"l": size, "Throughput": throughput}
+                                   for others, (size, throughput) in sweep.best_sizes(results).items()}})
+
+def write_summary(path, summary, out):
+    if path == "-":
+        write_line(out, summary)
+        return
+    with open(path, "w") as summary_file:
+        json.dump(json_safe(summary), summary_file, indent=1)
+
+def wait_until(start_at):
+    """Sleep until the wall clock reaches `start_at`, returns how late it woke (ms)."""
+    while True:
+        remaining = start_at - time.time()
+        if remaining <= 0:
+            return -remaining * 1000
+        time.sleep(min(remaining, 0.5) if remaining > 0.002 else 0) # Spin the last ms for precision
+
+def interrupt(signum, frame):
+    if os.getpid() != main_pid:
+        os._exit(128 + signum) # Forked workers and streams just stop, the parent summarizes
+    raise KeyboardInterrupt
+
+main_pid = os.getpid()
+
+def headless_main(argv=None):
+    args, role_args = get_args(argv)
+    out = sys.stdout
+    signal.signal(signal.SIGTERM, interrupt)
+
+    summary = {"type": "summary", "role": args.role, "status": "completed"}
+    exit_code = 0
+    with contextlib.ExitStack() as stack:
+        log = stack.enter_context(open(os.devnull, "w")) if args.quiet else sys.stderr
+        stack.enter_context(contextlib.redirect_stdout(log)) # The roles print, stdout is for NDJSON
+        role = importlib.import_module(ROLE_MODULES[args.role])
+        startup_ms = (time.perf_counter() - STARTED) * 1000
+        run_start = time.perf_counter()
+        try:
+            if args.start_at is not None:
+                summary["start_late_ms"] = wait_until(args.start_at)
+                run_start = time.perf_counter()
+            if args.role == "server":
+                run_server(role, role_args, out, summary)
+            elif args.role == "client":
+                run_client(role, role_args, out, summary, args.quiet)
+            else:
+                run_sweep(role, role_args, out, summary)
+        except KeyboardInterrupt:
+            summary["status"] = "interrupted"
+        except SystemExit as err: # kill_with_error(), or invalid role arguments
+            summary["status"] = "error"
+            exit_code = err.code if isinstance(err.code, int) else 1
+    summary["startup_ms"] = startup_ms
+    summary["duration_s"] = time.perf_counter() - run_start
+    write_summary(args.summary, summary, out)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(headless_main())
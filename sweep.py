@@ -0,0 +1,290 @@
+import os
+import sys
+import csv
+import json
+import socket
+import time # Timer package
+import argparse
+import itertools
+import threading
+import subprocess
+
+import numpy as np
+
+import udp_client
+import udp_server
+from utils import path_mtu
+from utils.error_handling import kill_with_error, throw_error
+
+GREEN = "\033[0;32m"
+WHITE = "\033[0;37m"
+
+# Parameter sweeps: every combination of the grid runs back-to-back as a
+# client flow against one long-lived server. Each point's summary is saved as
+# soon as it finishes, so rerunning an interrupted sweep with the same output
+# file only runs the points that are missing. The packet sizes may include
+# "mtu": sizes on both sides of each fragmentation boundary of the path MTU,
+# discovered against the server once it is up (see utils/path_mtu.py).
+
+SWEEP_PARAMS = ("l", "b", "w", "t", "P")  # udp_client arguments a grid may vary
+SWEEP_METRICS = ("Throughput", "Send Rate", "OWD Client", "OWD Server", "RTT",
+                 "Jitter Client", "Jitter Server", "Tail Latency Client", "Tail Latency Server",
+                 "Loss % Client", "Loss % Server")
+# Metrics the client computes over its whole flow so far, the rest per interval
+CUMULATIVE_METRICS = ("Throughput", "Send Rate", "Tail Latency Client", "Tail Latency Server",
+                      "Loss % Client", "Loss % Server")
+SIZE_METRICS = ("IP Fragments",)  # Derived from the packet size and the path MTU
+MTU_SIZES = "mtu"  # Packet size list entry expanded to utils.path_mtu.size_boundaries()
+def parse_rate(value):
+    return None if value.lower() in ("0", "unpaced") else value
+
+def parse_packet_size(value):
+    return MTU_SIZES if value.lower() == MTU_SIZES else int(value)
+
+PARAM_TYPES = {"l": parse_packet_size, "b": parse_rate, "w": int, "t": float, "P": int}
+SERVER_STARTUP = 1.0  # Time for the server to initiate before the first point
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--a', type=str, default="127.0.0.1",
+        help="Determine's the IP address of the network for the server")
+    parser.add_argument('--p', type=str, default="8080",
+        help="Determine's the port the server will listen for new connections")
+    parser.add_argument('--i', type=float, default=1,
+        help="Time Interval between samples")
+    parser.add_argument('--l', type=str, default="1024",
+        help="Packet sizes to sweep, comma separated (e.g. 64,512,1400,65507), "
+             "mtu adds sizes around each fragmentation boundary of the path MTU")
+    parser.add_argument('--b', type=str, default="",
+        help="Target bitrates to sweep, comma separated (e.g. unpaced,100M,1G)")
+    parser.add_argument('--w', type=str, default="1",
+        help="Window sizes to sweep, comma separated")
+    parser.add_argument('--t', type=str, default="5",
+        help="Measured durations in seconds to sweep, comma separated")
+    parser.add_argument('--P', type=str, default="1",
+        help="Parallel stream counts to sweep, comma separated")
+    parser.add_argument('--warmup', type=float, default=1.0,
+        help="Seconds run before each point's measurement starts, not measured")
+    parser.add_argument('--cooldown', type=float, default=1.0,
+        help="Idle seconds between points so queues drain")
+    parser.add_argument('--out', type=str, default="sweeps/sweep.json",
+        help="Results file, an existing one is resumed")
+    parser.add_argument('--csv', type=str,
+        help="Also export the results matrix as CSV to this file")
+    parser.add_argument('--remote', action="store_true",
+        help="Sweep against an already running server at --a/--p instead of starting one")
+
+    return parser.parse_args(argv)
+
+def parse_grid(args):
+    """{param: [values]} from the comma separated sweep arguments."""
+    grid = {}
+    for param in SWEEP_PARAMS:
+        values = [value.strip() for value in str(getattr(args, param) or "").split(",") if value.strip()]
+        try:
+            grid[param] = [PARAM_TYPES[param](value) for value in values] or [None]
+        except ValueError:
+            kill_with_error(f"Invalid value in --{param}: {getattr(args, param)}")
+    return grid
+
+def grid_points(grid):
+    """Every combination of the grid as {param: value}, in a stable order."""
+    params = list(grid)
+    return [dict(zip(params, values)) for values in itertools.product(*(grid[param] for param in params))]
+
+def find_mtu(args, probe=False):
+    """Path MTU to the server: probed end to end when `probe`, the kernel's route MTU otherwise."""
+    try:
+        address = (args.a, int(args.p))
+    except ValueError:
+        kill_with_error("Invalid port number")
+    if probe:
+        try:
+            mtu, _ = path_mtu.discover(address)
+            return mtu
+        except OSError as err:
+            throw_error(f"Path MTU discovery failed, using the kernel's route MTU: {err}")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect(address)
+        except OSError:
+            return None
+        return path_mtu.route_mtu(sock)
+
+def expand_sizes(grid, mtu):
+    """Replace the "mtu" packet size entry of `grid` with the sizes around the
+    fragmentation boundaries of `mtu`."""
+    if MTU_SIZES not in grid["l"]:
+        return grid
+    if mtu is None:
+        kill_with_error("The path MTU is unknown, give the packet sizes explicitly")
+    sizes = {size for size in grid["l"] if size != MTU_SIZES} | set(path_mtu.size_boundaries(mtu))
+    return {**grid, "l": sorted(sizes)}
+
+def resolve_grid(grid, results):
+    """`grid` with its "mtu" sizes as expanded by the sweep that saved `results`,
+    when that sweep ran the same grid."""
+    saved = results.get("grid") or {}
+    if MTU_SIZES not in grid.get("l", ()) or MTU_SIZES in saved.get("l", (MTU_SIZES,)) or \
+            any(saved.get(param) != grid[param] for param in grid if param != "l"):
+        return grid
+    return saved
+
+def point_id(point):
+    return ",".join(f"{param}={point[param]}" for param in sorted(point))
+
+def load_results(path):
+    try:
+        with open(path) as results_file:
+            return json.load(results_file)
+    except (OSError, ValueError):
+        return {"grid": {}, "points": {}}
+
+def save_results(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as results_file:
+        json.dump(results, results_file, indent=1)
+    os.replace(temp_file, path) # An interruption never leaves a truncated file
+
+def summarize_point(results_log):
+    """Whole-flow metrics from the last sample (the client keeps them cumulative
+    from the start of its flow), the mean over the samples for the others."""
+    summary = {}
+    for metric in SWEEP_METRICS:
+        values = results_log[metric][~np.isnan(results_log[metric])]
+        if not len(values):
+            summary[metric] = None
+        elif metric in CUMULATIVE_METRICS:
+            summary[metric] = float(values[-1])
+        else:
+            summary[metric] = float(values.mean())
+    return summary
+
+def client_args(args, point, duration):
+    return argparse.Namespace(a=args.a, p=args.p, i=args.i, c=True, l=point["l"], t=duration,
+                              w=point["w"], b=point["b"], r=None, batch=1, engine="blocking",
+                              P=point["P"], m="full", trace=None, mtu=False)
+
+def run_point(args, point, warmup):
+    if warmup > 0:
+        # A flow of its own: the measured flow starts with fresh statistics, on the
+        # client and in its server session, instead of carrying the warm-up in them
+        udp_client.client_main(client_args(args, point, warmup))
+    udp_client.open_results_log(point["t"], args.i).reset()
+    udp_client.client_main(client_args(args, point, point["t"]))
+    return summarize_point(udp_client.results_log.latest())
+
+def run_sweep(args, grid, path, warmup=1.0, cooldown=1.0, progress=None, mtu=None, on_point=None):
+    """Run every grid point missing from the results file at `path`, saving after each
+    and passing its (id, entry) to `on_point`. With the path `mtu` known every point
+    also records its IP fragment count."""
+    results = load_results(path)
+    results["grid"] = grid
+    results["mtu"] = mtu
+    save_results(results, path) # Followers such as the dashboard see the expanded grid at once
+    points = grid_points(grid)
+    todo = [point for point in points if point_id(point) not in results["points"]]
+    if len(todo) < len(points):
+        print(f"Resuming sweep: {len(points) - len(todo)} of {len(points)} points already done")
+    stale = len(results["points"]) - (len(points) - len(todo))
+    if stale:
+        print(f"{stale} point(s) of other grids are kept in {path} but not reported")
+
+    udp_client.verbose = False
+    for done, point in enumerate(todo, len(points) - len(todo) + 1):
+        metrics = run_point(args, point, warmup)
+        if mtu:
+            metrics["IP Fragments"] = path_mtu.fragments(point["l"], mtu)
+        results["points"][point_id(point)] = {"params": point, "metrics": metrics, "finished": time.time()}
+        save_results(results, path)
+        print(f"[{done}/{len(points)}] {point_id(point)} | " \
+              f"Throughput: {GREEN}{metrics['Throughput'] or 0.0:.3f} {WHITE}MBps | " \
+              f"RTT: {GREEN}{metrics['RTT'] or 0.0:.3f} {WHITE}ms | " \
+              f"Loss: {GREEN}{metrics['Loss % Client'] or 0.0:.3f}{WHITE}% / " \
+              f"{GREEN}{metrics['Loss % Server'] or 0.0:.3f}{WHITE}%" + \
+              (f" | IP Fragments: {metrics['IP Fragments']}" if mtu else ""))
+        if on_point is not None:
+            on_point(point_id(point), results["points"][point_id(point)])
+        if progress is not None:
+            progress(done, len(points))
+        time.sleep(cooldown)
+    return results
+
+def grid_entries(results):
+    """{point id: entry} of the finished points of the results' grid. A file resumed
+    with another grid keeps the earlier grids' points, they are not reported."""
+    ids = {point_id(point) for point in grid_points(results.get("grid") or {})}
+    return {point: entry for point, entry in results["points"].items() if point in ids}
+
+def results_matrix(results):
+    """One row per finished point of the grid: its parameters followed by its metrics."""
+    return [{**entry["params"], **entry["metrics"]} for entry in grid_entries(results).values()]
+
+def best_sizes(results, metric="Throughput"):
+    """{other parameters: (packet size, value)} maximizing `metric` (goodput by default)
+    over the swept packet sizes, for each combination of the other parameters."""
+    best = {}
+    for entry in grid_entries(results).values():
+        value = entry["metrics"].get(metric)
+        if value is None or value != value: # NaN: the point had no samples
+            continue
+        others = point_id({param: entry["params"][param] for param in entry["params"] if param != "l"})
+        if others not in best or value > best[others][1]:
+            best[others] = (entry["params"]["l"], value)
+    return best
+
+def report_best_sizes(results):
+    for others, (size, throughput) in sorted(best_sizes(results).items()):
+        fragments = f" ({path_mtu.format_fragments(size, results['mtu'])})" if results.get("mtu") else ""
+        print(f"Best packet size for {others}: {GREEN}{size}{WHITE} bytes{fragments} | " \
+              f"Throughput: {GREEN}{throughput:.3f} {WHITE}MBps")
+
+def export_csv(results, path):
+    rows = results_matrix(results)
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=[*SWEEP_PARAMS, *SWEEP_METRICS, *SIZE_METRICS])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def start_server(args):
+    args_server = argparse.Namespace(a=args.a, p=args.p, i=args.i, s=True, batch=1, workers=1,
+                                     engine="blocking", idle=udp_server.SESSION_IDLE_TIMEOUT)
+    threading.Thread(target=udp_server.server_main, args=(args_server,), daemon=True).start()
+    time.sleep(SERVER_STARTUP)
+
+def launch(options, log_path="sweeps/sweep.log"):
+    """Run `python sweep.py` with {argument: value} options in its own process, returns its Popen."""
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__)]
+    for name, value in options.items():
+        command += [f"--{name}", str(value)]
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), start_new_session=True)
+    return process
+
+def sweep_main(args, on_point=None):
+    grid = parse_grid(args)
+    if not args.remote:
+        start_server(args)
+    mtu = find_mtu(args, probe=MTU_SIZES in grid["l"])
+    if mtu:
+        print(f"Path MTU: {GREEN}{mtu}{WHITE} bytes")
+    grid = expand_sizes(grid, mtu)
+    results = run_sweep(args, grid, args.out, args.warmup, args.cooldown, mtu=mtu, on_point=on_point)
+    print(f"Sweep results saved to {args.out}")
+    if len(grid["l"]) > 1:
+        report_best_sizes(results)
+    if args.csv:
+        export_csv(results, args.csv)
+        print(f"Results matrix exported to {args.csv}")
+    return results
+
+
+if __name__ == "__main__":
+    sweep_main(get_args())
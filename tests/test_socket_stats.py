@@ -0,0 +1,29 @@
+import socket
+
+from utils import socket_stats
+
+
+class CappedSocket:
+    """Unprivileged socket whose buffers the kernel caps at `cap` bytes."""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.sizes = {}
+
+    def setsockopt(self, level, option, size):
+        if option in (socket_stats.SO_RCVBUFFORCE, socket_stats.SO_SNDBUFFORCE):
+            raise PermissionError("SO_*BUFFORCE needs CAP_NET_ADMIN")
+        self.sizes[option] = min(size, self.cap) * socket_stats.GRANTED_FACTOR
+
+    def getsockopt(self, level, option):
+        return self.sizes.get(option, 212992)
+
+
+def test_clamped_buffer_is_flagged():
+    # Doubled by Linux, the 4 MB granted would pass for the 3 MB requested
+    granted = socket_stats.configure_buffers(CappedSocket(2 ** 21), rcvbuf=3 * 2 ** 20)
+    assert socket_stats.short_buffers(granted) == ["receive"]
+
+def test_granted_buffer_is_not_flagged():
+    granted = socket_stats.configure_buffers(CappedSocket(2 ** 23), rcvbuf=2 ** 22, sndbuf=2 ** 22)
+    assert socket_stats.short_buffers(granted) == []
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import socket
+import time
+
+import udp_async
+import udp_server
+from utils.packet import PacketBuffer, HEADER_SIZE, MODE_ACK
+
+
+def server_args(port, idle):
+    return argparse.Namespace(a="127.0.0.1", p=str(port), i=0.1, s=True, batch=1, workers=1,
+                              engine="asyncio", idle=idle, metrics=None, timestamps="user",
+                              rcvbuf=None, sndbuf=None)
+
+def test_idle_session_is_evicted():
+    async def scenario():
+        ready = asyncio.Event()
+        server = asyncio.create_task(udp_async.serve(server_args(9590, idle=0.3), ready))
+        await ready.wait()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+            client.sendto(PacketBuffer(HEADER_SIZE).pack(0, time.time_ns(), 0, MODE_ACK, size=0),
+                          ("127.0.0.1", 9590))
+            await asyncio.sleep(0.2)
+            active = len(udp_server.sessions)
+            await asyncio.sleep(0.6) # Past the idle timeout, no more packets
+            idle = len(udp_server.sessions)
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+        return active, idle
+
+    assert asyncio.run(scenario()) == (1, 0)
@@ -0,0 +1,236 @@
+import asyncio
+import socket
+import time # Timer package
+
+import udp_client
+import udp_server
+from utils.packet import PacketBuffer, parse_header
+from utils.error_handling import kill_with_error
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+GREEN = "\033[0;32m"
+WHITE = "\033[0;37m"
+
+# asyncio engine for the server and the client. One event loop drives every
+# flow, the pacing and expiry timers and the reporting interval, so an
+# experiment needs no thread per role and ends by cancelling its tasks.
+# The packet, window and statistics logic is shared with udp_client/udp_server.
+
+
+def new_event_loop():
+    return uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+
+def run(coro):
+    """Run `coro` to completion on a fresh (uvloop when installed) event loop."""
+    loop = new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.reply_buffer = PacketBuffer(udp_server.PACKET_SIZE)
+        self.total_bytes = 0
+        self.last_time_rec = 0
+        self.last_time_sent = 0
+        self.stream_handle = None  # Timer driving the download streams
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        time_rec = time.time_ns()
+        profiler = udp_server.profiler
+        if profiler is not None:
+            profiler.lap("wait") # Time in the event loop since the previous datagram
+        header = parse_header(data, len(data))
+        if profiler is not None:
+            profiler.lap("decode")
+        if header is None:
+            return # Not one of our packets
+
+        # Echo the sequence number and send time so the client can match the reply
+        seq, time_sent, time_echo, mode, size_requested = header[:5]
+        reply_fields = udp_server.track_packet(addr, seq, len(data), time_rec, mode, time_echo, size_requested)
+        size = udp_server.reply_size(mode, len(data), size_requested)
+        if profiler is not None:
+            profiler.lap("session")
+        if size is not None:
+            reply = self.reply_buffer.pack(seq, time_rec, time_sent, mode, *reply_fields, size=size)
+            if profiler is not None:
+                profiler.lap("pack")
+            self.transport.sendto(reply, addr)
+            if profiler is not None:
+                profiler.lap("send")
+        elif self.stream_handle is None:
+            self.stream()
+        self.total_bytes += len(data)
+        self.last_time_rec = time_rec
+        self.last_time_sent = time.time_ns()
+        udp_server.count_packets(1, len(data))
+
+    def stream(self):
+        """Send the due download datagrams and come back when the next one is due."""
+        next_due = udp_server.send_downloads(self.transport.sendto, self.reply_buffer, time.time_ns())
+        if udp_server.profiler is not None:
+            udp_server.profiler.lap("download")
+        self.stream_handle = None if next_due is None else \
+            asyncio.get_running_loop().call_later(next_due, self.stream)
+
+    def close(self):
+        if self.stream_handle is not None:
+            self.stream_handle.cancel()
+        self.transport.close()
+
+    def error_received(self, exc):
+        udp_server.throw_error("Error during Communication", error_code=getattr(exc, "errno", None))
+
+
+async def serve(args, ready=None):
+    """Run the server until cancelled, reporting every args.i seconds."""
+    loop = asyncio.get_running_loop()
+    udp_server.init_sessions(args)
+    udp_server.open_metrics(args)
+    udp_server.timestamps = None
+    if getattr(args, "timestamps", "user") == "kernel":
+        udp_server.throw_error("The asyncio engine has no ancillary data, using userspace timestamps")
+    server_sock = udp_server.create_server_socket(args.a, args.p)
+    udp_server.open_socket_stats(args, server_sock)
+    transport, protocol = await loop.create_datagram_endpoint(ServerProtocol, sock=server_sock)
+    print(f"Server binded to {args.a}:{args.p}")
+    print("Server is listening...")
+    if ready is not None:
+        ready.set()
+
+    try:
+        while True:
+            await asyncio.sleep(args.i)
+            # Sessions age on the wall clock, the last packet's time stops once clients do
+            time_now = time.time_ns()
+            udp_server.sessions.evict_idle(time_now)
+            if protocol.last_time_rec:
+                udp_server.report_interval(protocol.total_bytes, protocol.last_time_rec,
+                                           protocol.last_time_sent, 0, 0, time_now=time_now)
+    finally:
+        protocol.close()
+        udp_server.downloads.clear()
+        udp_server.sessions.close_all()
+
+
+class ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, t_interval, window, pacer, start_time):
+        self.transport = None
+        self.t_interval = t_interval
+        self.window = window
+        self.pacer = pacer
+        self.start_time = start_time
+        self.prev_time = start_time
+        self.wakeup = None
+        self.expiry = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.expire()
+
+    def fill_window(self):
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+            self.wakeup = None
+        udp_client.fill_window(self.transport.sendto, self.window, self.pacer)
+        # Out of pacing tokens with room in the window: come back for the next one
+        if self.pacer is not None and self.wakeup is None and len(udp_client.in_flight) < self.window:
+            delay = self.pacer.ns_until_next() / (10 ** 9)
+            self.wakeup = asyncio.get_running_loop().call_later(delay, self.fill_window)
+
+    def expire(self):
+        udp_client.expire_in_flight(time.time_ns())
+        self.fill_window()
+        self.expiry = asyncio.get_running_loop().call_later(udp_client.REPLY_TIMEOUT / 2, self.expire)
+
+    def datagram_received(self, data, addr):
+        time_rec = time.time_ns()
+        profiler = udp_client.profiler
+        if profiler is not None:
+            profiler.lap("wait") # Time in the event loop since the previous send or reply
+        self.prev_time = udp_client.process_reply(data, len(data), time_rec, self.t_interval,
+                                                  self.prev_time, self.start_time)
+        if profiler is not None:
+            profiler.lap("stats")
+        if self.wakeup is None:
+            self.fill_window()
+
+    def error_received(self, exc):
+        udp_client.throw_error("Error during Communication", getattr(exc, "errno", None))
+
+    def close(self):
+        for handle in (self.wakeup, self.expiry):
+            if handle is not None:
+                handle.cancel()
+        self.transport.close()
+
+
+async def run_client(args):
+    """Run one client flow for args.t seconds."""
+    loop = asyncio.get_running_loop()
+    window = max(1, getattr(args, "w", 1))
+    if not udp_client.asyncio_capable(args):
+        raise RuntimeError("Download streams and kernel timestamps run on the blocking client loop")
+    udp_client.set_reply_mode(args)
+    udp_client.set_packet_size(args)
+    pacer = udp_client.create_pacer(args)
+    udp_client.reset_state(args)
+    udp_client.open_trace(args)
+    udp_client.open_metrics(args)
+
+    try:
+        server_port = int(args.p)
+    except ValueError:
+        kill_with_error("Invalid port number")
+
+    print(f"Connecting to {args.a}:{server_port}...")
+    try:
+        client_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client_sock.connect((args.a, server_port))
+    except OSError as err:
+        kill_with_error("Connection Failed", err.errno)
+    print(f"{GREEN}Connected...{WHITE}")
+    # Buffers are sized before connection_made() sends the first window
+    udp_client.open_socket_stats(args, client_sock)
+    udp_client.report_packet_size(client_sock)
+    start_time = time.time_ns()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: ClientProtocol(args.i, window, pacer, start_time), sock=client_sock)
+
+    try:
+        await asyncio.sleep(args.t)
+    finally:
+        protocol.close()
+        udp_client.close_trace()
+    return udp_client.report_send_rate(start_time)
+
+
+async def run_experiment(args_server, args_client):
+    """Server and client on one event loop; the server is cancelled once the client is done."""
+    ready = asyncio.Event()
+    server = asyncio.create_task(serve(args_server, ready))
+    await ready.wait()
+    try:
+        if getattr(args_client, "P", 1) > 1 or not udp_client.asyncio_capable(args_client):
+            # Parallel streams run in their own processes and the blocking client loop in
+            # a thread (see udp_client.client_main), this loop only hosts the server
+            await asyncio.get_running_loop().run_in_executor(None, udp_client.client_main, args_client)
+        else:
+            await run_client(args_client)
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
@@ -1,8 +1,20 @@
+import sys
 import socket
 import time # Timer package
-import numpy as np
+import argparse
 
+# NumPy (utils.results_ring), utils.metrics and multiprocessing load when first
+# needed, so a headless client starts without them
 from utils import progress_bar as pb
+from utils.pacer import Pacer, parse_bitrate
+from utils.packet import PacketBuffer, parse_header, HEADER_SIZE, MODES, MODE_DOWNLOAD
+from utils import batch_io
+from utils.stream_stats import JitterEstimator, LatencyHistogram
+from utils.seq_tracker import SequenceTracker
+from utils import trace
+from utils import timestamps as kernel_timestamps
+from utils import socket_stats
+from utils import path_mtu
 from utils.error_handling import kill_with_error, throw_error 
 
 
@@ -10,24 +22,79 @@ GREEN = "\033[0;32m"
 WHITE = "\033[0;37m"
 
 BUFFER_SIZE = 1024  # Maximum UDP payload size (minus headers)
-PACKET_SIZE = 65507
+PACKET_SIZE = 65507  # Default datagram size when --l is not given
 
-PACKET_DELIMETER = ';'
+REPLY_TIMEOUT = 1.0  # Seconds before an outstanding packet is considered lost
 total_bytes = 0
-packets_sent = 1
-owds_c2s = []
-owds_s2c = []
-results_log = {"Throughput": [],
-               "Jitter Client": [],
-               "Jitter Server": [],
-               "Tail Latency Client": [],
-               "Tail Latency Server": [],
-               "OWD Client": [],
-               "OWD Server": [],
-               "Time": []}
+packets_sent = 0
+packet_size = PACKET_SIZE  # Bytes per datagram sent (--l), also asked of the server for its replies
+mtu_found = None  # Path MTU discovered with --mtu
+next_seq = 0
+in_flight = {}  # Sequence number -> time sent (ns), oldest first
+target_bitrate = None  # Requested send rate in bits/s when pacing
+send_buffer = None  # Preallocated PacketBuffer for the client socket
+recv_buffer = bytearray(HEADER_SIZE)  # Replies are only read up to their header
+# Report a reply's real size even though only its header is read
+RECV_FLAGS = socket.MSG_TRUNC if sys.platform.startswith("linux") else 0
+reply_mode = 0  # utils.packet MODE_* requested from the server in every packet
+DOWNLOAD_BITRATE = "100M"  # Download rate when --m download is given without --b/--r
+DOWNLOAD_RENEW = 0.25  # Seconds between download requests, inside the server's DOWNLOAD_TIMEOUT
+download_renew_at = 0
+trace_writer = None  # utils.trace.TraceWriter recording every packet with --trace
+CLIENT_PHASES = ("pack", "send", "pace", "wait", "decode", "stats")
+profiler = None  # utils.metrics.PhaseProfiler timing CLIENT_PHASES with --metrics
+timestamps = None  # utils.timestamps.KernelTimestamps of the client socket with --timestamps kernel
+socket_drops = None  # utils.socket_stats.SocketDrops: kernel drops at the client socket
+batch_sender = None  # sendmmsg/recvmmsg backend when --batch > 1 on Linux
+batch_receiver = None
+verbose = True  # Parallel streams stay quiet, the parent prints the aggregate
+stream_queue = None  # (queue, index) forwarding interval samples to the parent in -P mode
+# Streaming per-packet statistics in each direction (OWDs in ns)
+jitter_c2s = JitterEstimator()
+jitter_s2c = JitterEstimator()
+latency_c2s = LatencyHistogram()
+latency_s2c = LatencyHistogram()
 
-import argparse
-def get_args():
+# Loss/reordering: replies are tracked here, the client-to-server counts
+# (reply sequence, lost, reordered, duplicates) come back in each reply header
+tracker_s2c = SequenceTracker()
+counts_c2s = (0, 0, 0, 0)
+RESULT_SERIES = ("Throughput",
+                 "Jitter Client",
+                 "Jitter Server",
+                 "Tail Latency Client",
+                 "Tail Latency Server",
+                 "OWD Client",
+                 "OWD Server",
+                 "RTT",
+                 "Send Rate",
+                 "Loss % Client",
+                 "Loss % Server",
+                 "Reorder Client",
+                 "Reorder Server",
+                 "Stack Delay RX",
+                 "Stack Delay TX",
+                 "Lost Server2Client",
+                 "Kernel Drops Client",
+                 "Time")
+# One row per interval sample, written only by the running client and read
+# by the dashboard through results_log.latest(). A utils.results_ring.ResultsRing
+# created by open_results_log() unless the caller installed its own log (a
+# shared ring in experiment.py, headless.py's NDJSON stream)
+results_log = None
+own_results_log = None  # The ResultsRing open_results_log() created, resized at will
+
+# How each series is combined across parallel streams
+STREAM_AGGREGATES = {"Throughput": sum,
+                     "Send Rate": sum,
+                     "Tail Latency Client": max,
+                     "Tail Latency Server": max,
+                     "Reorder Client": sum,
+                     "Reorder Server": sum,
+                     "Lost Server2Client": sum,
+                     "Kernel Drops Client": sum}
+
+def get_args(argv=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--a', type=str, default="127.0.0.1",
@@ -41,99 +108,729 @@ def get_args():
         help="The program acts as a client")
     
     parser.add_argument('--l', type=int,
-        help="UDP Package Size in bytes")
+        help="UDP Package Size in bytes (65507 by default, the maximum)")
     parser.add_argument('--t', type=int, default=10,
         help="Experiment duration in seconds...")
+    parser.add_argument('--w', type=int, default=1,
+        help="Maximum number of packets in flight (1 = stop-and-wait)")
+    parser.add_argument('--b', type=str,
+        help="Target bitrate to pace at, iperf style (e.g. 200M, 1G)")
+    parser.add_argument('--r', type=float,
+        help="Target packets per second to pace at (overrides --b)")
+    parser.add_argument('--batch', type=int, default=1,
+        help="Datagrams sent/received per syscall (sendmmsg/recvmmsg, Linux only)")
+    parser.add_argument('--engine', type=str, default="blocking", choices=["blocking", "asyncio"],
+        help="Blocking socket loop or asyncio event loop (uses uvloop when installed)")
+    parser.add_argument('-P', '--P', type=int, default=1, dest='P',
+        help="Number of parallel client streams, each with its own socket")
+    parser.add_argument('--m', type=str, default="full", choices=list(MODES),
+        help="Server reply: full packet, ack (header only), echo (same size) or "
+             "download (server streams to the client at --b/--r)")
+    parser.add_argument('--trace', type=str,
+        help="Record every packet to this binary trace file (see utils/trace.py)")
+    parser.add_argument('--metrics', type=str,
+        help="Time each packet loop phase and serve Prometheus metrics on this [HOST:]PORT")
+    parser.add_argument('--timestamps', type=str, default="user", choices=["user", "kernel"],
+        help="Take packet times after recv()/before send() (user) or from the kernel (Linux, blocking engine)")
+    parser.add_argument('--mtu', action="store_true",
+        help="Discover the path MTU to the server first, packets default to the largest unfragmented size")
+    parser.add_argument('--rcvbuf', type=str,
+        help="Socket receive buffer size (e.g. 4M), the kernel default when not given")
+    parser.add_argument('--sndbuf', type=str,
+        help="Socket send buffer size (e.g. 4M), the kernel default when not given")
 
-    return parser.parse_args()
-
-def prepare_large_packet(time_sent, delimiter, packet_size):
-    base_data = f"{time_sent}{delimiter}"
-    extra_data_size = packet_size - len(base_data.encode())
-    if extra_data_size > 0:
-        extra_data = "X" * extra_data_size
-        return bytes(base_data + extra_data, encoding='utf-8')
-    else:
-        return bytes(base_data[:packet_size], encoding='utf-8')
-
-def calculate_jitter(delays):
-    jitter_values = [abs(delays[i] - delays[i - 1]) for i in range(1, len(delays))]
-    avg_jitter = sum(jitter_values) / len(jitter_values) if jitter_values else 0.0
-    return avg_jitter
+    return parser.parse_args(argv)
 
 def calculate_OWD(time_sent, time_rec):
     return (time_rec - time_sent)/ (10 ** 6) # Milliseconds
 
+def format_percentiles(histogram):
+    return " ".join(f"p{percentile:g}={GREEN}{value / (10 ** 6):.3f}{WHITE}"
+                    for percentile, value in histogram.quantiles().items())
 
-def calculate_tail_latency(delays, percentile=95):
-    if not delays:
-        return 0.0
-    return np.percentile(delays, percentile)
 
+def fill_window(send, window, pacer=None):
+    """Send new sequence-numbered packets through `send` until `window` of them
+    are in flight or the pacer runs out of tokens."""
+    global packets_sent, next_seq
 
-def handle_server_packet(socket, t_interval, prev_time, start_time):
-    global total_bytes, packets_sent, owds
+    batched = 0
+    while len(in_flight) < window:
+        if pacer is not None and not pacer.try_acquire():
+            break
+        time_sent2serv = time.time_ns()
+        if batch_sender is None:
+            packet = send_buffer.pack(next_seq, time_sent2serv, 0, reply_mode, packet_size)
+            if profiler is not None:
+                profiler.lap("pack")
+            send(packet)
+            if timestamps is not None:
+                timestamps.sent_packet(next_seq, time_sent2serv)
+            if profiler is not None:
+                profiler.lap("send")
+        else:
+            # Stamped when queued, the flush below follows within microseconds
+            batch_sender.pack(batched, next_seq, time_sent2serv, 0, reply_mode, packet_size)
+            if profiler is not None:
+                profiler.lap("pack")
+            batched += 1
+            if batched == batch_sender.vector.batch:
+                batch_sender.send(batched)
+                batched = 0
+                if profiler is not None:
+                    profiler.lap("send")
+        in_flight[next_seq] = time_sent2serv
+        next_seq += 1
+        packets_sent += 1
+    if batched:
+        batch_sender.send(batched)
+        if profiler is not None:
+            profiler.lap("send")
+
+def receive_replies(socket):
+    """Wait for the next reply (or batch of replies), return [(buffer, nbytes)]."""
+    if timestamps is not None:
+        return [(recv_buffer, timestamps.recvfrom_into(recv_buffer, RECV_FLAGS)[0])]
+    if batch_receiver is None:
+        return [(recv_buffer, socket.recv_into(recv_buffer, 0, RECV_FLAGS))]
+    count = batch_receiver.recv()
+    return [(batch_receiver.slot(i), batch_receiver.length(i)) for i in range(count)]
+
+def expire_in_flight(time_now):
+    """Give up on packets whose reply did not arrive within REPLY_TIMEOUT."""
+    expired = []
+    for seq, time_sent in in_flight.items():
+        if (time_now - time_sent) / (10 ** 9) < REPLY_TIMEOUT:
+            break # Insertion ordered, the remaining packets are younger
+        expired.append(seq)
+    for seq in expired:
+        time_sent = in_flight.pop(seq)
+        if trace_writer is not None:
+            trace_writer.record(seq, time_sent, 0, 0, packet_size, trace.DIRECTION_EXPIRED)
+    return len(expired)
 
-    time_sent2serv = time.time_ns()
-    sent_packet = prepare_large_packet(time_sent2serv, PACKET_DELIMETER, PACKET_SIZE)
-    socket.send(sent_packet)
-    elapsed_time = 0
-    packets, _ = socket.recvfrom(1024)
+def calculate_send_rate(elapsed_time):
+    if reply_mode == MODE_DOWNLOAD:
+        return total_bytes * 8 / elapsed_time / 1e6 # Server's rate as received, Mbit/s
+    return packets_sent * packet_size * 8 / elapsed_time / 1e6 # Mbit/s
+
+def handle_server_packet(socket, t_interval, prev_time, start_time, window=1, pacer=None):
+    fill_window(socket.send, window, pacer)
+    if timestamps is not None:
+        # Drained before waiting: pending send stamps would keep the socket readable
+        apply_send_stamps()
+    if pacer is not None:
+        if not in_flight:
+            pacer.wait()
+            if profiler is not None:
+                profiler.lap("pace")
+            return total_bytes, prev_time
+        # Wake up in time for the next paced send unless the window is full
+        if len(in_flight) >= window:
+            socket.settimeout(REPLY_TIMEOUT)
+        else:
+            socket.settimeout(max(pacer.ns_until_next(), 1000) / (10 ** 9))
+    try:
+        replies = receive_replies(socket)
+    except TimeoutError:
+        if profiler is not None:
+            profiler.lap("wait")
+            profiler.count("timeouts")
+        expire_in_flight(time.time_ns())
+        return total_bytes, prev_time
     time_rec = time.time_ns()
-    if not packets:
-        print("No data received... Shutting down communication\n \
-                Experiment Finished...")
-        return -1, 0
-    
-    data = packets.decode()
-    time_sent_serv = int(data.split(PACKET_DELIMETER)[0])
-    
-    total_bytes += len(sent_packet)
+    if timestamps is not None:
+        apply_send_stamps()
+        time_rec = timestamps.receive_time(time_rec)
+    if profiler is not None:
+        profiler.lap("wait")
+
+    for buffer, nbytes in replies:
+        prev_time = process_reply(buffer, nbytes, time_rec, t_interval, prev_time, start_time)
+        if profiler is not None:
+            profiler.lap("stats")
+
+    return total_bytes, prev_time
+
+def apply_send_stamps():
+    """Move the in-flight packets' send times to their kernel stamps."""
+    for seq, time_kernel in timestamps.drain_tx():
+        if seq in in_flight:
+            in_flight[seq] = time_kernel
+
+def request_download(socket, rate_bps):
+    """Ask the server to (keep) streaming at `rate_bps`, 0 stops the stream."""
+    global packets_sent, next_seq, download_renew_at
+    time_sent = time.time_ns()
+    socket.send(send_buffer.pack(next_seq, time_sent, int(rate_bps), MODE_DOWNLOAD, packet_size, size=HEADER_SIZE))
+    if timestamps is not None:
+        timestamps.sent_packet(None, time_sent)
+    next_seq += 1
+    packets_sent += 1
+    download_renew_at = time.time_ns() + int(DOWNLOAD_RENEW * (10 ** 9))
+
+def handle_download_packet(socket, t_interval, prev_time, start_time, rate_bps):
+    """Download mode counterpart of handle_server_packet."""
+    if time.time_ns() >= download_renew_at:
+        request_download(socket, rate_bps)
+    if timestamps is not None:
+        # The requests' send stamps only feed the TX stack delay, nothing waits on them
+        timestamps.drain_tx()
+    try:
+        replies = receive_replies(socket)
+    except TimeoutError:
+        if profiler is not None:
+            profiler.lap("wait")
+            profiler.count("timeouts")
+        return total_bytes, prev_time
+    time_rec = time.time_ns()
+    if timestamps is not None:
+        time_rec = timestamps.receive_time(time_rec)
+    if profiler is not None:
+        profiler.lap("wait")
+
+    for buffer, nbytes in replies:
+        prev_time = process_download(buffer, nbytes, time_rec, t_interval, prev_time, start_time)
+        if profiler is not None:
+            profiler.lap("stats")
+
+    return total_bytes, prev_time
+
+def process_download(buffer, nbytes, time_rec, t_interval, prev_time, start_time):
+    """Account for one streamed datagram and sample into results_log once per interval."""
+    global total_bytes
+    header = parse_header(buffer, nbytes)
+    if header is None or header[3] != MODE_DOWNLOAD:
+        return prev_time # Not part of the stream
+    time_sent_serv = header[1]
+    track_reply(header[4:])
+    if profiler is not None:
+        profiler.lap("decode")
+    if trace_writer is not None:
+        trace_writer.record(header[0], 0, time_sent_serv, time_rec, nbytes, trace.DIRECTION_DOWNLOAD)
+
+    total_bytes += nbytes
+    jitter_s2c.update(time_rec - time_sent_serv)
+    latency_s2c.record(time_rec - time_sent_serv)
+
+    delay = (time_rec - prev_time) / (10 ** 9)
+    if delay < t_interval:
+        return prev_time
+    elapsed_time = (time_rec - start_time) / (10 ** 9)
+    throughput_MBps = (total_bytes / (1024 ** 2)) / elapsed_time
+    OWD_ms_server2client = calculate_OWD(time_sent_serv, time_rec)
+    Jitter_ms_server2client = jitter_s2c.jitter / (10 ** 6)
+    loss_server2client = tracker_s2c.loss_percent()
+    kernel_drops = read_kernel_drops()
+    receive_rate_Mbps = calculate_send_rate(elapsed_time)
+
+    if verbose:
+        print(f"Total Data Downloaded: {GREEN}{total_bytes / (1024 ** 2):.2f} {WHITE}MegaBytes\n" \
+              f"OWD Server2Client: OWD={GREEN}{OWD_ms_server2client:.3f} {WHITE}ms | Jitter={GREEN}{Jitter_ms_server2client:.3f}{WHITE}\n" \
+              f"Latency Server2Client (ms): {format_percentiles(latency_s2c)}\n" \
+              f"Loss Server2Client: {GREEN}{loss_server2client:.3f}{WHITE}% | Lost={tracker_s2c.lost} Reordered={tracker_s2c.reordered} " \
+              f"Duplicates={tracker_s2c.duplicates} Late={tracker_s2c.late} | Kernel Drops={kernel_drops}\n" \
+              f"Throughput: {GREEN}{throughput_MBps:.3f} {WHITE}MBps \n" \
+              f"Receive Rate: {GREEN}{receive_rate_Mbps:.3f} {WHITE}Mbit/s{format_target_rate()}\n" \
+              f"{format_stack_delay()}" \
+              f"Elapsed Time: {GREEN}{elapsed_time:.3f} {WHITE}Seconds\n")
+
+    # Nothing travels client-to-server but the requests, those series stay at 0
+    log_sample({**stack_delay_sample(),
+                "OWD Server": 0.0,
+                "OWD Client": OWD_ms_server2client,
+                "RTT": 0.0,
+                "Throughput": throughput_MBps,
+                "Send Rate": receive_rate_Mbps,
+                "Jitter Client": 0.0,
+                "Jitter Server": Jitter_ms_server2client,
+                "Tail Latency Client": 0.0,
+                "Tail Latency Server": latency_s2c.quantile(95) / (10 ** 6),
+                "Loss % Client": 0.0,
+                "Loss % Server": loss_server2client,
+                "Reorder Client": 0,
+                "Reorder Server": tracker_s2c.reordered,
+                "Lost Server2Client": tracker_s2c.lost,
+                "Kernel Drops Client": kernel_drops,
+                "Time": elapsed_time})
+    return time_rec
+
+def process_reply(buffer, nbytes, time_rec, t_interval, prev_time, start_time):
+    header = parse_header(buffer, nbytes)
+    if header is None:
+        return prev_time # Not one of our packets
+    seq, time_sent_serv = header[0], header[1]
+    track_reply(header[4:])
+
+    # Match the reply back to the packet it acknowledges
+    time_sent2serv = in_flight.pop(seq, None)
+    if profiler is not None:
+        profiler.lap("decode")
+    if time_sent2serv is None:
+        return prev_time # Late reply for an expired packet
+    if trace_writer is not None:
+        trace_writer.record(seq, time_sent2serv, time_sent_serv, time_rec, nbytes, trace.DIRECTION_ECHO)
+    return record_reply(time_sent2serv, time_sent_serv, time_rec,
+                        t_interval, prev_time, start_time)
+
+def track_reply(reply_fields):
+    """Feed the reply sequence to the server-to-client tracker and keep the
+    server's newest client-to-server counts."""
+    global counts_c2s
+    tracker_s2c.update(reply_fields[0])
+    if reply_fields[0] == tracker_s2c.highest:
+        counts_c2s = reply_fields
+
+def calculate_loss_percent(lost, received):
+    expected = lost + received
+    return 100 * lost / expected if expected > 0 else 0.0
+
+def record_reply(time_sent2serv, time_sent_serv, time_rec, t_interval, prev_time, start_time):
+    """Account for one acknowledged packet and sample it into results_log once per interval."""
+    global total_bytes
+
+    total_bytes += packet_size
     
     elapsed_time = (time_rec - start_time) / (10 ** 9)
     throughput_MBps = (total_bytes / (1024 ** 2)) / elapsed_time
+
+    # Computed for every reply, only sampled into the log once per interval
+    OWD_ms_client2server = calculate_OWD(time_sent2serv, time_sent_serv)
+    OWD_ms_server2client = calculate_OWD(time_sent_serv, time_rec)
+    RTT_ms = calculate_OWD(time_sent2serv, time_rec)
+    send_rate_Mbps = calculate_send_rate(elapsed_time)
+
+    # Streaming Jitter (RFC 3550) & latency histograms, updated on every packet
+    jitter_c2s.update(time_sent_serv - time_sent2serv)
+    jitter_s2c.update(time_rec - time_sent_serv)
+    latency_c2s.record(time_sent_serv - time_sent2serv)
+    latency_s2c.record(time_rec - time_sent_serv)
     
     delay = (time_rec - prev_time) / (10 ** 9)
     if delay >= t_interval:
-        # One way Delay Server & Client
-        OWD_ms_client2server = calculate_OWD(time_sent2serv, time_sent_serv)
-        OWD_ms_server2client = calculate_OWD(time_sent_serv, time_rec)
-        
-        # Used to calculate Jitter
-        owds_c2s.append(OWD_ms_client2server)
-        owds_s2c.append(OWD_ms_server2client)
-        
-        # Jitter Calculation for Server & Client
-        Jitter_ms_client2server = calculate_jitter(owds_c2s)
-        Jitter_ms_server2client = calculate_jitter(owds_s2c)
+        # Jitter for Server & Client
+        Jitter_ms_client2server = jitter_c2s.jitter / (10 ** 6)
+        Jitter_ms_server2client = jitter_s2c.jitter / (10 ** 6)
 
         # Tail Latency of the 95th percentile for Server & Client
-        tail_latency_client = calculate_tail_latency(owds_c2s, percentile=95)
-        tail_latency_server = calculate_tail_latency(owds_s2c, percentile=95)
+        tail_latency_client = latency_c2s.quantile(95) / (10 ** 6)
+        tail_latency_server = latency_s2c.quantile(95) / (10 ** 6)
 
-        print(f"Total Packets Sent: {GREEN}{packets_sent}{WHITE}\n" \
-              f"Total Data Received: {GREEN}{total_bytes / (1024 ** 2):.2f} {WHITE}MegaBytes\n" \
-              f"OWD Client2Server: OWD={GREEN}{OWD_ms_client2server:.3f} {WHITE}ms | Jitter={GREEN}{Jitter_ms_client2server:.3f}{WHITE}\n" \
-              f"OWD Server2Client: OWD={GREEN}{OWD_ms_server2client:.3f} {WHITE}ms | Jitter={GREEN}{Jitter_ms_server2client:.3f}{WHITE}\n" \
-              f"Throughput: {GREEN}{throughput_MBps:.3f} {WHITE}MBps \n" \
-              f"Elapsed Time: {GREEN}{elapsed_time:.3f} {WHITE}Seconds\n")
+        # Loss & reordering, client-to-server as counted by the server
+        replies_c2s, lost_c2s, reordered_c2s, duplicates_c2s = counts_c2s
+        loss_client2server = calculate_loss_percent(lost_c2s, replies_c2s + 1 - duplicates_c2s)
+        loss_server2client = tracker_s2c.loss_percent()
+        # Lost replies the client's own socket dropped are host overload, not network loss
+        kernel_drops = read_kernel_drops()
 
-        results_log['OWD Server'].append(OWD_ms_client2server)
-        results_log['OWD Client'].append(OWD_ms_server2client)
-        results_log['Throughput'].append(throughput_MBps)
-        results_log["Jitter Client"].append(Jitter_ms_client2server)
-        results_log["Jitter Server"].append(Jitter_ms_server2client)
-        results_log["Tail Latency Client"].append(tail_latency_client)
-        results_log["Tail Latency Server"].append(tail_latency_server)
-        results_log['Time'].append(elapsed_time)
+        if verbose:
+            print(f"Total Packets Sent: {GREEN}{packets_sent}{WHITE} | In Flight: {GREEN}{len(in_flight)}{WHITE}\n" \
+                  f"Total Data Received: {GREEN}{total_bytes / (1024 ** 2):.2f} {WHITE}MegaBytes\n" \
+                  f"OWD Client2Server: OWD={GREEN}{OWD_ms_client2server:.3f} {WHITE}ms | Jitter={GREEN}{Jitter_ms_client2server:.3f}{WHITE}\n" \
+                  f"OWD Server2Client: OWD={GREEN}{OWD_ms_server2client:.3f} {WHITE}ms | Jitter={GREEN}{Jitter_ms_server2client:.3f}{WHITE}\n" \
+                  f"Latency Client2Server (ms): {format_percentiles(latency_c2s)}\n" \
+                  f"Latency Server2Client (ms): {format_percentiles(latency_s2c)}\n" \
+                  f"Loss Client2Server: {GREEN}{loss_client2server:.3f}{WHITE}% | Lost={lost_c2s} Reordered={reordered_c2s} Duplicates={duplicates_c2s}\n" \
+                  f"Loss Server2Client: {GREEN}{loss_server2client:.3f}{WHITE}% | Lost={tracker_s2c.lost} Reordered={tracker_s2c.reordered} " \
+                  f"Duplicates={tracker_s2c.duplicates} Late={tracker_s2c.late} | Reorder Distance: {tracker_s2c.format_reorder_distance()} | " \
+                  f"Kernel Drops={kernel_drops}\n" \
+                  f"RTT: {GREEN}{RTT_ms:.3f} {WHITE}ms\n" \
+                  f"Throughput: {GREEN}{throughput_MBps:.3f} {WHITE}MBps \n" \
+                  f"Send Rate: {GREEN}{send_rate_Mbps:.3f} {WHITE}Mbit/s{format_target_rate()}\n" \
+                  f"{format_stack_delay()}" \
+                  f"Elapsed Time: {GREEN}{elapsed_time:.3f} {WHITE}Seconds\n")
+
+        log_sample({**stack_delay_sample(),
+                    "OWD Server": OWD_ms_client2server,
+                    "OWD Client": OWD_ms_server2client,
+                    "RTT": RTT_ms,
+                    "Throughput": throughput_MBps,
+                    "Send Rate": send_rate_Mbps,
+                    "Jitter Client": Jitter_ms_client2server,
+                    "Jitter Server": Jitter_ms_server2client,
+                    "Tail Latency Client": tail_latency_client,
+                    "Tail Latency Server": tail_latency_server,
+                    "Loss % Client": loss_client2server,
+                    "Loss % Server": loss_server2client,
+                    "Reorder Client": reordered_c2s,
+                    "Reorder Server": tracker_s2c.reordered,
+                    "Lost Server2Client": tracker_s2c.lost,
+                    "Kernel Drops Client": kernel_drops,
+                    "Time": elapsed_time})
         prev_time = time_sent_serv
 
-    return total_bytes, prev_time
+    return prev_time
+
+def log_sample(sample):
+    if stream_queue is not None:
+        # A parallel stream: the parent logs the samples of every stream
+        queue_, index = stream_queue
+        queue_.put((index, sample))
+    else:
+        results_log.append(sample)
+
+def open_results_log(duration=None, interval=None):
+    """The installed results log, otherwise a ResultsRing sized for a `duration`
+    second run sampled every `interval` seconds, made again for a longer run."""
+    global results_log, own_results_log
+    if results_log is not None and results_log is not own_results_log:
+        return results_log
+    from utils.results_ring import ResultsRing, capacity_for
+    capacity = capacity_for(duration, interval)
+    if results_log is None or results_log.capacity < capacity:
+        results_log = own_results_log = ResultsRing(RESULT_SERIES, capacity)
+    return results_log
+
+def read_kernel_drops():
+    return socket_drops.read() if socket_drops is not None else 0
+
+def open_socket_stats(args, client_sock):
+    """Apply --rcvbuf/--sndbuf, report the sizes granted and start counting kernel drops."""
+    global socket_drops
+    try:
+        rcvbuf, sndbuf = [socket_stats.parse_size(size) if size else None
+                          for size in (getattr(args, "rcvbuf", None), getattr(args, "sndbuf", None))]
+        granted = socket_stats.configure_buffers(client_sock, rcvbuf, sndbuf)
+    except ValueError as err:
+        kill_with_error(f"Invalid socket buffer size: {err}")
+    except OSError as err:
+        kill_with_error("Failed to set the socket buffers", err.errno)
+    if verbose:
+        print(socket_stats.format_buffers(granted))
+    for direction in socket_stats.short_buffers(granted):
+        throw_error(f"The kernel granted a smaller {direction} buffer than requested, " \
+                    f"raise net.core.{'r' if direction == 'receive' else 'w'}mem_max")
+    socket_drops = socket_stats.SocketDrops(client_sock)
+
+def stack_delay_sample():
+    """Median kernel-to-userspace delays (ms) with kernel timestamps, no series otherwise."""
+    if timestamps is None:
+        return {}
+    sample = {"Stack Delay RX": timestamps.rx_delay.quantile(50) / (10 ** 6)}
+    if timestamps.tx:
+        sample["Stack Delay TX"] = timestamps.tx_delay.quantile(50) / (10 ** 6)
+    return sample
+
+def format_stack_delay():
+    if timestamps is None:
+        return ""
+    return f"Stack Delay (ms, userspace vs kernel): {timestamps.summary()}\n"
+
+def format_target_rate():
+    if target_bitrate is None:
+        return ""
+    return f" (requested {target_bitrate / 1e6:.3f} Mbit/s)"
+
+def set_reply_mode(args):
+    """Select the reply mode from --m, returns the bitrate to request in
+    download mode (the server paces the stream) or None."""
+    global reply_mode, target_bitrate
+    reply_mode = MODES[getattr(args, "m", "full")]
+    if reply_mode != MODE_DOWNLOAD:
+        return None
+    target_bitrate = None
+    rate_pps = getattr(args, "r", None)
+    try:
+        bitrate = rate_pps * packet_size * 8 if rate_pps else \
+                  parse_bitrate(getattr(args, "b", None) or DOWNLOAD_BITRATE)
+    except ValueError as err:
+        kill_with_error(f"Invalid bitrate: {err}")
+    target_bitrate = bitrate
+    return bitrate
+
+def set_packet_size(args):
+    """Size the datagrams from --l, with --mtu and no --l to the largest payload
+    that crosses the discovered path MTU unfragmented."""
+    global packet_size, mtu_found
+    size = getattr(args, "l", None)
+    mtu_found = discover_mtu(args) if getattr(args, "mtu", False) else None
+    if size is None:
+        size = min(path_mtu.max_payload(mtu_found), PACKET_SIZE) if mtu_found else PACKET_SIZE
+    elif not HEADER_SIZE <= size <= PACKET_SIZE:
+        kill_with_error(f"Packet size must be between {HEADER_SIZE} and {PACKET_SIZE} bytes")
+    packet_size = size
+
+def discover_mtu(args):
+    """Path MTU to the server found by Don't Fragment probes, None when it cannot be found."""
+    try:
+        mtu, route_mtu = path_mtu.discover((args.a, int(args.p)))
+    except ValueError:
+        kill_with_error("Invalid port number")
+    except OSError as err:
+        throw_error(f"Path MTU discovery failed, packets may be fragmented: {err}")
+        return None
+    if verbose:
+        print(f"Path MTU: {GREEN}{mtu}{WHITE} bytes (kernel route MTU {route_mtu})")
+    return mtu
+
+def report_packet_size(client_sock):
+    """Print the packet size and the IP fragments it is split into on the path."""
+    if not verbose:
+        return
+    mtu = mtu_found or path_mtu.route_mtu(client_sock)
+    print(f"Packet Size: {GREEN}{packet_size}{WHITE} bytes" +
+          (f" - {path_mtu.format_fragments(packet_size, mtu)} at MTU {mtu}" if mtu else ""))
+
+def create_pacer(args):
+    """Build a Pacer from --r (packets/s) or --b (bitrate), None when unpaced."""
+    global target_bitrate
+
+    rate_pps = getattr(args, "r", None)
+    bitrate = getattr(args, "b", None)
+    if not rate_pps and bitrate:
+        try:
+            rate_pps = parse_bitrate(bitrate) / (packet_size * 8)
+        except ValueError as err:
+            kill_with_error(f"Invalid bitrate: {err}")
+    if not rate_pps:
+        target_bitrate = None
+        return None
+    target_bitrate = rate_pps * packet_size * 8
+    return Pacer(rate_pps)
+
+def reset_state(args=None):
+    """Reset the per-experiment counters and buffers shared by both engines."""
+    global total_bytes, packets_sent, next_seq, send_buffer, batch_sender, batch_receiver, download_renew_at
+    global jitter_c2s, jitter_s2c, latency_c2s, latency_s2c, tracker_s2c, counts_c2s, timestamps, socket_drops
+    in_flight.clear()
+    jitter_c2s, jitter_s2c = JitterEstimator(), JitterEstimator()
+    latency_c2s, latency_s2c = LatencyHistogram(), LatencyHistogram()
+    tracker_s2c, counts_c2s = SequenceTracker(), (0, 0, 0, 0)
+    total_bytes, packets_sent, download_renew_at = 0, 0, 0
+    next_seq = 0 # Every flow is a new server session, its sequence starts over
+    send_buffer = PacketBuffer(packet_size)
+    batch_sender = batch_receiver = None
+    timestamps = socket_drops = None
+    open_results_log(getattr(args, "t", None), getattr(args, "i", None))
+
+def open_trace(args):
+    global trace_writer
+    path = getattr(args, "trace", None)
+    trace_writer = trace.TraceWriter(path) if path else None
+
+def close_trace():
+    global trace_writer
+    if trace_writer is not None:
+        trace_writer.close()
+        if verbose:
+            print(f"Trace: {GREEN}{trace_writer.records}{WHITE} packets recorded to {trace_writer.path}")
+        trace_writer = None
+
+def stream_trace_path(path, index):
+    """Per-stream trace file in -P mode: trace.bin -> trace.stream1.bin"""
+    root, dot, extension = path.rpartition(".")
+    return f"{root}.stream{index + 1}.{extension}" if dot else f"{path}.stream{index + 1}"
+
+def open_timestamps(args, client_sock):
+    """Read kernel timestamps on the client socket with --timestamps kernel, when the platform allows."""
+    global timestamps
+    timestamps = None
+    if getattr(args, "timestamps", "user") != "kernel":
+        return
+    if not kernel_timestamps.available():
+        throw_error("Kernel timestamps are not available on this platform, using userspace timestamps")
+        return
+    if batch_receiver is not None:
+        throw_error("Kernel timestamps need one syscall per datagram, using userspace timestamps with --batch")
+        return
+    try:
+        timestamps = kernel_timestamps.KernelTimestamps(client_sock, tx=True)
+    except OSError as err:
+        throw_error("Kernel timestamps are not supported, using userspace timestamps", err.errno)
+        return
+    timestamps.drops = socket_drops
+
+def open_metrics(args, timed=True):
+    """Serve the client's counters and latest interval sample when --metrics is
+    given, along with the packet loop's phase timers unless `timed` is False."""
+    global profiler
+    spec = getattr(args, "metrics", None)
+    profiler = None
+    if not spec:
+        return
+    from utils import metrics
+    if timed:
+        profiler = metrics.PhaseProfiler(CLIENT_PHASES)
+    metrics.register("client", collect_metrics if timed else collect_interval)
+    metrics.serve(spec)
+
+def collect_metrics():
+    counters = [("udp_client_packets_sent_total", "Packets sent to the server", packets_sent),
+                ("udp_client_bytes_received_total", "Bytes received from the server", total_bytes),
+                ("udp_client_replies_total", "Packets received from the server", tracker_s2c.received),
+                ("udp_client_lost_total", "Server-to-client packets lost", tracker_s2c.lost),
+                ("udp_client_reordered_total", "Server-to-client packets reordered", tracker_s2c.reordered),
+                ("udp_client_duplicates_total", "Server-to-client duplicate packets", tracker_s2c.duplicates)]
+    collected = [(metric, "counter", description, [({}, value)]) for metric, description, value in counters]
+    collected.append(("udp_client_in_flight", "gauge", "Packets awaiting a reply", [({}, len(in_flight))]))
+    if socket_drops is not None:
+        collected += [("udp_client_socket_drops_total", "counter", "Datagrams dropped by the kernel at the client socket",
+                       [({}, socket_drops.read())]),
+                      ("udp_client_rx_queue_bytes", "gauge", "Bytes waiting in the client socket's receive buffer",
+                       [({}, socket_drops.rx_queue)])]
+    collected += collect_interval()
+    if profiler is not None:
+        collected += profiler.metrics("client")
+    return collected
+
+def summary():
+    """Totals of the last single-stream flow, latencies and jitter in ms."""
+    replies_c2s, lost_c2s, reordered_c2s, duplicates_c2s = counts_c2s
+    return {"Packet Size": packet_size,
+            "Packets Sent": packets_sent,
+            "Bytes Received": total_bytes,
+            "Replies": tracker_s2c.received,
+            "Loss % Client": calculate_loss_percent(lost_c2s, replies_c2s + 1 - duplicates_c2s) if packets_sent else 0.0,
+            "Loss % Server": tracker_s2c.loss_percent(),
+            "Lost Client2Server": lost_c2s,
+            "Lost Server2Client": tracker_s2c.lost,
+            "Reorder Client": reordered_c2s,
+            "Reorder Server": tracker_s2c.reordered,
+            "Kernel Drops Client": read_kernel_drops(),
+            "Jitter Client": jitter_c2s.jitter / (10 ** 6),
+            "Jitter Server": jitter_s2c.jitter / (10 ** 6),
+            "Latency Client2Server": {f"p{percentile:g}": value / (10 ** 6)
+                                      for percentile, value in latency_c2s.quantiles().items()},
+            "Latency Server2Client": {f"p{percentile:g}": value / (10 ** 6)
+                                      for percentile, value in latency_s2c.quantiles().items()}}
+
+def collect_interval():
+    if results_log is None or not len(results_log):
+        return []
+    return [("udp_client_interval", "gauge", "Latest interval sample of each results series",
+             [({"series": key}, results_log.last(key)) for key in RESULT_SERIES])]
+
+def report_send_rate(start_time):
+    elapsed_time = (time.time_ns() - start_time) / (10 ** 9)
+    send_rate_Mbps = calculate_send_rate(elapsed_time)
+    print(f"Send Rate: {GREEN}{send_rate_Mbps:.3f} {WHITE}Mbit/s{format_target_rate()}")
+    return send_rate_Mbps
+
+def stream_series(key, index):
+    return f"{key} Stream {index + 1}"
+
+def stream_main(args, index, results):
+    """Entry point of one parallel stream process: a normal single-stream client."""
+    global verbose, stream_queue
+    verbose, stream_queue = False, (results, index)
+    args.P = 1
+    args.metrics = None # Served by the parent only
+    if getattr(args, "trace", None):
+        args.trace = stream_trace_path(args.trace, index)
+    send_rate_Mbps = client_main(args)
+    results.put((index, {"Packets Sent": packets_sent, "Send Rate": send_rate_Mbps,
+                         "Latency Client2Server": latency_c2s, "Latency Server2Client": latency_s2c}))
+    results.put((index, None))
+
+def result_series(streams=1):
+    """Every results_log series of a run with `streams` parallel streams."""
+    series = list(RESULT_SERIES)
+    if streams > 1:
+        series += [stream_series(key, index) for index in range(streams)
+                   for key in RESULT_SERIES if key != "Time"]
+    return series
+
+def aggregate_streams(latest, start_time):
+    """Append one row of aggregate and per-stream series from each stream's latest sample."""
+    row = {"Time": (time.time_ns() - start_time) / (10 ** 9)}
+    for key in RESULT_SERIES:
+        if key == "Time":
+            continue
+        values = [sample.get(key, 0.0) for sample in latest]
+        for index, value in enumerate(values):
+            row[stream_series(key, index)] = value
+        combine = STREAM_AGGREGATES.get(key, lambda v: sum(v) / len(v))
+        row[key] = combine(values)
+    results_log.append(row)
+
+def run_parallel(args, streams):
+    """Run `streams` client flows in separate processes and merge their interval
+    samples into results_log as aggregate and "<series> Stream N" series."""
+    import queue
+    import multiprocessing
+    set_packet_size(args)
+    stream_args = argparse.Namespace(**{key: getattr(args, key) for key in dir(args)
+                                        if not key.startswith("_")})
+    stream_args.l, stream_args.mtu = packet_size, False # Discovered once for every stream
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=stream_main, args=(stream_args, index, results), daemon=True)
+                 for index in range(streams)]
+
+    open_results_log(args.t, args.i)
+    for key in result_series(streams):
+        results_log.add_column(key)
+    open_metrics(args, timed=False) # The streams' packet loops run in their own processes
+
+    print(f"Starting {streams} parallel streams to {args.a}:{args.p}...")
+    start_time = time.time_ns()
+    for process in processes:
+        process.start()
+
+    latest = [{} for _ in range(streams)]
+    summaries = [{} for _ in range(streams)]
+    fresh, finished = set(), set()
+    while len(finished) < streams:
+        try:
+            index, sample = results.get(timeout=args.i)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        if sample is None:
+            finished.add(index)
+        elif "Packets Sent" in sample:
+            summaries[index] = sample
+        else:
+            latest[index] = sample
+            fresh.add(index)
+        # One row per round, once every stream still running has a new sample
+        if fresh and fresh >= set(range(streams)) - finished and all(latest):
+            aggregate_streams(latest, start_time)
+            fresh.clear()
+            print(f"Streams: {streams} | Throughput: {GREEN}{results_log.last('Throughput'):.3f} {WHITE}MBps | " \
+                  f"Send Rate: {GREEN}{results_log.last('Send Rate'):.3f} {WHITE}Mbit/s | " \
+                  f"Elapsed Time: {GREEN}{results_log.last('Time'):.3f} {WHITE}Seconds")
+
+    for process in processes:
+        process.join()
+    for index, summary in enumerate(summaries):
+        if summary:
+            print(f"Stream {index + 1}: Packets Sent: {GREEN}{summary['Packets Sent']}{WHITE} | " \
+                  f"Send Rate: {GREEN}{summary['Send Rate']:.3f} {WHITE}Mbit/s")
+    total_rate = sum(summary.get("Send Rate", 0.0) for summary in summaries)
+    print(f"Total Send Rate: {GREEN}{total_rate:.3f} {WHITE}Mbit/s over {streams} streams")
+
+    # The streams' histograms merge into exact all-stream percentiles
+    for direction in ("Latency Client2Server", "Latency Server2Client"):
+        merged = LatencyHistogram()
+        for summary in summaries:
+            if direction in summary:
+                merged.merge(summary[direction])
+        print(f"{direction} (ms, all streams): {format_percentiles(merged)}")
+    return total_rate
+
+def asyncio_capable(args):
+    """False for the flows only the blocking loop drives: download streams and kernel timestamps."""
+    return getattr(args, "m", "full") != "download" and getattr(args, "timestamps", "user") != "kernel"
+
 def client_main(args):
+    streams = getattr(args, "P", 1)
+    if streams > 1:
+        return run_parallel(args, streams)
+
+    if getattr(args, "engine", "blocking") == "asyncio" and asyncio_capable(args):
+        import udp_async
+        return udp_async.run(udp_async.run_client(args))
+
+    set_packet_size(args)
+    download_rate = set_reply_mode(args)
     server_ip, port, = args.a, args.p
     t_interval, act_as_client, experiment_duration  = args.i, args.c, args.t
-    udp_pkg_size = args.l
-    global packets_sent
+    window = max(1, getattr(args, "w", 1))
+    # In download mode the server paces the stream, the client only asks for the rate
+    pacer = create_pacer(args) if download_rate is None else None
+    global batch_sender, batch_receiver
 
     try:
         server_port = int(port)
@@ -154,6 +851,22 @@ def client_main(args):
     except socket.error as err:
         kill_with_error("Connection Failed", err.errno)
 
+    # Lets the window recover from lost packets instead of blocking forever
+    client_sock.settimeout(REPLY_TIMEOUT if download_rate is None else DOWNLOAD_RENEW)
+    reset_state(args)
+    open_trace(args)
+    open_metrics(args)
+    batch = getattr(args, "batch", 1)
+    if batch > 1:
+        if batch_io.available():
+            batch_sender = batch_io.BatchSender(client_sock, packet_size, batch)
+            batch_receiver = batch_io.BatchReceiver(client_sock, HEADER_SIZE, batch)
+        else:
+            throw_error("Batched I/O is not available on this platform, using one syscall per datagram")
+    open_socket_stats(args, client_sock)
+    open_timestamps(args, client_sock)
+    report_packet_size(client_sock)
+
     pb.setMaxLimit(experiment_duration * 10, set_msg="Experiment Progress")
     start_time = time.time_ns()
     prev_time = time.time_ns()
@@ -161,10 +874,14 @@ def client_main(args):
     while (time.time_ns() - start_time)/(10**9) < experiment_duration:
         try:
             # time_curr = time.time_ns()
-            status, prev_time = handle_server_packet(client_sock, 
-                                                     t_interval, 
-                                                     prev_time, start_time)
-            packets_sent += 1
+            if download_rate is not None:
+                status, prev_time = handle_download_packet(client_sock, t_interval, prev_time,
+                                                           start_time, download_rate)
+            else:
+                status, prev_time = handle_server_packet(client_sock, 
+                                                         t_interval, 
+                                                         prev_time, start_time,
+                                                         window, pacer)
             if status < 0:
                 print("No packets found")
                 break
@@ -174,6 +891,13 @@ def client_main(args):
             client_sock.close()
             break
 
+    if download_rate is not None and client_sock.fileno() >= 0:
+        request_download(client_sock, 0) # Stop the stream now rather than at DOWNLOAD_TIMEOUT
+    close_trace()
+    if timestamps is not None and verbose:
+        print(format_stack_delay(), end="")
+    return report_send_rate(start_time)
+
 
 
 if __name__ == "__main__":
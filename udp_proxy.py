@@ -0,0 +1,221 @@
+import heapq
+import random
+import socket
+import argparse
+import itertools
+import selectors
+
+import time # Timer package
+
+from utils.impairment import Impairment, DISTRIBUTIONS, parse_burst
+from utils.pacer import parse_bitrate
+from utils.error_handling import kill_with_error, throw_error
+
+GREEN = "\033[0;32m"
+WHITE = "\033[0;37m"
+
+# Userspace impairment proxy: clients send to the proxy, which relays every
+# datagram to the server through one upstream socket per client (so the
+# server still sees one session per client) and relays the replies back.
+# Each direction has its own utils.impairment.Impairment; delayed datagrams
+# wait in one heap ordered by departure time. Sockets are non-blocking and
+# drained up to DRAIN datagrams per wake-up, and unimpaired directions are
+# relayed without touching the heap.
+
+BUFFER_SIZE = 65507  # Maximum UDP payload size
+DRAIN = 64  # Datagrams read from a ready socket before checking the others
+PROXY_IDLE_TIMEOUT = 30.0  # Seconds without traffic before a client's upstream socket is closed
+SOCKET_BUFFER = 4 * 1024 * 1024  # Requested SO_RCVBUF/SO_SNDBUF, bursts of 64 KB datagrams overflow the default
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--a', type=str, default="127.0.0.1",
+        help="IP address the proxy listens on for clients")
+    parser.add_argument('--p', type=str, default="8081",
+        help="Port the proxy listens on for clients")
+    parser.add_argument('--sa', type=str, default="127.0.0.1",
+        help="IP address of the server to relay to")
+    parser.add_argument('--sp', type=str, default="8080",
+        help="Port of the server to relay to")
+    parser.add_argument('--i', type=float, default=2,
+        help="Time Interval between statistics reports")
+
+    parser.add_argument('--delay', type=float, default=0.0,
+        help="One-way delay added in each direction (ms)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+        help="Spread of the delay (ms): half-width (uniform), standard deviation (normal) or scale (pareto)")
+    parser.add_argument('--dist', type=str, default="uniform", choices=list(DISTRIBUTIONS),
+        help="Delay distribution once --jitter is given")
+    parser.add_argument('--loss', type=float, default=0.0,
+        help="Random loss in each direction (%%)")
+    parser.add_argument('--burst', type=str,
+        help="Gilbert-Elliott burst loss P,R[,LOSS_BAD[,LOSS_GOOD]] in %%: P good->bad, R bad->good")
+    parser.add_argument('--reorder', type=float, default=0.0,
+        help="Packets sent without their delay, overtaking the ones before them (%%)")
+    parser.add_argument('--duplicate', type=float, default=0.0,
+        help="Packets delivered twice (%%)")
+    parser.add_argument('--rate', type=str,
+        help="Bandwidth cap in each direction, iperf style (e.g. 100M)")
+    parser.add_argument('--queue', type=int, default=1000,
+        help="Packets queued behind the bandwidth cap before tail drops")
+    parser.add_argument('--seed', type=int,
+        help="Random seed, for reproducible impairment")
+    parser.add_argument('--idle', type=float, default=PROXY_IDLE_TIMEOUT,
+        help="Seconds without traffic before a client's upstream socket is closed")
+
+    return parser.parse_args()
+
+def create_impairments(args):
+    """(client-to-server, server-to-client) Impairments from the arguments."""
+    try:
+        burst = parse_burst(args.burst) if getattr(args, "burst", None) else None
+        rate = parse_bitrate(args.rate) if getattr(args, "rate", None) else None
+    except ValueError as err:
+        kill_with_error(f"Invalid impairment: {err}")
+    seed = getattr(args, "seed", None)
+    return tuple(Impairment(args.delay, args.jitter, args.dist, args.loss, burst, args.reorder,
+                            args.duplicate, rate, args.queue,
+                            random.Random(None if seed is None else seed + direction))
+                 for direction in range(2))
+
+def parse_port(port):
+    try:
+        return int(port)
+    except ValueError:
+        kill_with_error("Invalid port number")
+
+def create_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER) # Capped by net.core.*mem_max
+    sock.setblocking(False)
+    return sock
+
+def create_listen_socket(proxy_ip, port):
+    try:
+        listen_sock = create_socket()
+        listen_sock.bind((proxy_ip, parse_port(port)))
+    except socket.error as err:
+        kill_with_error("Failed to bind proxy address", err.errno)
+    return listen_sock
+
+
+class Proxy:
+    def __init__(self, listen_sock, server_address, c2s, s2c, idle_timeout=PROXY_IDLE_TIMEOUT):
+        self.listen_sock = listen_sock
+        self.server_address = server_address
+        self.c2s = c2s
+        self.s2c = s2c
+        self.idle_timeout_ns = int(idle_timeout * (10 ** 9))
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(listen_sock, selectors.EVENT_READ, None)
+        self.upstreams = {}  # Client address -> [upstream socket, last seen (ns)]
+        self.pending = []  # Heap of (departure ns, order, socket, address or None, datagram)
+        self.order = itertools.count()  # Keeps equal departure times first in, first out
+        self.send_errors = 0
+
+    def upstream(self, client, time_now):
+        entry = self.upstreams.get(client)
+        if entry is None:
+            upstream_sock = create_socket()
+            upstream_sock.connect(self.server_address)
+            self.selector.register(upstream_sock, selectors.EVENT_READ, client)
+            entry = self.upstreams[client] = [upstream_sock, time_now]
+        entry[1] = time_now
+        return entry[0]
+
+    def send(self, sock, address, data):
+        try:
+            if address is None:
+                sock.send(data)
+            else:
+                sock.sendto(data, address)
+        except OSError:
+            self.send_errors += 1 # Full socket buffer or unreachable peer: the path drops it
+
+    def forward(self, impairment, sock, address, data, time_now):
+        if impairment.passthrough:
+            impairment.stats["Forwarded"] += 1
+            self.send(sock, address, data)
+            return
+        for departure in impairment.schedule(len(data), time_now):
+            if departure <= time_now:
+                self.send(sock, address, data)
+            else:
+                heapq.heappush(self.pending, (departure, next(self.order), sock, address, data))
+
+    def receive(self, sock, client):
+        """Relay up to DRAIN datagrams waiting on `sock`, from clients when `client` is None."""
+        for _ in range(DRAIN):
+            try:
+                data, address = sock.recvfrom(BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue # e.g. ICMP port unreachable from a server that is not up yet
+            time_now = time.time_ns()
+            if client is None:
+                self.forward(self.c2s, self.upstream(address, time_now), None, data, time_now)
+            else:
+                self.forward(self.s2c, self.listen_sock, client, data, time_now)
+
+    def release(self, time_now):
+        """Send every delayed datagram that is due, returns seconds until the next one or None."""
+        pending = self.pending
+        while pending and pending[0][0] <= time_now:
+            _, _, sock, address, data = heapq.heappop(pending)
+            self.send(sock, address, data)
+        return (pending[0][0] - time_now) / (10 ** 9) if pending else None
+
+    def evict_idle(self, time_now):
+        for client, (upstream_sock, last_seen) in list(self.upstreams.items()):
+            if time_now - last_seen > self.idle_timeout_ns:
+                self.selector.unregister(upstream_sock)
+                upstream_sock.close()
+                del self.upstreams[client]
+
+    def report(self):
+        print(f"Clients: {len(self.upstreams)} - Delayed: {len(self.pending)} - Send Errors: {self.send_errors}\n" \
+              f"    Client2Server: {self.c2s.summary()}\n" \
+              f"    Server2Client: {self.s2c.summary()}")
+
+    def run(self, t_interval):
+        next_report = time.time_ns() + int(t_interval * (10 ** 9))
+        timeout = None
+        while True:
+            wait = (next_report - time.time_ns()) / (10 ** 9)
+            for key, _ in self.selector.select(max(0.0, wait if timeout is None else min(timeout, wait))):
+                self.receive(key.fileobj, key.data)
+            time_now = time.time_ns()
+            timeout = self.release(time_now)
+            if time_now >= next_report:
+                self.evict_idle(time_now)
+                self.report()
+                next_report = time_now + int(t_interval * (10 ** 9))
+
+    def close(self):
+        for upstream_sock, _ in self.upstreams.values():
+            upstream_sock.close()
+        self.selector.close()
+        self.listen_sock.close()
+
+
+def proxy_main(args):
+    c2s, s2c = create_impairments(args)
+    listen_sock = create_listen_socket(args.a, args.p)
+    server_address = (args.sa, parse_port(args.sp))
+    proxy = Proxy(listen_sock, server_address, c2s, s2c, getattr(args, "idle", PROXY_IDLE_TIMEOUT))
+    print(f"Proxy binded to {args.a}:{args.p}, relaying to {args.sa}:{args.sp}")
+    try:
+        proxy.run(args.i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.report()
+        proxy.close()
+
+
+if __name__ == "__main__":
+    proxy_main(get_args())
@@ -1,12 +1,16 @@
 import socket 
-import random
-import string
+from array import array
 
 import time # Timer Package
-import streamlit as st
 
-# Utilities
+# Utilities (utils.metrics and multiprocessing load when first needed, startup stays fast)
 from utils.error_handling import kill_with_error, throw_error
+from utils.packet import PacketBuffer, parse_header, HEADER_SIZE, MODE_ACK, MODE_ECHO, MODE_DOWNLOAD
+from utils.pacer import Pacer
+from utils import batch_io
+from utils.sessions import SessionTable
+from utils import timestamps as kernel_timestamps
+from utils import socket_stats
 
 
 # ANSI escape codes for colored output
@@ -15,12 +19,32 @@ ORANGE = "\033[0;202m"
 GREEN = "\033[0;32m"
 WHITE = "\033[0;37m"
 
-BUFFER_SIZE = 1024  # Maximum UDP payload size (minus headers)
+BUFFER_SIZE = 65507  # Maximum UDP payload size, datagrams are always read whole
 PACKET_SIZE = 65507
-PACKET_DELIMETER = ';'
+
+recv_buffer = None  # Reusable receive buffer for the server socket
+reply_buffer = None  # Preallocated PacketBuffer patched in place for every reply
+batch_receiver = None  # recvmmsg/sendmmsg backend when --batch > 1 on Linux
+batch_sender = None
+
+SESSION_IDLE_TIMEOUT = 10.0  # Seconds without packets before a client session ends
+sessions = SessionTable(SESSION_IDLE_TIMEOUT)  # Client address -> Session
+
+DOWNLOAD_TIMEOUT = 1.0  # Seconds a download keeps streaming after the client's last request
+downloads = {}  # Client address -> Session with a MODE_DOWNLOAD stream running
+
+WORKER_STATS = ("Packets", "Bytes")  # Counters each worker publishes to shared memory
+worker_stats = None  # Shared multiprocessing.Array in --workers mode, local array with --metrics
+worker_offset = 0  # Start of this worker's counters in worker_stats
+
+SERVER_PHASES = ("wait", "decode", "session", "pack", "send", "report", "download")
+profiler = None  # utils.metrics.PhaseProfiler timing SERVER_PHASES with --metrics
+timestamps = None  # utils.timestamps.KernelTimestamps of the server socket with --timestamps kernel
+socket_drops = None  # utils.socket_stats.SocketDrops: kernel drops at the server socket
+report_sink = None  # Called with every interval report as a dict (headless.py streams them as NDJSON)
 
 import argparse
-def get_args():
+def get_args(argv=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--a', type=str, default="127.0.0.1",
@@ -32,62 +56,224 @@ def get_args():
         help="Time Interval to send requests")
     parser.add_argument('--s', type=bool, default=True,
         help="The program acts as a server")
+    parser.add_argument('--batch', type=int, default=1,
+        help="Datagrams received/replied per syscall (sendmmsg/recvmmsg, Linux only)")
+    parser.add_argument('--workers', type=int, default=1,
+        help="Worker processes sharing the address through SO_REUSEPORT")
+    parser.add_argument('--engine', type=str, default="blocking", choices=["blocking", "asyncio"],
+        help="Blocking socket loop or asyncio event loop (uses uvloop when installed)")
+    parser.add_argument('--idle', type=float, default=SESSION_IDLE_TIMEOUT,
+        help="Seconds without packets before a client session ends and is summarized")
+    parser.add_argument('--metrics', type=str,
+        help="Time each packet loop phase and serve Prometheus metrics on this [HOST:]PORT")
+    parser.add_argument('--timestamps', type=str, default="user", choices=["user", "kernel"],
+        help="Take receive times after recvfrom() (user) or from the kernel (Linux, blocking engine)")
+    parser.add_argument('--rcvbuf', type=str,
+        help="Socket receive buffer size (e.g. 8M), the kernel default when not given")
+    parser.add_argument('--sndbuf', type=str,
+        help="Socket send buffer size (e.g. 8M), the kernel default when not given")
 
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.engine == "asyncio" and (args.workers > 1 or args.batch > 1):
+        parser.error("--workers and --batch need the blocking engine")
+    return args
 
 def calculate_OWD(time_sent, time_rec):
     return (time_rec - time_sent)/ (10 ** 6) # Milliseconds
 
-def prepare_large_packet(time_sent, delimiter, packet_size):
-    base_data = f"{time_sent}{delimiter}"
-    extra_data_size = packet_size - len(base_data.encode())
-    if extra_data_size > 0:
-        extra_data = "X" * extra_data_size
-        return bytes(base_data + extra_data, encoding='utf-8')
-    else:
-        return bytes(base_data[:packet_size], encoding='utf-8')
+def print_session_summary(session):
+    print(f"{GREEN}Session ended{WHITE} - {session.summary()}")
 
+def init_sessions(args):
+    global sessions
+    sessions = SessionTable(getattr(args, "idle", SESSION_IDLE_TIMEOUT), on_close=print_session_summary)
 
+def track_packet(address, seq, nbytes, time_rec, mode=0, time_echo=0, size=0):
+    """Account for the packet in its client's session, returns the reply-only
+    header fields (reply sequence, lost, reordered, duplicates).
 
-def handle_client_packet(server_sock, total_bytes, t_interval, prev_time):
-    packets = server_sock.recvfrom(BUFFER_SIZE)
-    time_rec = time.time_ns()
+    A MODE_DOWNLOAD request also starts, renews or (rate 0) stops the
+    session's download stream, its rate in bits/s rides in time_echo and
+    the size of its datagrams in `size`.
+    """
+    session = sessions.touch(address, nbytes, time_rec)
+    tracker = session.tracker
+    tracker.update(seq)
+    if mode == MODE_DOWNLOAD:
+        request_download(session, time_echo, time_rec, size)
+    return ((tracker.packets - 1) & 0xFFFFFFFF, tracker.lost & 0xFFFFFFFF,
+            tracker.reordered & 0xFFFFFFFF, tracker.duplicates & 0xFFFFFFFF)
 
-    elapsed_time = 0
-    if not packets:
-        print("No data received... Shutting down communication\n \
-                Experiment Finished...")
-        elapsed_time = (time_rec - int(data_msg)) / (10 ** 9)
-        throughput = (total_bytes * 8) / elapsed_time
-        throughput_Mbps = throughput /1e6
-        print(f"Total Bytes Transferred: {total_bytes} bytes")
-        print(f"Elapsed Time: {elapsed_time:.3f} seconds")
-        print(f"Throughput: {throughput_Mbps:.3f} Mbps")
-        return -1, time_rec
-    
-    data_msg = packets[0].decode()
-    data_head = packets[1]
+def requested_size(size):
+    """Reply size a request asked for, PACKET_SIZE when it did not say."""
+    return min(max(size, HEADER_SIZE), PACKET_SIZE) if size else PACKET_SIZE
 
-    packet_values = data_msg.split(PACKET_DELIMETER)
-    time_sent = int(packet_values[0])
-    server_sock.sendto(prepare_large_packet(time_rec, PACKET_DELIMETER, PACKET_SIZE), data_head)
-    total_bytes += len(packets)
-    
-    time_sent = time.time_ns()
+def reply_size(mode, nbytes, size=0):
+    """Bytes to reply to a `nbytes` datagram asking for `size` in `mode`, None for no reply."""
+    if mode == MODE_ACK:
+        return HEADER_SIZE
+    if mode == MODE_ECHO:
+        return nbytes
+    if mode == MODE_DOWNLOAD:
+        return None # Answered by the download stream
+    return requested_size(size)
+
+def request_download(session, rate_bps, time_rec, size=0):
+    if not rate_bps:
+        session.download = None
+        downloads.pop(session.address, None)
+        return
+    session.download_size = requested_size(size)
+    rate_pps = rate_bps / (session.download_size * 8)
+    if session.download is None or session.download.rate_pps != rate_pps:
+        session.download = Pacer(rate_pps)
+    session.download_until = time_rec + int(DOWNLOAD_TIMEOUT * (10 ** 9))
+    downloads[session.address] = session
+
+def send_downloads(sendto, buffer, time_now):
+    """Send every download stream's due datagrams through `sendto`, returns the
+    seconds until the next one is due or None once no download is running."""
+    next_due = None
+    for address, session in list(downloads.items()):
+        if time_now > session.download_until or session.download is None:
+            # The client stopped renewing its request
+            session.download = None
+            del downloads[address]
+            continue
+        tracker = session.tracker
+        while session.download.try_acquire():
+            seq = session.download_seq
+            sendto(buffer.pack(seq, time.time_ns(), 0, MODE_DOWNLOAD, seq & 0xFFFFFFFF,
+                               tracker.lost & 0xFFFFFFFF, tracker.reordered & 0xFFFFFFFF,
+                               tracker.duplicates & 0xFFFFFFFF, size=session.download_size), address)
+            session.download_seq += 1
+        wait = session.download.ns_until_next() / (10 ** 9)
+        next_due = wait if next_due is None else min(next_due, wait)
+    return next_due
+
+def count_packets(packets, nbytes):
+    """Publish this worker's counters, a no-op outside --workers and --metrics modes."""
+    if worker_stats is not None:
+        # Single writer per slot, the parent only reads
+        worker_stats[worker_offset] += packets
+        worker_stats[worker_offset + 1] += nbytes
+
+def report_interval(total_bytes, time_rec, time_sent, t_interval, prev_time, elapsed_time=0, time_now=None):
+    """Print the interval report once t_interval has passed since prev_time. Sessions
+    are timed against `time_now` (the last packet's `time_rec` when not given)."""
     delay = (time_rec - prev_time) / (10 ** 9)
     if delay >= t_interval:
         OWD_ms = calculate_OWD(time_rec, time_sent)
         print(f"Total Data Received (MB): {total_bytes / (1024 ** 2):.2f} - " \
               f"OWD (ms): {OWD_ms} - " \
-              f"Elapsed Time: {elapsed_time}")
+              f"Elapsed Time: {elapsed_time} - " \
+              f"Active Sessions: {len(sessions)}" + \
+              (f" - Kernel Drops: {socket_drops.read()}" if socket_drops is not None else "") + \
+              (f" - Stack Delay (ms): {timestamps.summary()}" if timestamps is not None else ""))
+        report_sessions(time_rec if time_now is None else time_now)
+        if report_sink is not None:
+            report_sink({"Total Bytes": total_bytes, "OWD": OWD_ms, "Elapsed Time": elapsed_time,
+                         "Sessions": len(sessions),
+                         "Kernel Drops": socket_drops.drops if socket_drops is not None else 0})
         
         prev_time = time_rec
+    return prev_time
 
-    return 0, prev_time
+def report_sessions(time_now, max_listed=16):
+    """Close idle sessions and print each active session's interval throughput."""
+    sessions.evict_idle(time_now)
+    listed = len(sessions) <= max_listed
+    for session in sessions:
+        throughput_MBps = session.roll_interval(time_now)
+        if listed:
+            host, port = session.address[:2]
+            print(f"    {host}:{port} - Interval Throughput: {throughput_MBps:.3f} MBps - " \
+                  f"Packets: {session.packets}")
 
-def server_main(args):
-    server_ip, port, t_interval, act_as_server = args.a, args.p, args.i, args.s
+def handle_client_packet(server_sock, total_bytes, t_interval, prev_time):
+    if timestamps is None:
+        nbytes, data_head = server_sock.recvfrom_into(recv_buffer)
+        time_rec = time.time_ns()
+    else:
+        nbytes, data_head = timestamps.recvfrom_into(recv_buffer)
+        time_rec = timestamps.receive_time(time.time_ns())
+    if profiler is not None:
+        profiler.lap("wait")
+
+    header = parse_header(recv_buffer, nbytes)
+    if profiler is not None:
+        profiler.lap("decode")
+    if header is None:
+        return total_bytes, prev_time # Not one of our packets
+
+    # Echo the sequence number and send time so the client can match the reply
+    seq, time_sent, time_echo, mode, size_requested = header[:5]
+    reply_fields = track_packet(data_head, seq, nbytes, time_rec, mode, time_echo, size_requested)
+    size = reply_size(mode, nbytes, size_requested)
+    if profiler is not None:
+        profiler.lap("session")
+    if size is not None:
+        reply = reply_buffer.pack(seq, time_rec, time_sent, mode, *reply_fields, size=size)
+        if profiler is not None:
+            profiler.lap("pack")
+        server_sock.sendto(reply, data_head)
+        if profiler is not None:
+            profiler.lap("send")
+    total_bytes += nbytes
+    count_packets(1, nbytes)
+    
+    time_sent = time.time_ns()
+    prev_time = report_interval(total_bytes, time_rec, time_sent, t_interval, prev_time)
+    if profiler is not None:
+        profiler.lap("report")
+
+    return total_bytes, prev_time
+
+def handle_client_batch(server_sock, total_bytes, t_interval, prev_time):
+    """Same as handle_client_packet for up to --batch datagrams per recvmmsg/sendmmsg."""
+    count = batch_receiver.recv()
+    time_rec = time.time_ns()
+    if profiler is not None:
+        profiler.lap("wait")
+
+    replies = received = 0
+    received_bytes = 0
+    for i in range(count):
+        nbytes = batch_receiver.length(i)
+        header = parse_header(batch_receiver.slot(i), nbytes)
+        if profiler is not None:
+            profiler.lap("decode")
+        if header is None:
+            continue # Not one of our packets
+        seq, time_sent, time_echo, mode, size_requested = header[:5]
+        reply_fields = track_packet(batch_receiver.address(i), seq, nbytes, time_rec, mode, time_echo,
+                                    size_requested)
+        received += 1
+        received_bytes += nbytes
+        size = reply_size(mode, nbytes, size_requested)
+        if profiler is not None:
+            profiler.lap("session")
+        if size is None:
+            continue
+        batch_sender.pack(replies, seq, time_rec, time_sent, mode, *reply_fields, size=size)
+        batch_sender.set_destination(replies, batch_receiver.names, i)
+        replies += 1
+        if profiler is not None:
+            profiler.lap("pack")
+    batch_sender.send(replies)
+    if profiler is not None:
+        profiler.lap("send")
+    total_bytes += received_bytes
+    count_packets(received, received_bytes)
+
+    time_sent = time.time_ns()
+    prev_time = report_interval(total_bytes, time_rec, time_sent, t_interval, prev_time)
+    if profiler is not None:
+        profiler.lap("report")
 
+    return total_bytes, prev_time
+
+def create_server_socket(server_ip, port, reuse_port=False):
     try:
         server_port = int(port)
     except ValueError:
@@ -95,6 +281,9 @@ def server_main(args):
 
     try:
         server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            # Every worker binds the same address, the kernel spreads flows across them
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except socket.error as err:
         kill_with_error("Failed to create a new Socket", err.errno)
 
@@ -105,24 +294,214 @@ def server_main(args):
     except socket.error as err:
         kill_with_error("Failed to bind server address", err.errno)
 
-    print(f"Server binded to {server_ip}:{server_port}")
+    return server_sock
 
-    total_bytes = 0
-    while True:
-        print("Server is listening...")
+def aggregate_worker_stats(stats, workers):
+    """Sum the shared per-worker counters, returns (totals, per-worker rows)."""
+    fields = len(WORKER_STATS)
+    rows = [list(stats[i * fields:(i + 1) * fields]) for i in range(workers)]
+    totals = [sum(column) for column in zip(*rows)]
+    return dict(zip(WORKER_STATS, totals)), rows
+
+def report_workers(stats, workers, t_interval, processes):
+    prev_bytes = 0
+    prev_time = time.time_ns()
+    while any(process.is_alive() for process in processes):
+        time.sleep(t_interval)
+        totals, rows = aggregate_worker_stats(stats, workers)
+        time_now = time.time_ns()
+        rate_MBps = (totals["Bytes"] - prev_bytes) / (1024 ** 2) / ((time_now - prev_time) / (10 ** 9))
+        prev_bytes, prev_time = totals["Bytes"], time_now
+        print(f"Workers: {workers} - " \
+              f"Total Packets: {totals['Packets']} - " \
+              f"Total Data Received (MB): {totals['Bytes'] / (1024 ** 2):.2f} - " \
+              f"Rate: {GREEN}{rate_MBps:.3f}{WHITE} MBps - " \
+              f"Packets per Worker: {[row[0] for row in rows]}")
+        if report_sink is not None:
+            report_sink({"Total Packets": totals["Packets"], "Total Bytes": totals["Bytes"], "Rate": rate_MBps,
+                         "Packets per Worker": [row[0] for row in rows]})
+
+def worker_main(args, index, stats):
+    import multiprocessing
+    global worker_stats, worker_offset, report_sink
+    worker_stats, worker_offset = stats, index * len(WORKER_STATS)
+    args.metrics = None # Served by the parent
+    report_sink = None # The parent reports the aggregate
+    server_sock = create_server_socket(args.a, args.p, reuse_port=True)
+    print(f"Worker {index} (pid {multiprocessing.current_process().pid}) binded to {args.a}:{args.p}")
+    serve(server_sock, args)
+
+def run_workers(args, workers):
+    """Fork `workers` servers sharing one address via SO_REUSEPORT and aggregate
+    their counters through shared memory."""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        kill_with_error("SO_REUSEPORT is not supported on this platform")
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    stats = context.Array('Q', workers * len(WORKER_STATS), lock=False)
+    if getattr(args, "metrics", None):
+        # The parent serves the workers' shared counters, their loops are not timed
+        from utils import metrics
+        metrics.register("server", lambda: collect_worker_metrics(stats, workers))
+        metrics.serve(args.metrics)
+    processes = [context.Process(target=worker_main, args=(args, index, stats), daemon=True)
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        report_workers(stats, workers, args.i, processes)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+def open_socket_stats(args, server_sock):
+    """Apply --rcvbuf/--sndbuf, report the sizes granted and start counting kernel drops."""
+    global socket_drops
+    try:
+        rcvbuf, sndbuf = [socket_stats.parse_size(size) if size else None
+                          for size in (getattr(args, "rcvbuf", None), getattr(args, "sndbuf", None))]
+        granted = socket_stats.configure_buffers(server_sock, rcvbuf, sndbuf)
+    except ValueError as err:
+        kill_with_error(f"Invalid socket buffer size: {err}")
+    except OSError as err:
+        kill_with_error("Failed to set the socket buffers", err.errno)
+    print(socket_stats.format_buffers(granted))
+    for direction in socket_stats.short_buffers(granted):
+        throw_error(f"The kernel granted a smaller {direction} buffer than requested, " \
+                    f"raise net.core.{'r' if direction == 'receive' else 'w'}mem_max")
+    socket_drops = socket_stats.SocketDrops(server_sock)
+
+def open_timestamps(args, server_sock):
+    """Stamp received datagrams with their kernel receive time with --timestamps kernel."""
+    global timestamps
+    timestamps = None
+    if getattr(args, "timestamps", "user") != "kernel":
+        return
+    if not kernel_timestamps.available():
+        throw_error("Kernel timestamps are not available on this platform, using userspace timestamps")
+        return
+    try:
+        timestamps = kernel_timestamps.KernelTimestamps(server_sock)
+    except OSError as err:
+        throw_error("Kernel timestamps are not supported, using userspace timestamps", err.errno)
+        return
+    timestamps.drops = socket_drops
+
+def open_metrics(args):
+    """Time the packet loop phases and serve them with the server's counters
+    when --metrics is given."""
+    global profiler, worker_stats, worker_offset
+    spec = getattr(args, "metrics", None)
+    profiler = None
+    if not spec:
+        return
+    from utils import metrics
+    profiler = metrics.PhaseProfiler(SERVER_PHASES)
+    if worker_stats is None:
+        worker_stats, worker_offset = array('Q', [0] * len(WORKER_STATS)), 0
+    metrics.register("server", collect_metrics)
+    metrics.serve(spec)
+
+def collect_worker_metrics(stats, workers):
+    _, rows = aggregate_worker_stats(stats, workers)
+    return [("udp_server_packets_received_total", "counter", "Packets received from clients",
+             [({"worker": str(index)}, row[0]) for index, row in enumerate(rows)]),
+            ("udp_server_bytes_received_total", "counter", "Bytes received from clients",
+             [({"worker": str(index)}, row[1]) for index, row in enumerate(rows)])]
 
-        start_time = time.time_ns() # High precision
-        prev_time = time.time_ns()
-        communication_log = {}
+def collect_metrics():
+    collected = collect_worker_metrics(worker_stats, len(worker_stats) // len(WORKER_STATS))
+    collected += [("udp_server_sessions", "gauge", "Active client sessions", [({}, len(sessions))]),
+                  ("udp_server_downloads", "gauge", "Download streams running", [({}, len(downloads))])]
+    if socket_drops is not None:
+        collected += [("udp_server_socket_drops_total", "counter", "Datagrams dropped by the kernel at the server socket",
+                       [({}, socket_drops.read())]),
+                      ("udp_server_rx_queue_bytes", "gauge", "Bytes waiting in the server socket's receive buffer",
+                       [({}, socket_drops.rx_queue)])]
+    if profiler is not None:
+        collected += profiler.metrics("server")
+    return collected
+
+def server_main(args):
+    if getattr(args, "engine", "blocking") == "asyncio":
+        if getattr(args, "workers", 1) > 1 or getattr(args, "batch", 1) > 1:
+            throw_error("--workers and --batch need the blocking engine, ignored with asyncio")
+        import udp_async
+        return udp_async.run(udp_async.serve(args))
+
+    workers = getattr(args, "workers", 1)
+    if workers > 1:
+        return run_workers(args, workers)
+
+    server_sock = create_server_socket(args.a, args.p)
+    print(f"Server binded to {args.a}:{args.p}")
+    serve(server_sock, args)
+
+def serve(server_sock, args):
+    t_interval = args.i
+
+    global recv_buffer, reply_buffer, batch_receiver, batch_sender
+    recv_buffer = bytearray(BUFFER_SIZE)
+    reply_buffer = PacketBuffer(PACKET_SIZE)
+
+    open_socket_stats(args, server_sock)
+    handle_packets = handle_client_packet
+    batch = getattr(args, "batch", 1)
+    if batch > 1:
+        if batch_io.available():
+            batch_receiver = batch_io.BatchReceiver(server_sock, BUFFER_SIZE, batch)
+            batch_sender = batch_io.BatchSender(server_sock, PACKET_SIZE, batch)
+            handle_packets = handle_client_batch
+        else:
+            throw_error("Batched I/O is not available on this platform, using one syscall per datagram")
+    if handle_packets is handle_client_batch and getattr(args, "timestamps", "user") == "kernel":
+        throw_error("Kernel timestamps need one syscall per datagram, using userspace timestamps with --batch")
+    else:
+        open_timestamps(args, server_sock)
+
+    init_sessions(args)
+    open_metrics(args)
+    # Wake up periodically so idle sessions are closed even when no packets arrive
+    idle_timeout = min(sessions.idle_timeout_ns / (10 ** 9), t_interval)
+    server_sock.settimeout(idle_timeout)
+
+    total_bytes = 0
+    streaming = False
+    print("Server is listening...")
+    prev_time = time.time_ns()
+    try:
         while True:
             try:
-                status, prev_time = handle_client_packet(server_sock, total_bytes, t_interval, prev_time)
-                if status < 0:
-                    break
-                prev_time = prev_time
-
+                total_bytes, prev_time = handle_packets(server_sock, total_bytes, t_interval, prev_time)
+            except TimeoutError:
+                if profiler is not None:
+                    profiler.lap("wait")
+                    profiler.count("timeouts")
+                sessions.evict_idle(time.time_ns())
             except socket.error as err:
+                if profiler is not None:
+                    profiler.count("socket_errors")
                 throw_error("Error during Communication", error_code=err.errno)
+            if downloads or streaming:
+                # Download streams are paced from this loop: wake up when the next one is due
+                try:
+                    next_due = send_downloads(server_sock.sendto, reply_buffer, time.time_ns())
+                except socket.error as err:
+                    throw_error("Error during Download", error_code=err.errno)
+                    next_due = 0
+                streaming = next_due is not None
+                if profiler is not None:
+                    profiler.lap("download")
+                server_sock.settimeout(idle_timeout if next_due is None else
+                                       min(max(next_due, 1e-4), idle_timeout))
+    finally:
+        downloads.clear()
+        sessions.close_all()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+
+from utils.packet import HEADER, MAGIC, VERSION
+
+# Optional Linux backend moving a batch of datagrams per syscall with
+# sendmmsg(2)/recvmmsg(2), plus UDP GSO/GRO helpers. Callers check available()
+# and keep the one send/recv per datagram path everywhere else.
+MSG_DONTWAIT = 0x40
+MSG_TRUNC = 0x20
+MSG_WAITFORONE = 0x10000
+SOL_UDP = 17
+UDP_SEGMENT = 103
+UDP_GRO = 104
+UDP_MAX_SEGMENTS = 64
+SOCKADDR_SIZE = 128 # sizeof(struct sockaddr_storage)
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(iovec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.sendmmsg, libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int]
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    return libc
+
+libc = _load_libc()
+
+
+def available():
+    return libc is not None
+
+
+def _raise_errno():
+    err = ctypes.get_errno()
+    raise OSError(err, errno.errorcode.get(err, "Unknown error"))
+
+
+def _wait(sock, events):
+    """Honor the socket timeout for the ctypes calls, which bypass Python's own polling."""
+    poller = select.poll()
+    poller.register(sock.fileno(), events)
+    timeout = sock.gettimeout()
+    if not poller.poll(-1 if timeout is None else int(timeout * 1000) or 1):
+        raise TimeoutError("timed out")
+
+
+def decode_sockaddr(name):
+    """Turn a raw IPv4 sockaddr_in back into an (ip, port) tuple."""
+    port, = struct.unpack_from("!H", name, 2)
+    return socket.inet_ntoa(bytes(name[4:8])), port
+
+
+class _MessageVector:
+    """`batch` contiguous slots of `slot_size` bytes wired into an mmsghdr array."""
+
+    def __init__(self, batch, slot_size, with_names=False):
+        self.batch = batch
+        self.slot_size = slot_size
+        self.storage = (ctypes.c_char * (batch * slot_size))()
+        self.view = memoryview(self.storage).cast("B")
+        self.iovecs = (iovec * batch)()
+        self.msgs = (mmsghdr * batch)()
+        self.names = (ctypes.c_char * (batch * SOCKADDR_SIZE))() if with_names else None
+        base = ctypes.addressof(self.storage)
+        for i in range(batch):
+            self.iovecs[i].iov_base = base + i * slot_size
+            self.iovecs[i].iov_len = slot_size
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+            if with_names:
+                hdr.msg_name = ctypes.addressof(self.names) + i * SOCKADDR_SIZE
+                hdr.msg_namelen = SOCKADDR_SIZE
+
+    def slot(self, i):
+        return self.view[i * self.slot_size:(i + 1) * self.slot_size]
+
+
+class BatchSender:
+    """Send up to `batch` packets of `packet_size` bytes with one sendmmsg call.
+
+    Slots are preallocated and padded once; callers patch each header with
+    pack() and flush with send(). Without a destination the socket must be
+    connected, otherwise set_destination() points a slot at a raw sockaddr
+    (e.g. one filled in by BatchReceiver) without copying it.
+    """
+
+    def __init__(self, sock, packet_size, batch):
+        self.sock = sock
+        self.vector = _MessageVector(batch, packet_size)
+        ctypes.memset(self.vector.storage, ord("X"), batch * packet_size)
+
+    def pack(self, i, seq, time_sent, time_echo=0, mode=0, reply_seq=0, lost=0,
+             reordered=0, duplicates=0, size=None):
+        HEADER.pack_into(self.vector.storage, i * self.vector.slot_size,
+                         MAGIC, VERSION, mode, seq, time_sent, time_echo,
+                         reply_seq, lost, reordered, duplicates)
+        size = self.vector.slot_size if size is None else max(size, HEADER.size)
+        self.vector.iovecs[i].iov_len = min(size, self.vector.slot_size)
+
+    def set_destination(self, i, names, j):
+        hdr = self.vector.msgs[i].msg_hdr
+        hdr.msg_name = ctypes.addressof(names) + j * SOCKADDR_SIZE
+        hdr.msg_namelen = SOCKADDR_SIZE
+
+    def send(self, count):
+        """Send the first `count` slots, returns how many the kernel accepted."""
+        sent = 0
+        while sent < count:
+            n = libc.sendmmsg(self.sock.fileno(), ctypes.byref(self.vector.msgs[sent]),
+                              count - sent, MSG_DONTWAIT)
+            if n < 0:
+                if ctypes.get_errno() not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    _raise_errno()
+                _wait(self.sock, select.POLLOUT)
+                continue
+            sent += n
+        return sent
+
+
+class BatchReceiver:
+    """Receive up to `batch` datagrams with one recvmmsg call into reusable slots.
+
+    Datagrams longer than a slot are truncated but length() still reports
+    their real size (MSG_TRUNC), so a slot can be as small as the header.
+    """
+
+    def __init__(self, sock, slot_size, batch):
+        self.sock = sock
+        self.vector = _MessageVector(batch, slot_size, with_names=True)
+        self.names = self.vector.names
+
+    def recv(self):
+        """Block (up to the socket timeout) for at least one datagram, return the count."""
+        for hdr in self.vector.msgs:
+            hdr.msg_hdr.msg_namelen = SOCKADDR_SIZE
+        while True:
+            n = libc.recvmmsg(self.sock.fileno(), self.vector.msgs, self.vector.batch,
+                              MSG_DONTWAIT | MSG_WAITFORONE | MSG_TRUNC, None)
+            if n >= 0:
+                return n
+            if ctypes.get_errno() not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                _raise_errno()
+            _wait(self.sock, select.POLLIN)
+
+    def length(self, i):
+        return self.vector.msgs[i].msg_len
+
+    def slot(self, i):
+        return self.vector.slot(i)
+
+    def address(self, i):
+        return decode_sockaddr(self.names[i * SOCKADDR_SIZE:(i + 1) * SOCKADDR_SIZE])
+
+
+def gso_supported(sock):
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+        return True
+    except OSError:
+        return False
+
+
+def send_gso(sock, buffer, segment_size):
+    """Send a buffer of back-to-back datagrams as one UDP GSO super-packet.
+
+    The kernel splits it into `segment_size` datagrams, so the total must stay
+    below 64 KB and UDP_MAX_SEGMENTS segments: useful for small packets only.
+    """
+    return sock.sendmsg([buffer], [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", segment_size))])
+
+
+def enable_gro(sock):
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+        return True
+    except OSError:
+        return False
+
+
+def recv_gro(sock, buffer):
+    """Receive a (possibly GRO coalesced) read, return (segment lengths, address)."""
+    nbytes, ancdata, _, address = sock.recvmsg_into([buffer], socket.CMSG_SPACE(4))
+    segment_size = nbytes
+    for level, kind, data in ancdata:
+        if level == SOL_UDP and kind == UDP_GRO:
+            segment_size, = struct.unpack("=i", data[:4])
+    lengths = [min(segment_size, nbytes - offset) for offset in range(0, nbytes, segment_size or 1)]
+    return lengths, address
@@ -5,9 +5,48 @@ class args_client:
     c = True
     l = 1024
     t = 10
+    w = 1
+    b = None
+    r = None
+    batch = 1
+    engine = "blocking"
+    P = 1
+    m = "full"
+    trace = None
+    metrics = None
+    timestamps = "user"
+    rcvbuf = None
+    sndbuf = None
+    mtu = False
 
 class args_server:
     a = "127.0.0.1"
     p = "8080"
     i = 1.0
-    s = True
\ No newline at end of file
+    s = True
+    batch = 1
+    workers = 1
+    engine = "blocking"
+    idle = 10.0
+    metrics = None
+    timestamps = "user"
+    rcvbuf = None
+    sndbuf = None
+
+class args_proxy:
+    a = "127.0.0.1"
+    p = "8081"
+    sa = "127.0.0.1"
+    sp = "8080"
+    i = 2.0
+    delay = 0.0
+    jitter = 0.0
+    dist = "uniform"
+    loss = 0.0
+    burst = None
+    reorder = 0.0
+    duplicate = 0.0
+    rate = None
+    queue = 1000
+    seed = None
+    idle = 30.0
\ No newline at end of file
@@ -0,0 +1,93 @@
+import json
+import socket
+import time # Timer package
+
+# Control plane of distributed experiments: agent.py runs on every node and
+# coordinator.py (or the dashboard) drives them over TCP. Messages are JSON
+# objects, one per line; every request carries a "cmd" and is answered by one
+# response with "ok" and, when false, an "error". Agents run each role as a
+# headless.py subprocess, so the coordinator only ever sees its NDJSON lines.
+
+DEFAULT_PORT = 9400
+CONNECT_TIMEOUT = 5.0  # Seconds to reach an agent and for it to answer a request
+CLOCK_SAMPLES = 8  # Round trips per agent, the fastest gives the clock offset
+MAX_LINE = 16 * 1024 * 1024  # Longest message accepted, a results batch of a long run
+
+
+def parse_agent(spec, default_port=DEFAULT_PORT):
+    """"host[:port]" -> (host, port)"""
+    host, _, port = spec.strip().rpartition(":") if ":" in spec else (spec.strip(), "", "")
+    try:
+        return host, int(port) if port else default_port
+    except ValueError:
+        raise ValueError(f"Invalid agent address: {spec}")
+
+def parse_agents(specs):
+    """Comma- or whitespace-separated "host[:port]" list -> ["host:port"]"""
+    agents = []
+    for spec in specs.replace(",", " ").split():
+        host, port = parse_agent(spec)
+        agents.append(f"{host}:{port}")
+    return agents
+
+def send_message(stream, message):
+    stream.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    stream.flush()
+
+def read_message(stream):
+    """Next message of a stream, None once the peer has closed it."""
+    line = stream.readline(MAX_LINE)
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class AgentConnection:
+    """A coordinator's connection to one agent.
+
+    request() raises RuntimeError when the agent cannot be reached or
+    answers with an error.
+    """
+
+    def __init__(self, spec, timeout=CONNECT_TIMEOUT):
+        self.spec = spec
+        self.address = parse_agent(spec)
+        try:
+            self.sock = socket.create_connection(self.address, timeout=timeout)
+        except OSError as err:
+            raise RuntimeError(f"Cannot reach agent {spec}: {err}")
+        self.stream = self.sock.makefile("rwb")
+        self.offset = 0.0  # Agent clock - coordinator clock (s)
+        self.rtt = None  # Fastest round trip of clock_offset() (s)
+
+    def request(self, cmd, **fields):
+        try:
+            send_message(self.stream, {"cmd": cmd, **fields})
+            response = read_message(self.stream)
+        except (OSError, ValueError) as err:
+            raise RuntimeError(f"Agent {self.spec} failed on '{cmd}': {err}")
+        if response is None:
+            raise RuntimeError(f"Agent {self.spec} closed the connection on '{cmd}'")
+        if not response.get("ok"):
+            raise RuntimeError(f"Agent {self.spec}: {response.get('error', 'request failed')}")
+        return response
+
+    def clock_offset(self, samples=CLOCK_SAMPLES):
+        """Estimate the agent's clock offset NTP style: the agent's time against
+        the midpoint of the fastest round trip, whose error is at most half of it."""
+        best = None
+        for _ in range(samples):
+            sent = time.time()
+            agent_time = self.request("hello")["time"]
+            received = time.time()
+            if best is None or received - sent < best[0]:
+                best = (received - sent, agent_time - (sent + received) / 2)
+        self.rtt, self.offset = best
+        return self.offset
+
+    def close(self):
+        try:
+            self.stream.close()
+            self.sock.close()
+        except OSError:
+            pass
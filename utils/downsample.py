@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of `threshold` points of (x, y) picked by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. Every bucket in between keeps
+    the point forming the largest triangle with the point kept before it and
+    the average of the next bucket, which preserves peaks and dips that plain
+    decimation would drop.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1  # Bucket starts, then n - 1
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    kept = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[kept] - next_x) * (y[start:end] - y[kept]) -
+                      (x[kept] - x[start:end]) * (next_y - y[kept]))
+        kept = start + int(np.argmax(area))
+        indices[bucket + 1] = kept
+    return indices
+
+
+def downsample(x, columns, threshold):
+    """Downsample several series sharing the x axis: the union of each series'
+    LTTB points, so every series keeps its own shape. Returns (x, columns)."""
+    if len(x) <= threshold:
+        return x, columns
+    keep = np.unique(np.concatenate([lttb_indices(x, values, threshold) for values in columns.values()]))
+    return x[keep], {label: values[keep] for label, values in columns.items()}
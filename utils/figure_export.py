@@ -0,0 +1,113 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# End of run figure export. Figures render in a small process pool (matplotlib
+# holds the GIL while drawing) into one directory per run, and every rendered
+# figure is kept in a content-addressed cache so identical data is never
+# drawn twice.
+
+FORMATS = ("jpg", "png", "svg")
+COLORS = ("lightblue", "lightcoral")
+EXPORT_WORKERS = 2
+CACHE_LIMIT = 256  # Cached figures kept, oldest removed first
+
+# filename, ((results_log series, legend label), ...), y axis label, title
+FIGURES = (
+    ("throughput_chart", (("Throughput", "Throughput (Mbps)"),),
+     "Throughput (Mbps)", "Throughput Over Time"),
+    ("jitter_chart", (("Jitter Client", "Jitter Client (ms)"), ("Jitter Server", "Jitter Server (ms)")),
+     "Jitter (ms)", "Jitter Over Time"),
+    ("owd_chart", (("OWD Client", "OWD Client (ms)"), ("OWD Server", "OWD Server (ms)")),
+     "OWD (ms)", "One-Way Delay Over Time"),
+    ("tail_latency_chart", (("Tail Latency Client", "Tail Latency Client (ms)"),
+                            ("Tail Latency Server", "Tail Latency Server (ms)")),
+     "Tail Latency (ms)", "Tail Latency Over Time"),
+    ("loss_chart", (("Loss % Client", "Loss Client2Server (%)"), ("Loss % Server", "Loss Server2Client (%)")),
+     "Packet Loss (%)", "Packet Loss Over Time"),
+)
+
+_pool = None
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the caller (the dashboard) runs threads
+        _pool = ProcessPoolExecutor(EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def figure_key(time_axis, series, labels, ylabel, title, fmt, dpi):
+    digest = hashlib.sha1()
+    for values in (time_axis, *series):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    digest.update(repr((labels, ylabel, title, fmt, dpi)).encode())
+    return digest.hexdigest()
+
+def render_figure(path, time_axis, series, labels, ylabel, title, fmt, dpi):
+    from matplotlib.figure import Figure # No pyplot state, one figure per call
+
+    figure = Figure(figsize=(10, 6))
+    axes = figure.subplots()
+    for values, label, color in zip(series, labels, COLORS):
+        axes.plot(time_axis, values, label=label, color=color)
+    axes.set_xlabel("Time (s)")
+    axes.set_ylabel(ylabel)
+    axes.legend()
+    axes.set_title(title)
+    axes.grid(alpha=0.5)
+    figure.tight_layout()
+    figure.savefig(path, format=fmt, dpi=dpi)
+
+def export_figure(directory, cache_dir, filename, time_axis, series, labels, ylabel, title, fmt, dpi):
+    """Worker: write one figure into `directory`, rendering it only on a cache miss."""
+    cached = os.path.join(cache_dir, f"{figure_key(time_axis, series, labels, ylabel, title, fmt, dpi)}.{fmt}")
+    if not os.path.exists(cached):
+        temp_file = f"{cached}.{os.getpid()}.tmp"
+        render_figure(temp_file, time_axis, series, labels, ylabel, title, fmt, dpi)
+        os.replace(temp_file, cached)
+    target = os.path.join(directory, f"{filename}.{fmt}")
+    shutil.copyfile(cached, target)
+    return target
+
+def prune_cache(cache_dir, limit=CACHE_LIMIT):
+    files = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if not name.endswith(".tmp")]
+    if len(files) <= limit:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - limit]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass # Already pruned by a concurrent export
+
+def export_run(results_log, fmt="jpg", dpi=300, root="figures"):
+    """Queue every figure of a run for export into root/run-<timestamp>-<suffix>/.
+
+    Returns (directory, futures) right away, each future resolves to the
+    path of one written figure.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown figure format '{fmt}', expected one of {FORMATS}")
+    cache_dir = os.path.join(root, ".cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Unique suffix: two exports within the same second get directories of their own
+    directory = tempfile.mkdtemp(prefix=time.strftime("run-%Y%m%d-%H%M%S-"), dir=root)
+    prune_cache(cache_dir)
+
+    time_axis = np.asarray(results_log["Time"])
+    futures = []
+    for filename, series_labels, ylabel, title in FIGURES:
+        series = [np.asarray(results_log[key]) for key, _ in series_labels]
+        if not all(len(values) for values in series):
+            continue
+        labels = [label for _, label in series_labels]
+        futures.append(pool().submit(export_figure, directory, cache_dir, filename, time_axis,
+                                     series, labels, ylabel, title, fmt, dpi))
+    return directory, futures
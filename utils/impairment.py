@@ -0,0 +1,120 @@
+import random
+from collections import deque
+
+# Network impairment of one direction of the proxy (udp_proxy.py), netem
+# style: a packet is first dropped at random or in Gilbert-Elliott bursts,
+# then serialized behind the rate limit (tail drop once its queue is full),
+# then held for a delay drawn from the configured distribution. Reordered
+# packets skip the delay and duplicated packets are scheduled twice.
+
+DISTRIBUTIONS = ("constant", "uniform", "normal", "pareto")
+PARETO_ALPHA = 3.0  # Tail of the pareto delay distribution, mean 1.5x the minimum
+IMPAIRMENT_STATS = ("Forwarded", "Lost", "Queue Drops", "Reordered", "Duplicated")
+
+
+class GilbertElliott:
+    """Two-state Markov loss: bursts of loss while in the bad state.
+
+    p and r are the per-packet probabilities of moving good -> bad and
+    bad -> good (mean burst length 1/r), loss_bad and loss_good the loss
+    probabilities within each state.
+    """
+
+    def __init__(self, p, r, loss_bad=1.0, loss_good=0.0, rng=random):
+        self.p = p
+        self.r = r
+        self.loss_bad = loss_bad
+        self.loss_good = loss_good
+        self.rng = rng
+        self.bad = False
+
+    def lose(self):
+        if self.bad:
+            self.bad = self.rng.random() >= self.r
+        else:
+            self.bad = self.rng.random() < self.p
+        return self.rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+def parse_burst(value):
+    """"P,R[,LOSS_BAD[,LOSS_GOOD]]" in percent -> GilbertElliott arguments as probabilities."""
+    fields = [float(field) / 100 for field in str(value).split(",")]
+    if not 2 <= len(fields) <= 4 or not all(0 <= field <= 1 for field in fields):
+        raise ValueError(f"expected P,R[,LOSS_BAD[,LOSS_GOOD]] percentages, got '{value}'")
+    return fields
+
+
+class Impairment:
+    """Departure times of the packets crossing one direction of an impaired path.
+
+    Delays and jitter are in ms, probabilities in percent, the rate in bits/s
+    (None = unlimited) and the queue in packets waiting behind the rate limit.
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, distribution="constant", loss=0.0, burst=None,
+                 reorder=0.0, duplicate=0.0, rate=None, queue=1000, rng=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown delay distribution '{distribution}', expected one of {DISTRIBUTIONS}")
+        self.rng = rng or random.Random()
+        self.delay_ns = delay * (10 ** 6)
+        self.jitter_ns = jitter * (10 ** 6)
+        self.distribution = distribution
+        self.loss = loss / 100
+        self.burst = GilbertElliott(*burst, rng=self.rng) if burst else None
+        self.reorder = reorder / 100
+        self.duplicate = duplicate / 100
+        self.ns_per_bit = 10 ** 9 / rate if rate else None
+        self.queue = queue
+        self.link_free = 0  # When the rate-limited link finishes its backlog (ns)
+        self.backlog = deque()  # Departure times of the packets queued behind the rate limit
+        self.stats = dict.fromkeys(IMPAIRMENT_STATS, 0)
+        self.passthrough = not (delay or jitter or loss or burst or reorder or duplicate or rate)
+
+    def sample_delay(self):
+        if not self.jitter_ns:
+            return self.delay_ns
+        if self.distribution == "uniform":
+            delay = self.rng.uniform(self.delay_ns - self.jitter_ns, self.delay_ns + self.jitter_ns)
+        elif self.distribution == "normal":
+            delay = self.rng.gauss(self.delay_ns, self.jitter_ns)
+        elif self.distribution == "pareto":
+            delay = self.delay_ns + self.jitter_ns * (self.rng.paretovariate(PARETO_ALPHA) - 1)
+        else:
+            delay = self.delay_ns
+        return max(delay, 0.0)
+
+    def schedule(self, nbytes, time_now):
+        """Departure times (ns) of the copies of a `nbytes` packet arriving at
+        `time_now`: none when it is dropped, two when it is duplicated."""
+        stats = self.stats
+        if (self.loss and self.rng.random() < self.loss) or (self.burst is not None and self.burst.lose()):
+            stats["Lost"] += 1
+            return ()
+
+        time_out = time_now
+        if self.ns_per_bit is not None:
+            backlog = self.backlog
+            while backlog and backlog[0] <= time_now:
+                backlog.popleft()
+            if len(backlog) >= self.queue:
+                stats["Queue Drops"] += 1
+                return ()
+            self.link_free = max(time_now, self.link_free) + nbytes * 8 * self.ns_per_bit
+            backlog.append(self.link_free)
+            time_out = self.link_free
+
+        copies = 2 if self.duplicate and self.rng.random() < self.duplicate else 1
+        departures = []
+        for _ in range(copies):
+            if self.reorder and self.rng.random() < self.reorder:
+                stats["Reordered"] += 1
+                departures.append(int(time_out)) # Overtakes the delayed packets queued before it
+            else:
+                departures.append(int(time_out + self.sample_delay()))
+        stats["Forwarded"] += 1
+        stats["Duplicated"] += copies - 1
+        return departures
+
+    def summary(self):
+        return " - ".join(f"{key}: {value}" for key, value in self.stats.items()) + \
+               (f" - Queued: {len(self.backlog)}" if self.ns_per_bit is not None else "")
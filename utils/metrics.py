@@ -0,0 +1,163 @@
+import re
+import time
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.stream_stats import LatencyHistogram
+from utils.error_handling import throw_error
+
+# Optional hot-path instrumentation and a Prometheus endpoint. The packet
+# loops hold a module-level `profiler` that stays None unless --metrics is
+# given, so a disabled profiler costs one `is not None` test per phase.
+# Enabled, every phase lands in a LatencyHistogram allocated up front and the
+# loop never allocates for it. Collectors registered here are rendered in
+# the Prometheus text format on http://<address>/metrics when scraped.
+
+SUMMARY_QUANTILES = (50, 90, 99)
+DEFAULT_ADDRESS = "127.0.0.1"  # Local only unless --metrics names a host
+
+collectors = {}  # name -> callable returning [(metric, kind, help, [(labels, value)])]
+servers = {}  # (host, port) -> ThreadingHTTPServer serving collectors
+
+
+class PhaseProfiler:
+    """Time spent in each phase of a packet loop.
+
+    lap(phase) charges the time since the previous lap to `phase`, so a
+    loop calling it at every phase boundary accounts for all of its time.
+    """
+
+    def __init__(self, phases):
+        self.phases = tuple(phases)
+        self.histograms = {phase: LatencyHistogram() for phase in self.phases}
+        self.totals = dict.fromkeys(self.phases, 0)  # ns
+        self.counters = {}
+        self.last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        elapsed = now - self.last
+        self.last = now
+        self.histograms[phase].record(elapsed)
+        self.totals[phase] += elapsed
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def breakdown(self):
+        """{phase: share of the loop's time (0-1)}"""
+        total = sum(self.totals.values())
+        return {phase: self.totals[phase] / total if total else 0.0 for phase in self.phases}
+
+    def metrics(self, role):
+        """Prometheus metrics of the phases and counters, labelled with `role`."""
+        samples, sums, counts = [], [], []
+        for phase in self.phases:
+            histogram = self.histograms[phase]
+            labels = {"role": role, "phase": phase}
+            for percentile in SUMMARY_QUANTILES:
+                samples.append(({**labels, "quantile": percentile / 100},
+                                histogram.quantile(percentile) / (10 ** 9)))
+            sums.append((labels, self.totals[phase] / (10 ** 9)))
+            counts.append((labels, histogram.total))
+        events = [({"role": role, "event": event}, count) for event, count in self.counters.items()]
+        return [("udp_phase_seconds", "summary", "Time per packet loop phase", samples),
+                ("udp_phase_seconds_sum", None, None, sums),
+                ("udp_phase_seconds_count", None, None, counts),
+                ("udp_events_total", "counter", "Packet loop events", events)]
+
+
+def register(name, collector):
+    """Serve `collector()`'s metrics under `name`, replacing an earlier one."""
+    collectors[name] = collector
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def render():
+    """Every registered collector's metrics in the Prometheus text format."""
+    lines = []
+    described = set()
+    for collector in list(collectors.values()):
+        for metric, kind, description, samples in collector():
+            if kind is not None and metric not in described:
+                described.add(metric)
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} {kind}")
+            lines += [f"{metric}{format_labels(labels)} {float(value)!r}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes would flood the experiment's output
+
+
+def parse_address(spec):
+    """"PORT" or "HOST:PORT" -> (host, port)"""
+    host, _, port = str(spec).rpartition(":")
+    return host or DEFAULT_ADDRESS, int(port)
+
+def serve(spec):
+    """Serve /metrics on `spec` ("PORT" or "HOST:PORT") from a daemon thread, once per address."""
+    try:
+        address = parse_address(spec)
+    except ValueError:
+        throw_error(f"Invalid metrics address: {spec}")
+        return None
+    if address not in servers:
+        try:
+            servers[address] = ThreadingHTTPServer(address, MetricsHandler)
+        except OSError as err:
+            throw_error(f"Failed to serve metrics on {address[0]}:{address[1]}", err.errno)
+            return None
+        servers[address].daemon_threads = True
+        threading.Thread(target=servers[address].serve_forever, daemon=True).start()
+    return servers[address]
+
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse(text):
+    """Prometheus text -> [(metric, {label: value}, value)]"""
+    samples = []
+    for line in text.splitlines():
+        match = SAMPLE.match(line.strip())
+        if match is None:
+            continue # Comments and blank lines
+        metric, labels, value = match.groups()
+        samples.append((metric, dict(LABEL.findall(labels or "")), float(value)))
+    return samples
+
+def scrape(spec, timeout=1.0):
+    """Samples of the /metrics endpoint at `spec`, None when it cannot be reached."""
+    host, port = parse_address(spec)
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=timeout) as response:
+            return parse(response.read().decode())
+    except (OSError, ValueError):
+        return None
+
+def phase_breakdown(samples):
+    """{role: {phase: seconds}} from the udp_phase_seconds_sum samples of scrape()."""
+    breakdown = {}
+    for metric, labels, value in samples or ():
+        if metric == "udp_phase_seconds_sum":
+            breakdown.setdefault(labels["role"], {})[labels["phase"]] = value
+    return breakdown
@@ -0,0 +1,59 @@
+import time
+
+SPIN_THRESHOLD_NS = 200_000  # Busy-wait the last stretch, sleep() overshoots by tens of us
+BITRATE_UNITS = {"": 1, "k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9}
+
+
+def parse_bitrate(value):
+    """Parse an iperf style bitrate ("200M", "1.5G", "64k" or plain bits/s) into bits/s."""
+    value = str(value).strip()
+    unit = value[-1].lower() if value and value[-1].isalpha() else ""
+    if unit not in BITRATE_UNITS:
+        raise ValueError(f"Unknown bitrate unit '{value[-1]}'")
+    bitrate = float(value[:-1] if unit else value) * BITRATE_UNITS[unit]
+    if bitrate <= 0:
+        raise ValueError("Bitrate must be positive")
+    return bitrate
+
+
+class Pacer:
+    """Token bucket that spreads packets evenly at `rate_pps` packets per second.
+
+    Tokens accrue continuously from a monotonic clock. When the sender falls
+    behind (a stall, a blocked send) it may catch up by at most `burst`
+    packets at once, so the average rate holds without unbounded bursts.
+    """
+
+    def __init__(self, rate_pps, burst=8):
+        self.rate_pps = rate_pps
+        self.interval_ns = 10 ** 9 / rate_pps
+        self.burst = burst
+        self.tokens = 1.0
+        self.last = time.perf_counter_ns()
+
+    def _refill(self):
+        now = time.perf_counter_ns()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) / self.interval_ns)
+        self.last = now
+
+    def try_acquire(self):
+        """Take one token if available, never blocks."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def ns_until_next(self):
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return int((1 - self.tokens) * self.interval_ns)
+
+    def wait(self):
+        """Block until a token is available: coarse sleep first, then spin."""
+        remaining = self.ns_until_next()
+        if remaining > SPIN_THRESHOLD_NS:
+            time.sleep((remaining - SPIN_THRESHOLD_NS) / (10 ** 9))
+        while self.ns_until_next() > 0:
+            pass
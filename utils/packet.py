@@ -0,0 +1,53 @@
+import struct
+
+# Wire format shared by udp_client and udp_server. Every datagram starts with
+# a fixed binary header; the rest of the datagram is padding up to the
+# requested packet size and is never parsed.
+MAGIC = 0x5544 # "UD"
+VERSION = 2
+# magic, version, mode, seq, time sent (ns), time echoed (ns), then reply-only
+# fields: the server's own reply sequence and its client-to-server lost,
+# reordered and duplicate counts for this flow. In requests the reply
+# sequence field carries the reply size the client wants (0 = MAX_PACKET_SIZE)
+HEADER = struct.Struct("!HBBQQQIIII")
+HEADER_SIZE = HEADER.size
+MAX_PACKET_SIZE = 65507
+
+# Reply modes, chosen by the client in the mode byte of every packet it sends
+MODE_FULL = 0  # Reply with a datagram of the requested size whatever was sent
+MODE_ACK = 1  # Reply with the header only, measures upload on its own
+MODE_ECHO = 2  # Reply with as many bytes as were received
+MODE_DOWNLOAD = 3  # Server streams datagrams of the requested size to the client at a requested rate
+MODES = {"full": MODE_FULL, "ack": MODE_ACK, "echo": MODE_ECHO, "download": MODE_DOWNLOAD}
+# A MODE_DOWNLOAD request carries the requested bitrate (bits/s) in the
+# time echoed field; a rate of 0 stops the stream
+
+
+class PacketBuffer:
+    """Preallocated datagram reused for every send on a socket.
+
+    Only the header is rewritten in place, the padding is filled once, so
+    sending does not allocate or copy the payload.
+    """
+
+    def __init__(self, packet_size):
+        self.buffer = bytearray(b"X" * max(packet_size, HEADER_SIZE))
+        self.view = memoryview(self.buffer)
+
+    def pack(self, seq, time_sent, time_echo=0, mode=0, reply_seq=0, lost=0, reordered=0,
+             duplicates=0, size=None):
+        """Patch the header, returns a view of the first `size` bytes (whole buffer by default)."""
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, mode, seq, time_sent, time_echo,
+                         reply_seq, lost, reordered, duplicates)
+        return self.view if size is None else self.view[:max(size, HEADER_SIZE)]
+
+
+def parse_header(buffer, nbytes):
+    """Return (seq, time_sent, time_echo, mode, reply_seq, lost, reordered, duplicates)
+    or None for foreign/short datagrams."""
+    if nbytes < HEADER_SIZE:
+        return None
+    magic, version, mode, seq, time_sent, time_echo, *reply_fields = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return (seq, time_sent, time_echo, mode, *reply_fields)
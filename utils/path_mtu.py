@@ -0,0 +1,140 @@
+import sys
+import socket
+import time # Timer package
+
+from utils.packet import PacketBuffer, parse_header, HEADER_SIZE, MAX_PACKET_SIZE, MODE_ACK
+
+# Path MTU and IP fragmentation (IPv4, Linux). A datagram larger than the
+# path MTU leaves the host as several IP fragments and is lost whole when any
+# one of them is, so the loss a large datagram sees grows with its fragment
+# count. The kernel's view of the path MTU (the route's MTU, lowered by ICMP
+# "fragmentation needed" messages) is read with IP_MTU; discover() checks it
+# end to end by sending Don't Fragment probes to the server in MODE_ACK and
+# binary searching the largest one acknowledged, which also finds paths that
+# drop large datagrams without an ICMP message (RFC 8899 style).
+
+LINUX = sys.platform.startswith("linux")
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)  # Set DF, sends beyond the cached path MTU fail
+IP_PMTUDISC_PROBE = getattr(socket, "IP_PMTUDISC_PROBE", 3)  # Set DF, ignore the cached path MTU
+IP_HEADER_SIZE = 20
+UDP_HEADER_SIZE = 8
+MIN_MTU = 576  # Every IPv4 host accepts datagrams of this size
+PROBE_TIMEOUT = 0.2  # Seconds to wait for a probe's acknowledgement
+PROBE_ATTEMPTS = 3  # Probes of a size sent before it is considered too large
+FRAGMENT_STEPS = (1, 2, 4, 8, 16, 32)  # Fragment counts whose boundaries size_boundaries() straddles
+
+
+def available():
+    return LINUX
+
+def max_payload(mtu, fragments=1):
+    """Largest UDP payload that crosses a `mtu` path in `fragments` IP fragments."""
+    # Every fragment but the last carries a multiple of 8 bytes
+    per_fragment = (mtu - IP_HEADER_SIZE) // 8 * 8
+    return (fragments - 1) * per_fragment + mtu - IP_HEADER_SIZE - UDP_HEADER_SIZE
+
+def fragments(payload, mtu):
+    """IP fragments a `payload` byte UDP datagram is split into on a `mtu` path."""
+    ip_payload = payload + UDP_HEADER_SIZE
+    if ip_payload <= mtu - IP_HEADER_SIZE:
+        return 1
+    per_fragment = (mtu - IP_HEADER_SIZE) // 8 * 8
+    return 1 + -(-(ip_payload - (mtu - IP_HEADER_SIZE)) // per_fragment)
+
+def format_fragments(payload, mtu):
+    count = fragments(payload, mtu)
+    return f"{count} IP fragment{'s' if count > 1 else ''}"
+
+def size_boundaries(mtu):
+    """Payload sizes straddling the fragmentation boundaries of a `mtu` path: for
+    each count of FRAGMENT_STEPS the largest size of that many fragments and one
+    byte more, then MAX_PACKET_SIZE."""
+    sizes = set()
+    for count in FRAGMENT_STEPS:
+        size = max_payload(mtu, count)
+        if size >= MAX_PACKET_SIZE:
+            break
+        sizes.update((size, size + 1))
+    sizes.add(MAX_PACKET_SIZE)
+    return sorted(sizes)
+
+def route_mtu(sock):
+    """The kernel's path MTU towards a connected socket's peer, None when unknown."""
+    if not LINUX:
+        return None
+    try:
+        return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None # Not connected, or not IPv4
+
+
+class MTUProbe:
+    """Don't Fragment probes from a dedicated socket connected to the server."""
+
+    def __init__(self, address, timeout=PROBE_TIMEOUT, attempts=PROBE_ATTEMPTS):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(address)
+        self.sock.settimeout(timeout)
+        self.attempts = attempts
+        self.buffer = PacketBuffer(MAX_PACKET_SIZE)
+        self.reply = bytearray(HEADER_SIZE)
+        self.seq = 0
+
+    def route_mtu(self):
+        # DO mode makes IP_MTU report the path MTU the kernel has cached
+        self.sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        return route_mtu(self.sock)
+
+    def fits(self, size):
+        """True once the server acknowledges a `size` byte probe sent with DF set."""
+        self.sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        for _ in range(self.attempts):
+            seq = self.seq
+            self.seq += 1
+            try:
+                self.sock.send(self.buffer.pack(seq, time.time_ns(), 0, MODE_ACK, size=size))
+            except OSError:
+                return False # EMSGSIZE: larger than the interface MTU
+            deadline = time.monotonic() + self.sock.gettimeout()
+            while time.monotonic() < deadline:
+                try:
+                    nbytes = self.sock.recv_into(self.reply)
+                except OSError:
+                    break # Timed out, or an ICMP error such as fragmentation needed
+                header = parse_header(self.reply, nbytes)
+                if header is not None and header[0] == seq:
+                    return True
+        return False
+
+    def close(self):
+        self.sock.close()
+
+
+def discover(address, timeout=PROBE_TIMEOUT, attempts=PROBE_ATTEMPTS):
+    """(path MTU, kernel route MTU) towards a running server at `address`.
+
+    Raises OSError when the platform cannot set Don't Fragment or the
+    server does not acknowledge even a header-only probe.
+    """
+    if not available():
+        raise OSError("IP_MTU_DISCOVER is only available on Linux")
+    probe = MTUProbe(address, timeout, attempts)
+    try:
+        kernel_mtu = probe.route_mtu() or MIN_MTU
+        low, high = HEADER_SIZE, min(max_payload(kernel_mtu), MAX_PACKET_SIZE)
+        if probe.fits(high):
+            return kernel_mtu, kernel_mtu # The usual case, one round trip
+        if not probe.fits(low):
+            raise OSError(f"No reply from {address[0]}:{address[1]} to MTU probes")
+        high -= 1
+        while low < high:
+            size = (low + high + 1) // 2
+            if probe.fits(size):
+                low = size
+            else:
+                high = size - 1
+        return low + IP_HEADER_SIZE + UDP_HEADER_SIZE, kernel_mtu
+    finally:
+        probe.close()
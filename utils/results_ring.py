@@ -0,0 +1,174 @@
+import json
+import math
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAX_CAPACITY = 86400  # Rows kept at most, a day of one-second samples
+DEFAULT_CAPACITY = MAX_CAPACITY  # Rows kept when the run's length is not known
+CAPACITY_MARGIN = 16  # Rows beyond one per interval: late final samples, the slot being written
+# Shared memory layout: row count, capacity, columns, column names length
+# (int64 each), the column names as JSON, then the data at an 8 byte boundary
+SHARED_HEADER_SIZE = 32
+
+
+def capacity_for(duration, interval):
+    """Rows for a run of `duration` seconds sampled every `interval` seconds, so a
+    ring (of every column, with -P in shared memory) is not preallocated for a day."""
+    if not duration or not interval or interval <= 0:
+        return DEFAULT_CAPACITY
+    return min(MAX_CAPACITY, math.ceil(duration / interval) + CAPACITY_MARGIN)
+
+def open_shared_memory(name, track=True):
+    """Attach to an existing block; track=False leaves unlinking it to its owner."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=track)
+    except TypeError:
+        # Before Python 3.13 every attach is tracked and unlinked at exit
+        shm = shared_memory.SharedMemory(name=name)
+        if not track:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class ResultsRing:
+    """Fixed-capacity columnar log of interval samples.
+
+    Every column is a row of one preallocated float64 array, so memory stays
+    flat however long the run and the oldest rows are overwritten once
+    `capacity` is reached. There is a single writer (the client's sampling
+    loop); readers call latest() from any thread and get the newest rows of
+    every column from one consistent point in time, copying only what they ask
+    for. The row counter is published after the row is written and a reader
+    retries if the writer lapped the rows it was copying; the slot being
+    written is never readable, so capacity - 1 rows are retained.
+
+    create_shared() places the ring in named shared memory so another process
+    can attach() and read it the same way; its columns are then fixed.
+    """
+
+    def __init__(self, columns, capacity=DEFAULT_CAPACITY):
+        self.base_columns = list(columns)
+        self.capacity = capacity
+        self.shm = None
+        self.counter = np.zeros(1, dtype=np.int64)  # Rows ever appended, the next goes to count % capacity
+        self.reset()
+
+    @classmethod
+    def create_shared(cls, columns, capacity=DEFAULT_CAPACITY):
+        names = json.dumps(list(columns)).encode()
+        data_offset = -(-(SHARED_HEADER_SIZE + len(names)) // 8) * 8
+        shm = shared_memory.SharedMemory(create=True, size=data_offset + len(columns) * capacity * 8)
+        np.ndarray((4,), dtype=np.int64, buffer=shm.buf)[:] = (0, capacity, len(columns), len(names))
+        shm.buf[SHARED_HEADER_SIZE:SHARED_HEADER_SIZE + len(names)] = names
+        ring = cls._from_shared(shm)
+        ring.data[:] = np.nan
+        return ring
+
+    @classmethod
+    def attach(cls, name, track=False):
+        """Read (or write) a ring created by create_shared() in another process."""
+        return cls._from_shared(open_shared_memory(name, track))
+
+    @classmethod
+    def _from_shared(cls, shm):
+        ring = cls.__new__(cls)
+        header = np.ndarray((4,), dtype=np.int64, buffer=shm.buf)
+        _, capacity, columns, names_length = (int(value) for value in header)
+        ring.base_columns = json.loads(bytes(shm.buf[SHARED_HEADER_SIZE:SHARED_HEADER_SIZE + names_length]))
+        ring.columns = {name: index for index, name in enumerate(ring.base_columns)}
+        ring.capacity = capacity
+        ring.shm = shm
+        ring.counter = header[:1]
+        ring.data = np.ndarray((columns, capacity), dtype=np.float64, buffer=shm.buf,
+                               offset=-(-(SHARED_HEADER_SIZE + names_length) // 8) * 8)
+        return ring
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    @property
+    def count(self):
+        return int(self.counter[0])
+
+    def close(self, unlink=False):
+        """Detach from shared memory (a no-op for a local ring), unlink=True frees it."""
+        if self.shm is None:
+            return
+        # Snapshots are copies, only these views reference the block
+        self.data = self.counter = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+
+    def reset(self):
+        """Drop every row and any column added since construction (not for use mid-run)."""
+        self.counter[0] = 0
+        if self.shm is not None:
+            self.data[:] = np.nan
+            return
+        self.columns = {name: index for index, name in enumerate(self.base_columns)}
+        self.data = np.full((len(self.columns), self.capacity), np.nan)
+
+    def add_column(self, name):
+        """Add an all-NaN column, call before the writer starts."""
+        if name in self.columns:
+            return
+        if self.shm is not None:
+            raise ValueError(f"Shared results ring has no column '{name}'")
+        self.columns[name] = len(self.columns)
+        self.data = np.vstack([self.data, np.full((1, self.capacity), np.nan)])
+
+    def append(self, sample):
+        """Write one row from a {column: value} dict, missing columns are NaN."""
+        count = self.count
+        slot = count % self.capacity
+        self.data[:, slot] = np.nan
+        for name, value in sample.items():
+            self.data[self.columns[name], slot] = value
+        self.counter[0] = count + 1
+
+    def __len__(self):
+        return min(self.count, self.capacity - 1)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(list(self.columns))
+
+    def keys(self):
+        return list(self.columns)
+
+    def __getitem__(self, name):
+        return self.latest(columns=[name])[name]
+
+    def last(self, name, default=0.0):
+        """Newest value of one column without copying the history."""
+        count = self.count
+        if not count:
+            return default
+        return float(self.data[self.columns[name], (count - 1) % self.capacity])
+
+    def latest(self, n=None, columns=None):
+        """{column: array of the newest `n` rows (all retained by default), oldest first}."""
+        return self.since(0, columns, n)[0]
+
+    def since(self, start, columns=None, n=None):
+        """Rows appended after the first `start`, at most the newest `n` (rows already
+        overwritten are skipped), returns ({column: array}, next start)."""
+        names = list(self.columns) if columns is None else columns
+        indices = [self.columns[name] for name in names]
+        while True:
+            count = self.count
+            rows = min(count - start, count if n is None else n, self.capacity - 1)
+            first, end = (count - rows) % self.capacity, count % self.capacity
+            if first < end or rows == 0:
+                block = self.data[indices, first:first + rows]
+            else:
+                block = np.concatenate((self.data[indices, first:], self.data[indices, :end]), axis=1)
+            # Rows written meanwhile overwrite the oldest slots, retry if ours were among them
+            if self.count - count < self.capacity - rows:
+                return dict(zip(names, block)), count
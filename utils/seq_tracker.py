@@ -0,0 +1,59 @@
+REORDER_BUCKETS = 16  # log2 buckets of reorder distance: 1, 2-3, 4-7, ...
+
+
+class SequenceTracker:
+    """Receive-side loss, reordering and duplicate accounting for one flow.
+
+    Keeps a sliding bitmap of the last `window` sequence numbers below the
+    highest one seen (bit i set = highest - i arrived). Gaps below the highest
+    sequence count as lost until the packet shows up; anything older than the
+    window is counted as late since it can no longer be told from a duplicate.
+    Sequence numbers start at 0.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.bitmap = 0
+        self.highest = -1
+        self.packets = 0  # Every datagram, duplicates included
+        self.received = 0  # Unique sequence numbers
+        self.reordered = 0
+        self.duplicates = 0
+        self.late = 0
+        self.reorder_distance = [0] * REORDER_BUCKETS
+
+    def update(self, seq):
+        self.packets += 1
+        if seq > self.highest:
+            shift = seq - self.highest
+            self.bitmap = ((self.bitmap << shift) | 1) & self.mask if shift < self.window else 1
+            self.highest = seq
+            self.received += 1
+            return
+
+        distance = self.highest - seq
+        if distance >= self.window:
+            self.late += 1
+            self.received += 1
+            return
+        bit = 1 << distance
+        if self.bitmap & bit:
+            self.duplicates += 1
+            return
+        self.bitmap |= bit
+        self.received += 1
+        self.reordered += 1
+        self.reorder_distance[min(distance.bit_length() - 1, REORDER_BUCKETS - 1)] += 1
+
+    @property
+    def lost(self):
+        return max(0, self.highest + 1 - self.received)
+
+    def loss_percent(self):
+        expected = self.highest + 1
+        return 100 * self.lost / expected if expected > 0 else 0.0
+
+    def format_reorder_distance(self):
+        return " ".join(f"{1 << bucket}-{(2 << bucket) - 1}:{count}" if bucket else f"1:{count}"
+                        for bucket, count in enumerate(self.reorder_distance) if count) or "none"
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+from utils.seq_tracker import SequenceTracker
+
+
+class Session:
+    """Per-client state kept by the server for one address."""
+
+    __slots__ = ("address", "packets", "bytes", "first_seen", "last_seen",
+                 "interval_packets", "interval_bytes", "interval_start", "tracker",
+                 "download", "download_seq", "download_until", "download_size")
+
+    def __init__(self, address, time_now):
+        self.address = address
+        self.packets = 0
+        self.bytes = 0
+        self.first_seen = time_now
+        self.last_seen = time_now
+        self.interval_packets = 0
+        self.interval_bytes = 0
+        self.interval_start = time_now
+        self.tracker = SequenceTracker()
+        self.download = None  # Pacer while the client has a MODE_DOWNLOAD stream running
+        self.download_seq = 0  # Datagrams streamed to the client so far
+        self.download_until = 0  # Stream stops at this time unless the client renews it
+        self.download_size = 0  # Bytes per streamed datagram
+
+    def duration(self):
+        return (self.last_seen - self.first_seen) / (10 ** 9)
+
+    def throughput(self):
+        duration = self.duration()
+        return self.bytes / (1024 ** 2) / duration if duration > 0 else 0.0 # MBps
+
+    def roll_interval(self, time_now):
+        """Return the throughput (MBps) since the last call and start a new interval."""
+        elapsed = (time_now - self.interval_start) / (10 ** 9)
+        throughput = self.interval_bytes / (1024 ** 2) / elapsed if elapsed > 0 else 0.0
+        self.interval_packets = self.interval_bytes = 0
+        self.interval_start = time_now
+        return throughput
+
+    def summary(self):
+        host, port = self.address[:2]
+        return f"Session {host}:{port} - Packets: {self.packets} - " \
+               f"Data Received (MB): {self.bytes / (1024 ** 2):.2f} - " \
+               f"Duration: {self.duration():.3f} s - Throughput: {self.throughput():.3f} MBps - " \
+               f"Loss: {self.tracker.loss_percent():.3f}% - Reordered: {self.tracker.reordered} - " \
+               f"Duplicates: {self.tracker.duplicates}" + \
+               (f" - Download Packets Sent: {self.download_seq}" if self.download_seq else "")
+
+
+class SessionTable:
+    """Sessions keyed by client address with O(1) idle eviction.
+
+    The OrderedDict is kept in last-seen order (every packet moves its session
+    to the end), so the idle sessions are always at the front and eviction
+    only ever looks at the oldest entry. Memory stays bounded by the number of
+    clients active within `idle_timeout`.
+    """
+
+    def __init__(self, idle_timeout, on_close=None):
+        self.idle_timeout_ns = int(idle_timeout * (10 ** 9))
+        self.on_close = on_close
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(self.sessions.values())
+
+    def touch(self, address, nbytes, time_now):
+        session = self.sessions.get(address)
+        if session is None:
+            session = self.sessions[address] = Session(address, time_now)
+        else:
+            self.sessions.move_to_end(address)
+        session.packets += 1
+        session.bytes += nbytes
+        session.interval_packets += 1
+        session.interval_bytes += nbytes
+        session.last_seen = time_now
+        return session
+
+    def evict_idle(self, time_now):
+        """Close every session idle for longer than the timeout, oldest first."""
+        evicted = 0
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if time_now - session.last_seen < self.idle_timeout_ns:
+                break
+            self.sessions.popitem(last=False)
+            self._close(session)
+            evicted += 1
+        return evicted
+
+    def close_all(self):
+        while self.sessions:
+            _, session = self.sessions.popitem(last=False)
+            self._close(session)
+
+    def _close(self, session):
+        if self.on_close is not None:
+            self.on_close(session)
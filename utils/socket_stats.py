@@ -0,0 +1,104 @@
+import os
+import sys
+import socket
+import struct
+
+# Socket buffer sizing and kernel drop accounting. A receive buffer of the
+# default size holds only a few 64 KB datagrams, a burst beyond it is
+# dropped by the kernel before the application sees it and shows up as
+# network loss. The kernel counts those drops per socket (sk_drops): it is
+# the drops column of /proc/net/udp, and the SO_RXQ_OVFL ancillary data
+# that recvmsg() returns with each datagram once the option is enabled.
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+SO_SNDBUFFORCE = getattr(socket, "SO_SNDBUFFORCE", 32)
+PROC_TABLES = {socket.AF_INET: "/proc/net/udp", socket.AF_INET6: "/proc/net/udp6"}
+DROP_COUNT = struct.Struct("@I")
+# getsockopt() reports twice the size set on Linux, the extra half is its bookkeeping
+GRANTED_FACTOR = 2 if sys.platform.startswith("linux") else 1
+
+
+def parse_size(value):
+    """Parse a buffer size ("4M", "256k" or plain bytes, binary units) into bytes."""
+    value = str(value).strip()
+    unit = value[-1].lower() if value and value[-1].isalpha() else ""
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"Unknown size unit '{value[-1]}'")
+    size = int(float(value[:-1] if unit else value) * SIZE_UNITS[unit])
+    if size <= 0:
+        raise ValueError("Size must be positive")
+    return size
+
+def set_buffer(sock, option, force_option, size):
+    """Request a `size` byte buffer, beyond net.core.*mem_max when privileged,
+    returns the size granted (Linux doubles the request for its bookkeeping)."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, option, size) # Capped by net.core.*mem_max
+    return sock.getsockopt(socket.SOL_SOCKET, option)
+
+def configure_buffers(sock, rcvbuf=None, sndbuf=None):
+    """Apply the requested receive/send buffer sizes (None keeps the kernel's),
+    returns {"receive": (requested, granted), "send": (requested, granted)}."""
+    granted = {}
+    for direction, size, option, force_option in (("receive", rcvbuf, socket.SO_RCVBUF, SO_RCVBUFFORCE),
+                                                   ("send", sndbuf, socket.SO_SNDBUF, SO_SNDBUFFORCE)):
+        if size:
+            granted[direction] = (size, set_buffer(sock, option, force_option, size))
+        else:
+            granted[direction] = (None, sock.getsockopt(socket.SOL_SOCKET, option))
+    return granted
+
+def format_buffers(granted):
+    parts = []
+    for direction, (requested, size) in granted.items():
+        parts.append(f"{direction} {size // 1024} KB" +
+                     (f" (requested {requested // 1024} KB)" if requested else " (kernel default)"))
+    return "Socket buffers: " + ", ".join(parts)
+
+def short_buffers(granted):
+    """Directions granted less than requested, e.g. capped by net.core.rmem_max."""
+    return [direction for direction, (requested, size) in granted.items()
+            if requested and size // GRANTED_FACTOR < requested]
+
+
+class SocketDrops:
+    """Kernel drop counter and receive queue of one UDP socket."""
+
+    def __init__(self, sock):
+        self.inode = os.fstat(sock.fileno()).st_ino
+        self.table = PROC_TABLES.get(sock.family)
+        self.drops = 0  # Datagrams the kernel dropped for this socket since it was opened
+        self.rx_queue = 0  # Bytes waiting in the receive buffer at the last read
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except OSError:
+            pass # Only /proc/net/udp then
+
+    def note_ancillary(self, level, kind, data):
+        """Take the drop count from a SO_RXQ_OVFL control message, True when it was one."""
+        if level != socket.SOL_SOCKET or kind != SO_RXQ_OVFL or len(data) < DROP_COUNT.size:
+            return False
+        self.drops = max(self.drops, DROP_COUNT.unpack_from(data)[0])
+        return True
+
+    def read(self):
+        """Refresh drops and rx_queue from /proc/net/udp, returns the drop count."""
+        if self.table is None:
+            return self.drops
+        inode = str(self.inode)
+        try:
+            with open(self.table) as proc_table:
+                next(proc_table) # Header
+                for line in proc_table:
+                    fields = line.split()
+                    if len(fields) > 12 and fields[9] == inode:
+                        self.rx_queue = int(fields[4].split(":")[1], 16)
+                        self.drops = max(self.drops, int(fields[-1]))
+                        break
+        except (OSError, StopIteration, ValueError):
+            pass # No procfs (other platforms, some sandboxes): SO_RXQ_OVFL counts only
+        return self.drops
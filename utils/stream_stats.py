@@ -0,0 +1,108 @@
+# Constant-memory statistics updated on every packet instead of recomputed
+# over the whole history each reporting interval.
+
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS  # Values below this get exact buckets
+HALF_COUNT = SUB_COUNT // 2  # Buckets per power of two above it (~1.6% resolution)
+BUCKET_COUNT = SUB_COUNT + (64 - SUB_BITS) * HALF_COUNT  # Covers every 64-bit value
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+class JitterEstimator:
+    """RFC 3550 interarrival jitter: J += (|D(i-1, i)| - J) / 16 per packet.
+
+    `transit` is any per-packet delay in a fixed unit (e.g. OWD in ns); a
+    constant clock offset between the hosts cancels out in D.
+    """
+
+    def __init__(self):
+        self.jitter = 0.0
+        self.prev_transit = None
+
+    def update(self, transit):
+        if self.prev_transit is not None:
+            self.jitter += (abs(transit - self.prev_transit) - self.jitter) / 16
+        self.prev_transit = transit
+        return self.jitter
+
+
+def bucket_index(value):
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return SUB_COUNT + (shift - 1) * HALF_COUNT + (value >> shift) - HALF_COUNT
+
+def bucket_bounds(index):
+    if index < SUB_COUNT:
+        return index, index + 1
+    shift = (index - SUB_COUNT) // HALF_COUNT + 1
+    mantissa = (index - SUB_COUNT) % HALF_COUNT + HALF_COUNT
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+    """Log-linear (HDR style) histogram of integer latencies for quantiles.
+
+    Memory is a fixed array of bucket counts whatever the number of samples,
+    record() is a few integer operations and histograms from several streams
+    or workers merge by adding counts. Negative values (clock offset between
+    hosts) are kept in a mirrored array.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.negative_counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = int(value)
+        if value >= 0:
+            self.counts[bucket_index(value)] += 1
+        else:
+            self.negative_counts[bucket_index(-value)] += 1
+        self.total += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        for index, count in enumerate(other.negative_counts):
+            if count:
+                self.negative_counts[index] += count
+        self.total += other.total
+        for bound in (other.min, other.max):
+            if bound is not None:
+                self.min = bound if self.min is None else min(self.min, bound)
+                self.max = bound if self.max is None else max(self.max, bound)
+        return self
+
+    def quantile(self, percentile):
+        """Value at `percentile` (0-100), within one bucket's resolution."""
+        if not self.total:
+            return 0.0
+        rank = max(1, round(self.total * percentile / 100))
+        seen = 0
+        for index in range(BUCKET_COUNT - 1, -1, -1):
+            seen += self.negative_counts[index]
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return self._clamp(-(low + high - 1) / 2)
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return self._clamp((low + high - 1) / 2)
+        return float(self.max)
+
+    def _clamp(self, value):
+        return float(min(max(value, self.min), self.max))
+
+    def quantiles(self, percentiles=PERCENTILES):
+        return {percentile: self.quantile(percentile) for percentile in percentiles}
@@ -0,0 +1,127 @@
+import sys
+import socket
+import struct
+from collections import deque
+
+from utils.stream_stats import LatencyHistogram
+
+# Kernel packet timestamps (Linux). A userspace time.time_ns() taken after
+# recvfrom() returns includes the scheduling delay and GIL waits of the
+# process; the kernel stamps the datagram when the stack receives it and
+# hands the stamp over as ancillary data of recvmsg(). Send timestamps come
+# back through the socket's error queue once the datagram leaves the stack,
+# tagged with a per-socket counter (SOF_TIMESTAMPING_OPT_ID) matched here to
+# the caller's key. Every kernel stamp is compared with the userspace time so
+# the stack's share of the measured delays can be reported.
+
+LINUX = sys.platform.startswith("linux")
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)  # Receive stamps only, as SCM_TIMESTAMPNS
+SO_TIMESTAMPING = getattr(socket, "SO_TIMESTAMPING", 37)  # Receive and send stamps, as SCM_TIMESTAMPING
+SOF_TIMESTAMPING_TX_SOFTWARE = 1 << 1
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_OPT_ID = 1 << 7
+SOF_TIMESTAMPING_OPT_TSONLY = 1 << 11
+RX_FLAGS = SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE
+# Send stamps queue up on the error queue (charged to the receive buffer) until drained
+TX_FLAGS = SOF_TIMESTAMPING_TX_SOFTWARE | SOF_TIMESTAMPING_OPT_ID | SOF_TIMESTAMPING_OPT_TSONLY
+MSG_ERRQUEUE = 0x2000
+IP_RECVERR = 11
+SO_EE_ORIGIN_TIMESTAMPING = 4
+
+TIMESPEC = struct.Struct("@qq")  # struct timespec: seconds, nanoseconds
+EXTENDED_ERR = struct.Struct("@IBBBBII")  # struct sock_extended_err, ee_data holds the OPT_ID counter
+PENDING_LIMIT = 65536  # Sends remembered while their stamps are outstanding, the oldest are forgotten
+# Receive stamps, send stamps with their extended error, an SO_RXQ_OVFL drop count
+ANCILLARY_SIZE = (socket.CMSG_SPACE(3 * TIMESPEC.size) + socket.CMSG_SPACE(EXTENDED_ERR.size + 16) +
+                  socket.CMSG_SPACE(4)) if hasattr(socket, "CMSG_SPACE") else 0
+
+
+def available():
+    return LINUX and hasattr(socket.socket, "recvmsg_into")
+
+def timespec_ns(data, offset=0):
+    seconds, nanoseconds = TIMESPEC.unpack_from(data, offset)
+    return seconds * (10 ** 9) + nanoseconds
+
+
+class KernelTimestamps:
+    """Kernel receive (and with `tx`, send) timestamps of one socket.
+
+    Raises OSError when the kernel supports neither SO_TIMESTAMPING nor
+    SO_TIMESTAMPNS; send timestamps need SO_TIMESTAMPING, `tx` is cleared
+    when only SO_TIMESTAMPNS is available.
+    """
+
+    def __init__(self, sock, tx=False):
+        self.sock = sock
+        self.rx_delay = LatencyHistogram()  # Userspace receive time - kernel receive stamp (ns)
+        self.tx_delay = LatencyHistogram()  # Kernel send stamp - userspace send time (ns)
+        self.last_rx = None  # Kernel stamp of the last datagram received, None when it had none
+        self.sent = deque(maxlen=PENDING_LIMIT)  # (OPT_ID, key, userspace time) of sends awaiting their stamp
+        self.next_id = 0
+        self.drops = None  # utils.socket_stats.SocketDrops fed with SO_RXQ_OVFL control messages
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING, RX_FLAGS | (TX_FLAGS if tx else 0))
+            self.tx = tx
+        except OSError:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            self.tx = False
+
+    def recvfrom_into(self, buffer, flags=0):
+        """socket.recvfrom_into() through recvmsg(), keeping the kernel stamp in last_rx."""
+        nbytes, ancdata, _, address = self.sock.recvmsg_into([buffer], ANCILLARY_SIZE, flags)
+        self.last_rx = None
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind in (SO_TIMESTAMPING, SO_TIMESTAMPNS) and data:
+                self.last_rx = timespec_ns(data) # SCM_TIMESTAMPING's software stamp comes first
+            elif self.drops is not None:
+                self.drops.note_ancillary(level, kind, data)
+        return nbytes, address
+
+    def receive_time(self, time_user):
+        """Kernel stamp of the last datagram received, `time_user` when it had none."""
+        if self.last_rx is None:
+            return time_user
+        self.rx_delay.record(time_user - self.last_rx)
+        return self.last_rx
+
+    def sent_packet(self, key, time_user):
+        """Account for one send(), its kernel stamp comes back from drain_tx() as `key`."""
+        if self.tx:
+            self.sent.append((self.next_id, key, time_user))
+            self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+
+    def drain_tx(self):
+        """[(key, kernel send stamp)] of the sends stamped since the last call, never blocks."""
+        stamped = []
+        while self.sent:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(0, ANCILLARY_SIZE, MSG_ERRQUEUE | socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            time_kernel = packet_id = None
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPING:
+                    time_kernel = timespec_ns(data)
+                elif level == socket.IPPROTO_IP and kind == IP_RECVERR:
+                    error = EXTENDED_ERR.unpack_from(data)
+                    if error[1] == SO_EE_ORIGIN_TIMESTAMPING:
+                        packet_id = error[6]
+            if time_kernel is None or packet_id is None:
+                continue
+            # Stamps arrive in send order, sends without one are skipped
+            while self.sent and self.sent[0][0] != packet_id:
+                self.sent.popleft()
+            if self.sent:
+                _, key, time_user = self.sent.popleft()
+                self.tx_delay.record(time_kernel - time_user)
+                stamped.append((key, time_kernel))
+        return stamped
+
+    def summary(self):
+        """Median and p99 stack delays in ms, e.g. for an interval report."""
+        parts = [f"RX p50={self.rx_delay.quantile(50) / (10 ** 6):.3f} p99={self.rx_delay.quantile(99) / (10 ** 6):.3f}"]
+        if self.tx:
+            parts.append(f"TX p50={self.tx_delay.quantile(50) / (10 ** 6):.3f} p99={self.tx_delay.quantile(99) / (10 ** 6):.3f}")
+        return " | ".join(parts)
@@ -0,0 +1,115 @@
+import queue
+import struct
+import threading
+
+# Per-packet trace files: a 16 byte file header followed by fixed-width
+# little-endian records, so a whole trace maps straight into a NumPy
+# structured array with read_trace() however large it is. Only the readers
+# need NumPy, it is imported when a trace is first read.
+FILE_HEADER = struct.Struct("<8sII")  # magic, version, record size
+TRACE_MAGIC = b"UDPTRACE"
+TRACE_VERSION = 1
+
+# seq, client send time, server time, client receive time (ns, 0 = never), size, direction
+RECORD = struct.Struct("<QqqqIB3x")
+RECORD_FIELDS = [("seq", "<u8"), ("time_sent", "<i8"), ("time_server", "<i8"),
+                 ("time_rec", "<i8"), ("size", "<u4"), ("direction", "u1"), ("pad", "V3")]
+
+DIRECTION_ECHO = 0  # Reply matched to one of our packets: client -> server -> client
+DIRECTION_DOWNLOAD = 1  # Datagram streamed by the server, time_sent is unknown (0)
+DIRECTION_EXPIRED = 2  # Packet whose reply never arrived, time_rec is 0
+
+CHUNK_RECORDS = 16384  # Records buffered before a chunk is handed to the writer thread
+
+
+class TraceWriter:
+    """Append per-packet records to a trace file without blocking the sender.
+
+    record() only packs into a preallocated chunk; full chunks go through a
+    queue to a background thread that does the file I/O.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+        self.chunk = bytearray(CHUNK_RECORDS * RECORD.size)
+        self.offset = 0
+        self.records = 0
+        self.chunks = queue.Queue()
+        self.thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self.thread.start()
+
+    def record(self, seq, time_sent, time_server, time_rec, size, direction):
+        RECORD.pack_into(self.chunk, self.offset, seq, time_sent, time_server, time_rec, size, direction)
+        self.offset += RECORD.size
+        self.records += 1
+        if self.offset == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        if self.offset:
+            self.chunks.put(bytes(self.chunk[:self.offset]))
+            self.offset = 0
+
+    def close(self):
+        """Flush the remaining records and wait for the writer thread."""
+        self.flush()
+        self.chunks.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            self.file.write(chunk)
+
+
+def read_trace(path):
+    """Memory-map a trace file as a structured array with RECORD_FIELDS."""
+    import numpy as np
+    record_dtype = np.dtype(RECORD_FIELDS)
+    assert record_dtype.itemsize == RECORD.size
+    with open(path, "rb") as trace_file:
+        magic, version, record_size = FILE_HEADER.unpack(trace_file.read(FILE_HEADER.size))
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace file")
+    try:
+        return np.memmap(path, dtype=record_dtype, mode="r", offset=FILE_HEADER.size)
+    except ValueError:
+        return np.zeros(0, dtype=record_dtype) # Header only, no records
+
+
+def summarize_trace(records, interval=1.0):
+    """Bin a trace into per-interval series named like udp_client.results_log.
+
+    Throughput counts the bytes received in each interval (MBps), delays are
+    interval means in ms and loss is the share of expired packets.
+    """
+    import numpy as np
+    if not len(records):
+        return {"Time": np.zeros(0)}
+    direction = records["direction"]
+    start = np.min(np.where(records["time_sent"] > 0, records["time_sent"], records["time_server"]))
+    times = np.where(records["time_rec"] > 0, records["time_rec"], records["time_sent"])
+    bins = ((times - start) // int(interval * (10 ** 9))).astype(np.int64)
+    count = int(bins.max()) + 1
+
+    def per_interval(mask, weights=None):
+        return np.bincount(bins[mask], weights=weights, minlength=count)
+
+    received = direction != DIRECTION_EXPIRED
+    echoed = direction == DIRECTION_ECHO
+    packets = per_interval(received)
+    echoes = np.maximum(per_interval(echoed), 1)
+    expired = per_interval(direction == DIRECTION_EXPIRED)
+    echo, reply = records[echoed], records[received]
+    return {"Time": (np.arange(count) + 1) * interval,
+            "Throughput": per_interval(received, reply["size"].astype(np.float64)) / (1024 ** 2) / interval,
+            "OWD Server": per_interval(echoed, (echo["time_server"] - echo["time_sent"]) / (10 ** 6)) / echoes,
+            "OWD Client": per_interval(received, (reply["time_rec"] - reply["time_server"]) / (10 ** 6)) /
+                          np.maximum(packets, 1),
+            "RTT": per_interval(echoed, (echo["time_rec"] - echo["time_sent"]) / (10 ** 6)) / echoes,
+            "Loss %": 100 * expired / np.maximum(packets + expired, 1)}